@@ -251,7 +251,7 @@ class GeneralTestsOptimizer(OptimizedBuildTarget):
     changed_files = change_info.find_changed_files()
 
     test_mappings = test_mapping_module_retriever.GetTestMappings(
-        changed_files, set()
+        changed_files, set(), self._get_test_mapping_index(changed_files)
     )
 
     modules_to_build = set(self._REQUIRED_MODULES)
@@ -264,6 +264,32 @@ class GeneralTestsOptimizer(OptimizedBuildTarget):
 
     return modules_to_build
 
+  def _get_test_mapping_index(
+      self, changed_files: set[str]
+  ) -> test_mapping_module_retriever.TestMappingIndex:
+    """Index the TEST_MAPPING files of test_mappings.zip if it was built.
+
+    The zip is from an earlier build, so the changed TEST_MAPPING files are
+    still read from the source tree. Falls back to reading TEST_MAPPING files
+    from the source tree as they are looked up.
+    """
+    dist_dir = os.environ.get('DIST_DIR')
+    if dist_dir:
+      test_mappings_zip = pathlib.Path(dist_dir) / 'test_mappings.zip'
+      if test_mappings_zip.is_file():
+        logging.info(f'Using TEST_MAPPING files in {test_mappings_zip}.')
+        return test_mapping_module_retriever.TestMappingIndex.FromZip(
+            str(test_mappings_zip),
+            os.getcwd(),
+            {
+                os.path.dirname(changed_file)
+                for changed_file in changed_files
+                if os.path.basename(changed_file)
+                == test_mapping_module_retriever.TEST_MAPPING
+            },
+        )
+    return test_mapping_module_retriever.TestMappingIndex(os.getcwd())
+
   def get_package_outputs_commands_impl(self):
     src_top = pathlib.Path(os.environ.get('TOP', os.getcwd()))
     dist_dir = pathlib.Path(os.environ.get('DIST_DIR'))
@@ -23,6 +23,7 @@ import subprocess
 import textwrap
 import unittest
 from unittest import mock
+import zipfile
 from build_context import BuildContext
 import optimized_targets
 from pyfakefs import fake_filesystem_unittest
@@ -119,6 +120,62 @@ class GeneralTestsOptimizerTest(fake_filesystem_unittest.TestCase):
 
     self.assertSetEqual(build_targets, expected_build_targets)
 
+  def test_test_mappings_zip_used(self):
+    with open(self.change_info_file, 'w') as f:
+      json.dump(
+          {
+              'changes': [{
+                  'projectPath': 'project/path',
+                  'revisions': [{
+                      'fileInfos': [{'path': 'file/path/file_name'}],
+                  }],
+              }]
+          },
+          f,
+      )
+    with zipfile.ZipFile(self._dist_dir / 'test_mappings.zip', 'w') as zf:
+      zf.writestr(
+          'project/path/file/path/TEST_MAPPING',
+          json.dumps({'test-mapping-group': [{'name': 'zip_module'}]}),
+      )
+    optimizer = self._create_general_tests_optimizer()
+
+    build_targets = optimizer.get_build_targets()
+
+    expected_build_targets = set(
+        optimized_targets.GeneralTestsOptimizer._REQUIRED_MODULES
+    )
+    expected_build_targets.add('zip_module')
+    self.assertSetEqual(build_targets, expected_build_targets)
+
+  def test_changed_test_mapping_read_from_source_tree(self):
+    with open(self.change_info_file, 'w') as f:
+      json.dump(
+          {
+              'changes': [{
+                  'projectPath': 'project/path',
+                  'revisions': [{
+                      'fileInfos': [{'path': 'file/path/TEST_MAPPING'}],
+                  }],
+              }]
+          },
+          f,
+      )
+    with zipfile.ZipFile(self._dist_dir / 'test_mappings.zip', 'w') as zf:
+      zf.writestr(
+          'project/path/file/path/TEST_MAPPING',
+          json.dumps({'test-mapping-group': [{'name': 'zip_module'}]}),
+      )
+    optimizer = self._create_general_tests_optimizer()
+
+    build_targets = optimizer.get_build_targets()
+
+    expected_build_targets = set(
+        optimized_targets.GeneralTestsOptimizer._REQUIRED_MODULES
+    )
+    expected_build_targets.add('test_mapping_module')
+    self.assertSetEqual(build_targets, expected_build_targets)
+
   def test_no_change_info_no_optimization(self):
     del os.environ['CHANGE_INFO']
 
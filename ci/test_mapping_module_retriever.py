@@ -20,10 +20,12 @@ TODO(lucafarsi): Deduplicate from artifact_helper.py
 # TODO(lucafarsi): Share this logic with the original logic in
 # test_mapping_test_retriever.py
 
+import functools
 import json
 import os
 import re
 from typing import Any
+import zipfile
 
 # Regex to extra test name from the path of test config file.
 TEST_NAME_REGEX = r'(?:^|.*/)([^/]+)\.config'
@@ -54,8 +56,123 @@ def FilterComments(test_mapping_file: str) -> str:
   """
   return re.sub(_COMMENTS_RE, r'\1', test_mapping_file)
 
+
+def _ReadTestMapping(root: str, path: str) -> str | None:
+  """Read the TEST_MAPPING file in path of a source tree, or return None."""
+  try:
+    with open(os.path.join(root, path, TEST_MAPPING), 'r') as test_mapping_file:
+      return test_mapping_file.read()
+  except (FileNotFoundError, NotADirectoryError):
+    # TEST_MAPPING file doesn't exist in path
+    return None
+
+
+class TestMappingIndex:
+  """Parsed TEST_MAPPING files indexed by the directory containing them.
+
+  The index is either loaded at once from the `test_mappings.zip` build
+  artifact, or filled from the source tree as directories are looked up. Each
+  TEST_MAPPING file is read and parsed at most once, when its directory is
+  first looked up, and the paths it imports are resolved when it is parsed.
+  """
+
+  def __init__(self, root: str | None = None):
+    """Create an index of the TEST_MAPPING files of a source tree.
+
+    Args:
+      root: Root of the source tree to read TEST_MAPPING files from, or None
+        for an index that only contains the added TEST_MAPPING files.
+    """
+    self._root = root
+    # Maps a directory to the content of its TEST_MAPPING file, until the
+    # directory is looked up.
+    self._contents: dict[str, str] = {}
+    # Maps a directory to its parsed TEST_MAPPING file and the paths it
+    # imports, or to None if the directory has no TEST_MAPPING file.
+    self._entries: dict[str, tuple[dict[str, Any], frozenset[str]] | None] = {}
+
+  @classmethod
+  def FromZip(
+      cls,
+      zip_path: str,
+      root: str | None = None,
+      source_paths: set[str] = frozenset(),
+  ) -> 'TestMappingIndex':
+    """Create an index of all TEST_MAPPING files in a test_mappings.zip.
+
+    Args:
+      zip_path: Path to the test_mappings.zip.
+      root: Root of the source tree to read the TEST_MAPPING files in
+        source_paths from.
+      source_paths: Directories to read the TEST_MAPPING file of from the
+        source tree instead of the zip, e.g. the ones of changed TEST_MAPPING
+        files, which the zip of an earlier build doesn't have.
+    """
+    index = cls()
+    with zipfile.ZipFile(zip_path) as zip_file:
+      for name in zip_file.namelist():
+        path = os.path.dirname(name)
+        if os.path.basename(name) == TEST_MAPPING and path not in source_paths:
+          index.Add(path, zip_file.read(name).decode())
+    for path in source_paths:
+      content = _ReadTestMapping(root, path)
+      if content is not None:
+        index.Add(path, content)
+    return index
+
+  def Add(self, path: str, content: str):
+    """Add the content of the TEST_MAPPING file in path.
+
+    The content is parsed when path is looked up, so that a malformed
+    TEST_MAPPING file only fails the lookups that need it.
+    """
+    self._contents[path] = content
+    self._entries.pop(path, None)
+
+  def Get(self, path: str) -> tuple[dict[str, Any], frozenset[str]] | None:
+    """Get the TEST_MAPPING file in path and the paths it imports.
+
+    Returns:
+      A tuple of the parsed TEST_MAPPING file and the set of paths it imports,
+      or None if path has no TEST_MAPPING file.
+    """
+    if path not in self._entries:
+      content = self._contents.get(path)
+      if content is None and self._root is not None:
+        content = _ReadTestMapping(self._root, path)
+      self._entries[path] = (
+          None if content is None else self._Parse(path, content)
+      )
+      self._contents.pop(path, None)
+    return self._entries[path]
+
+  @staticmethod
+  def _Parse(
+      path: str, content: str
+  ) -> tuple[dict[str, Any], frozenset[str]]:
+    """Parse the TEST_MAPPING file in path and resolve the paths it imports."""
+    test_mapping = json.loads(FilterComments(content))
+
+    import_paths = set()
+    try:
+      for import_detail in test_mapping.get(KEY_IMPORTS, []):
+        import_path = import_detail[KEY_IMPORT_PATH]
+        # Try the import path as absolute path.
+        import_paths.add(import_path)
+        # Try the import path as relative path based on the test mapping file
+        # containing the import.
+        import_paths.add(os.path.normpath(os.path.join(path, import_path)))
+    except KeyError:
+      # Malformed imports are ignored.
+      import_paths = set()
+
+    return test_mapping, frozenset(import_paths)
+
+
 def GetTestMappings(paths: set[str],
-                    checked_paths: set[str]) -> dict[str, dict[str, Any]]:
+                    checked_paths: set[str],
+                    index: TestMappingIndex | None = None,
+                    ) -> dict[str, dict[str, Any]]:
   """Get the affected TEST_MAPPING files.
 
   TEST_MAPPING files in source code are packaged into a build artifact
@@ -79,11 +196,16 @@ def GetTestMappings(paths: set[str],
     checked_paths: A set of paths that have been checked for TEST_MAPPING file
       already. The set is updated after processing each TEST_MAPPING file. It's
       used to prevent infinite loop when the method is called recursively.
+    index: The TestMappingIndex to look up TEST_MAPPING files in. Defaults to
+      an index of the source tree in the current directory.
 
   Returns:
     A dictionary of Test Mapping containing the content of the affected
       TEST_MAPPING files, indexed by the path containing the TEST_MAPPING file.
   """
+  if index is None:
+    index = TestMappingIndex(os.getcwd())
+
   test_mappings = {}
 
   # Search for TEST_MAPPING files in each modified path and its parent
@@ -91,38 +213,24 @@ def GetTestMappings(paths: set[str],
   all_paths = set()
   for path in paths:
     dir_names = path.split(os.path.sep)
-    all_paths |= set(
-        [os.path.sep.join(dir_names[:i + 1]) for i in range(len(dir_names))])
+    all_paths.update(
+        os.path.sep.join(dir_names[:i + 1]) for i in range(len(dir_names)))
   # Add root directory to the paths to search for TEST_MAPPING file.
   all_paths.add('')
 
   all_paths.difference_update(checked_paths)
   checked_paths |= all_paths
-  # Try to load TEST_MAPPING file in each possible path.
+  # Look up the TEST_MAPPING file in each possible path.
   for path in all_paths:
-    try:
-      test_mapping_file = os.path.join(os.path.join(os.getcwd(), path), 'TEST_MAPPING')
-      # Read content of TEST_MAPPING file.
-      content = FilterComments(open(test_mapping_file, "r").read())
-      test_mapping = json.loads(content)
-      test_mappings[path] = test_mapping
+    entry = index.Get(path)
+    if entry is None:
+      continue
+    test_mapping, import_paths = entry
+    test_mappings[path] = test_mapping
 
-      import_paths = set()
-      for import_detail in test_mapping.get(KEY_IMPORTS, []):
-        import_path = import_detail[KEY_IMPORT_PATH]
-        # Try the import path as absolute path.
-        import_paths.add(import_path)
-        # Try the import path as relative path based on the test mapping file
-        # containing the import.
-        norm_import_path = os.path.normpath(os.path.join(path, import_path))
-        import_paths.add(norm_import_path)
-      import_paths.difference_update(checked_paths)
-      if import_paths:
-        import_test_mappings = GetTestMappings(import_paths, checked_paths)
-        test_mappings.update(import_test_mappings)
-    except (KeyError, FileNotFoundError, NotADirectoryError):
-      # TEST_MAPPING file doesn't exist in path
-      pass
+    import_paths = import_paths - checked_paths
+    if import_paths:
+      test_mappings.update(GetTestMappings(import_paths, checked_paths, index))
 
   return test_mappings
 
@@ -172,16 +280,25 @@ def FindAffectedModules(
           modules.add(module_name)
           continue
 
-        if matches_file_patterns(file_patterns, changed_files):
+        if MatchesFilePatterns(file_patterns, changed_files):
           modules.add(module_name)
 
   return modules
 
+
+@functools.lru_cache(maxsize=None)
+def _CompileFilePattern(pattern: str) -> re.Pattern[str]:
+  return re.compile(pattern)
+
+
 def MatchesFilePatterns(
     file_patterns: list[set], changed_files: set[str]
 ) -> bool:
   """Checks if any of the changed files match any of the file patterns.
 
+  Each pattern is searched in each changed file separately, the patterns are
+  compiled once for all the TEST_MAPPING entries.
+
   Args:
     file_patterns: A list of file patterns to match against.
     changed_files: A set of files to check against the file patterns.
@@ -189,4 +306,9 @@ def MatchesFilePatterns(
   Returns:
     True if any of the changed files match any of the file patterns.
   """
-  return any(re.search(pattern, "|".join(changed_files)) for pattern in file_patterns)
+  compiled_patterns = [_CompileFilePattern(p) for p in file_patterns]
+  return any(
+      pattern.search(changed_file)
+      for pattern in compiled_patterns
+      for changed_file in changed_files
+  )
@@ -0,0 +1,192 @@
+# Copyright 2026, The Android Open Source Project
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for test_mapping_module_retriever.py"""
+
+import json
+import os
+import pathlib
+import unittest
+from unittest import mock
+import zipfile
+from pyfakefs import fake_filesystem_unittest
+import test_mapping_module_retriever
+
+
+class GetTestMappingsTest(fake_filesystem_unittest.TestCase):
+
+  def setUp(self):
+    self.setUpPyfakefs()
+    self.src_top = pathlib.Path('/src')
+    self.src_top.mkdir()
+    os.chdir(self.src_top)
+
+    self._write_test_mapping(
+        '',
+        '{"presubmit": [{"name": "root_test"}]}',
+    )
+    self._write_test_mapping(
+        'project/lib',
+        """{
+          // Tests of the library.
+          "presubmit": [{"name": "lib_test"}],
+          "imports": [{"path": "../../other"}]
+        }""",
+    )
+    self._write_test_mapping(
+        'other',
+        '{"postsubmit": [{"name": "other_test"}],'
+        ' "imports": [{"path": "project/lib"}]}',
+    )
+    self._write_test_mapping(
+        'unrelated',
+        '{"presubmit": [{"name": "unrelated_test"}]}',
+    )
+
+  def _write_test_mapping(self, path: str, content: str):
+    test_mapping_dir = self.src_top / path
+    test_mapping_dir.mkdir(parents=True, exist_ok=True)
+    (test_mapping_dir / 'TEST_MAPPING').write_text(content)
+
+  def _write_test_mappings_zip(self) -> str:
+    zip_path = '/out/dist/test_mappings.zip'
+    os.makedirs(os.path.dirname(zip_path))
+    with zipfile.ZipFile(zip_path, 'w') as zip_file:
+      for test_mapping in self.src_top.rglob('TEST_MAPPING'):
+        zip_file.write(test_mapping, test_mapping.relative_to(self.src_top))
+    return zip_path
+
+  def test_parent_and_imported_test_mappings_found(self):
+    test_mappings = test_mapping_module_retriever.GetTestMappings(
+        {'project/lib/src/file.cc'}, set()
+    )
+
+    self.assertEqual(test_mappings.keys(), {'', 'project/lib', 'other'})
+    self.assertEqual(
+        test_mappings['project/lib']['presubmit'], [{'name': 'lib_test'}]
+    )
+
+  def test_zip_index_same_as_source_tree(self):
+    index = test_mapping_module_retriever.TestMappingIndex.FromZip(
+        self._write_test_mappings_zip()
+    )
+    changed_files = {'project/lib/src/file.cc', 'unrelated/file.cc'}
+
+    self.assertEqual(
+        test_mapping_module_retriever.GetTestMappings(
+            changed_files, set(), index
+        ),
+        test_mapping_module_retriever.GetTestMappings(changed_files, set()),
+    )
+
+  def test_zip_source_paths_read_from_source_tree(self):
+    zip_path = self._write_test_mappings_zip()
+    self._write_test_mapping(
+        'project/lib', '{"presubmit": [{"name": "new_lib_test"}]}'
+    )
+    os.remove(self.src_top / 'other' / 'TEST_MAPPING')
+    index = test_mapping_module_retriever.TestMappingIndex.FromZip(
+        zip_path, os.getcwd(), {'project/lib', 'other'}
+    )
+
+    test_mappings = test_mapping_module_retriever.GetTestMappings(
+        {'project/lib/src/file.cc', 'other/file.cc'}, set(), index
+    )
+
+    self.assertEqual(test_mappings.keys(), {'', 'project/lib'})
+    self.assertEqual(
+        test_mappings['project/lib']['presubmit'], [{'name': 'new_lib_test'}]
+    )
+
+  def test_zip_with_malformed_unrelated_test_mapping(self):
+    zip_path = self._write_test_mappings_zip()
+    with zipfile.ZipFile(zip_path, 'a') as zip_file:
+      zip_file.writestr('broken/TEST_MAPPING', '{"presubmit": [')
+    index = test_mapping_module_retriever.TestMappingIndex.FromZip(zip_path)
+
+    test_mappings = test_mapping_module_retriever.GetTestMappings(
+        {'project/lib/src/file.cc'}, set(), index
+    )
+
+    self.assertEqual(test_mappings.keys(), {'', 'project/lib', 'other'})
+    with self.assertRaises(json.decoder.JSONDecodeError):
+      test_mapping_module_retriever.GetTestMappings(
+          {'broken/file.cc'}, set(), index
+      )
+
+  def test_test_mapping_read_once(self):
+    index = test_mapping_module_retriever.TestMappingIndex(os.getcwd())
+
+    with mock.patch('builtins.open', wraps=open) as mock_open:
+      test_mapping_module_retriever.GetTestMappings(
+          {'project/lib/a.cc'}, set(), index
+      )
+      test_mapping_module_retriever.GetTestMappings(
+          {'project/lib/b.cc', 'project/lib/c.cc'}, set(), index
+      )
+
+    opened_test_mappings = [
+        call.args[0]
+        for call in mock_open.call_args_list
+        if call.args[0].endswith('TEST_MAPPING')
+    ]
+    self.assertEqual(
+        len(opened_test_mappings), len(set(opened_test_mappings))
+    )
+
+  def test_malformed_test_mapping_raises(self):
+    self._write_test_mapping('project/lib', '{"presubmit": [')
+
+    with self.assertRaises(json.decoder.JSONDecodeError):
+      test_mapping_module_retriever.GetTestMappings(
+          {'project/lib/file.cc'}, set()
+      )
+
+
+class FindAffectedModulesTest(unittest.TestCase):
+
+  def test_modules_filtered_by_file_patterns(self):
+    test_mappings = {
+        'project': {
+            'presubmit': [
+                {'name': 'always_test'},
+                {'name': 'java_test', 'file_patterns': [r'.*\.java$']},
+                {'name': 'cc_test', 'file_patterns': [r'.*\.cc$']},
+            ],
+            'postsubmit': [{'name': 'postsubmit_test'}],
+        }
+    }
+
+    modules = test_mapping_module_retriever.FindAffectedModules(
+        test_mappings, {'project/a.java', 'project/b.txt'}, {'presubmit'}
+    )
+
+    self.assertEqual(modules, {'always_test', 'java_test'})
+
+  def test_file_patterns_matched_per_file(self):
+    # The pattern only matches across the names of the changed files.
+    self.assertFalse(
+        test_mapping_module_retriever.MatchesFilePatterns(
+            [r'\.txt\|'], {'a.txt', 'b.txt'}
+        )
+    )
+    self.assertTrue(
+        test_mapping_module_retriever.MatchesFilePatterns(
+            [r'^dir/.*\.txt$'], {'other/a.cc', 'dir/b.txt'}
+        )
+    )
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -1940,6 +1940,7 @@ $(eval _module_path := $(strip $(sort $(ALL_MODULES.$(_module_name).PATH))))
 $(eval _soong_module_type := $(strip $(sort $(ALL_MODULES.$(_module_name).SOONG_MODULE_TYPE))))
 $(eval _dep_modules := $(filter %.$(_module_name),$(ALL_MODULES)) $(filter %.$(_module_name)$(TARGET_2ND_ARCH_MODULE_SUFFIX),$(ALL_MODULES)))
 $(eval _is_apex := $(filter %.apex,$(3)))
+$(eval _checksum_cache := $(call intermediates-dir-for,PACKAGING,sbom)/$(_path_on_device).checksum_cache.json)
 
 $(4):
 	rm -rf $$@
@@ -1952,7 +1953,8 @@ $(4):
 $(2): $(1)
 $(1): $(4) $(3) $(GEN_SBOM) $(installed_files) $(metadata_list) $(metadata_files)
 	rm -rf $$@
-	$(GEN_SBOM) --output_file $$@ --metadata $(4) --build_version $$(BUILD_FINGERPRINT_FROM_FILE) --product_mfr "$(PRODUCT_MANUFACTURER)" --json $(if $(filter %.apk,$(3)),--unbundled_apk,--unbundled_apex)
+	mkdir -p $(dir $(_checksum_cache))
+	$(GEN_SBOM) --output_file $$@ --metadata $(4) --build_version $$(BUILD_FINGERPRINT_FROM_FILE) --product_mfr "$(PRODUCT_MANUFACTURER)" --json $(if $(filter %.apk,$(3)),--unbundled_apk,--unbundled_apex) --checksum_cache $(_checksum_cache)
 endef
 
 apps_only_sbom_files :=
@@ -25,6 +25,11 @@ from __future__ import print_function
 
 import argparse
 import collections
+import hashlib
+import io
+import json
+import mmap
+import multiprocessing
 import os
 import os.path
 import re
@@ -71,6 +76,49 @@ ELF = collections.namedtuple(
   ('alignments', 'dt_soname', 'dt_needed', 'imported', 'exported', 'header'))
 
 
+# ELF constants used by the native parser
+_ELFCLASS32 = 1
+_ELFCLASS64 = 2
+_ELFDATA2LSB = 1
+_ELFDATA2MSB = 2
+
+_PT_LOAD = 1
+_PT_DYNAMIC = 2
+
+_SHT_DYNAMIC = 6
+_SHT_DYNSYM = 11
+_SHT_GNU_VERDEF = 0x6ffffffd
+_SHT_GNU_VERNEED = 0x6ffffffe
+_SHT_GNU_VERSYM = 0x6fffffff
+
+_DT_NULL = 0
+_DT_NEEDED = 1
+_DT_HASH = 4
+_DT_STRTAB = 5
+_DT_SYMTAB = 6
+_DT_SONAME = 14
+_DT_GNU_HASH = 0x6ffffef5
+_DT_VERSYM = 0x6ffffff0
+_DT_VERDEF = 0x6ffffffc
+_DT_VERDEFNUM = 0x6ffffffd
+_DT_VERNEED = 0x6ffffffe
+_DT_VERNEEDNUM = 0x6fffffff
+
+_SHN_UNDEF = 0
+_STB_LOCAL = 0
+_STB_WEAK = 2
+_VER_NDX_GLOBAL = 1
+_VERSYM_VERSION = 0x7fff
+
+# Struct formats (without the byte order) of the ELF structures, per class:
+# (header after e_version, program header, section header, dynamic entry,
+#  symbol)
+_ELF_STRUCT_FMTS = {
+  _ELFCLASS32: ('IIIIHHHHHH', 'IIIIIIII', 'IIIIIIIIII', 'iI', 'IIIBBH'),
+  _ELFCLASS64: ('QQQIHHHHHH', 'IIQQQQQQ', 'IIQQQQIIQQ', 'qQ', 'IBBHQQ'),
+}
+
+
 def _get_os_name():
   """Get the host OS name."""
   if sys.platform.startswith('linux'):
@@ -173,17 +221,34 @@ class ELFParser(object):
 
 
   @classmethod
-  def open(cls, elf_file_path, llvm_readobj):
-    """Open and parse the ELF file."""
+  def open(cls, elf_file_path, llvm_readobj=None):
+    """Open and parse the ELF file.
+
+    The file is parsed in-process, unless the path to llvm-readobj is given.
+    """
     # Parse the ELF header to check the magic word.
     header = cls._read_elf_header(elf_file_path)
     if not header or header.ei_magic != _ELF_MAGIC:
       raise ELFInvalidMagicError()
 
+    if not llvm_readobj:
+      return cls._read_native(elf_file_path, header)
+
     # Run llvm-readobj and parse the output.
     return cls._read_llvm_readobj(elf_file_path, header, llvm_readobj)
 
 
+  @classmethod
+  def _read_native(cls, elf_file_path, header):
+    """Parse the ELF file with mmap and struct."""
+    with open(elf_file_path, 'rb') as elf_file:
+      with mmap.mmap(elf_file.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        try:
+          return _NativeELFReader(elf_file_path, header, buf).read()
+        except (struct.error, IndexError, UnicodeDecodeError) as e:
+          raise ELFError('malformed ELF file: {}'.format(e))
+
+
   @classmethod
   def _find_prefix(cls, pattern, lines_it):
     """Iterate `lines_it` until finding a string that starts with `pattern`."""
@@ -372,15 +437,377 @@ class ELFParser(object):
         continue
 
 
+class _NativeELFReader(object):
+  """Reads the program headers, the dynamic table, and the versioned dynamic
+  symbols of an ELF file, like `llvm-readobj --program-headers
+  --dynamic-table --dyn-symbols` does."""
+
+  def __init__(self, elf_file_path, header, buf):
+    self._path = elf_file_path
+    self._header = header
+    self._buf = buf
+
+    if header.ei_class not in _ELF_STRUCT_FMTS:
+      raise ELFError('unknown ELF class {}'.format(header.ei_class))
+    if header.ei_data == _ELFDATA2LSB:
+      endian = '<'
+    elif header.ei_data == _ELFDATA2MSB:
+      endian = '>'
+    else:
+      raise ELFError('unknown ELF data encoding {}'.format(header.ei_data))
+
+    (ehdr_fmt, phdr_fmt, shdr_fmt, dyn_fmt,
+     sym_fmt) = _ELF_STRUCT_FMTS[header.ei_class]
+    self._phdr = struct.Struct(endian + phdr_fmt)
+    self._shdr = struct.Struct(endian + shdr_fmt)
+    self._dyn = struct.Struct(endian + dyn_fmt)
+    self._sym = struct.Struct(endian + sym_fmt)
+    self._half = struct.Struct(endian + 'H')
+    self._verdef = struct.Struct(endian + 'HHHHIII')
+    self._verdaux = struct.Struct(endian + 'II')
+    self._verneed = struct.Struct(endian + 'HHIII')
+    self._vernaux = struct.Struct(endian + 'IHHII')
+    self._words = endian + 'I'
+
+    (_, self._e_phoff, self._e_shoff, _, _, self._e_phentsize,
+     self._e_phnum, self._e_shentsize, self._e_shnum,
+     _) = struct.unpack_from(endian + ehdr_fmt, buf,
+                             struct.calcsize(_ELF_HEADER_STRUCT_FMT))
+
+
+  def read(self):
+    phdrs = self._read_program_headers()
+    alignments = [p_align for p_type, _, _, _, p_align in phdrs
+                  if p_type == _PT_LOAD]
+
+    sections = self._read_section_headers()
+    tables = self._find_dynamic_tables(phdrs, sections)
+
+    dt_soname = os.path.basename(self._path)
+    dt_needed = []
+    for d_tag, d_val in tables['dynamic']:
+      if d_tag == _DT_NEEDED:
+        dt_needed.append(self._get_string(tables['strtab'], d_val))
+      elif d_tag == _DT_SONAME:
+        dt_soname = self._get_string(tables['strtab'], d_val)
+
+    imported, exported = self._read_dynamic_symbols(tables)
+    return ELF(alignments, dt_soname, dt_needed, imported, exported,
+               self._header)
+
+
+  def _read_program_headers(self):
+    """Returns the (p_type, p_offset, p_vaddr, p_filesz, p_align) tuples."""
+    phdrs = []
+    for i in range(self._e_phnum if self._e_phoff else 0):
+      fields = self._phdr.unpack_from(
+          self._buf, self._e_phoff + i * self._e_phentsize)
+      if self._header.ei_class == _ELFCLASS32:
+        p_type, p_offset, p_vaddr, _, p_filesz, _, _, p_align = fields
+      else:
+        p_type, _, p_offset, p_vaddr, _, p_filesz, _, p_align = fields
+      phdrs.append((p_type, p_offset, p_vaddr, p_filesz, p_align))
+    return phdrs
+
+
+  def _read_section_headers(self):
+    """Returns the (sh_type, sh_offset, sh_size, sh_link, sh_info) tuples."""
+    sections = []
+    for i in range(self._e_shnum if self._e_shoff else 0):
+      (_, sh_type, _, _, sh_offset, sh_size, sh_link, sh_info, _,
+       _) = self._shdr.unpack_from(
+           self._buf, self._e_shoff + i * self._e_shentsize)
+      sections.append((sh_type, sh_offset, sh_size, sh_link, sh_info))
+    return sections
+
+
+  def _find_dynamic_tables(self, phdrs, sections):
+    """Locate the dynamic table, the dynamic string and symbol tables, and the
+    symbol version tables.
+
+    Sections are used if present, otherwise the tables are found from the
+    dynamic table of the PT_DYNAMIC segment.
+    """
+    tables = {
+      'dynamic': [],
+      'strtab': None,
+      'symtab': None,
+      'num_syms': 0,
+      'versym': None,
+      'verdef': None,
+      'verdefnum': 0,
+      'verneed': None,
+      'verneednum': 0,
+    }
+
+    def section_by_type(sh_type):
+      for section in sections:
+        if section[0] == sh_type:
+          return section
+      return None
+
+    dynamic_section = section_by_type(_SHT_DYNAMIC)
+    if dynamic_section:
+      dynamic_offset, dynamic_size = dynamic_section[1], dynamic_section[2]
+    else:
+      dynamic_offset = None
+      for p_type, p_offset, _, p_filesz, _ in phdrs:
+        if p_type == _PT_DYNAMIC:
+          dynamic_offset, dynamic_size = p_offset, p_filesz
+          break
+      if dynamic_offset is None:
+        return tables
+    dynamic = tables['dynamic']
+    for offset in range(dynamic_offset, dynamic_offset + dynamic_size,
+                        self._dyn.size):
+      d_tag, d_val = self._dyn.unpack_from(self._buf, offset)
+      if d_tag == _DT_NULL:
+        break
+      dynamic.append((d_tag, d_val))
+
+    dynsym_section = section_by_type(_SHT_DYNSYM)
+    if dynsym_section:
+      _, sym_offset, sym_size, sym_link, _ = dynsym_section
+      tables['symtab'] = sym_offset
+      tables['num_syms'] = sym_size // self._sym.size
+      tables['strtab'] = sections[sym_link][1]
+      if dynamic_section:
+        # DT_NEEDED and DT_SONAME use the string table linked to .dynamic.
+        tables['strtab'] = sections[dynamic_section[3]][1]
+      versym = section_by_type(_SHT_GNU_VERSYM)
+      if versym:
+        tables['versym'] = versym[1]
+      verdef = section_by_type(_SHT_GNU_VERDEF)
+      if verdef:
+        tables['verdef'], tables['verdefnum'] = verdef[1], verdef[4]
+      verneed = section_by_type(_SHT_GNU_VERNEED)
+      if verneed:
+        tables['verneed'], tables['verneednum'] = verneed[1], verneed[4]
+      return tables
+
+    # Without sections, translate the addresses in the dynamic table.
+    load_segments = [(p_vaddr, p_offset, p_filesz)
+                     for p_type, p_offset, p_vaddr, p_filesz, _ in phdrs
+                     if p_type == _PT_LOAD]
+
+    def to_offset(vaddr):
+      for p_vaddr, p_offset, p_filesz in load_segments:
+        if p_vaddr <= vaddr < p_vaddr + p_filesz:
+          return vaddr - p_vaddr + p_offset
+      raise ELFError('address {:#x} is not in a PT_LOAD segment'.format(vaddr))
+
+    values = dict(dynamic)
+    if _DT_STRTAB in values:
+      tables['strtab'] = to_offset(values[_DT_STRTAB])
+    if _DT_SYMTAB in values:
+      tables['symtab'] = to_offset(values[_DT_SYMTAB])
+      if _DT_HASH in values:
+        # nchain is the number of symbols.
+        tables['num_syms'] = struct.unpack_from(
+            self._words, self._buf, to_offset(values[_DT_HASH]) + 4)[0]
+      elif _DT_GNU_HASH in values:
+        tables['num_syms'] = self._count_gnu_hash_symbols(
+            to_offset(values[_DT_GNU_HASH]))
+    if _DT_VERSYM in values:
+      tables['versym'] = to_offset(values[_DT_VERSYM])
+    if _DT_VERDEF in values:
+      tables['verdef'] = to_offset(values[_DT_VERDEF])
+      tables['verdefnum'] = values.get(_DT_VERDEFNUM, 0)
+    if _DT_VERNEED in values:
+      tables['verneed'] = to_offset(values[_DT_VERNEED])
+      tables['verneednum'] = values.get(_DT_VERNEEDNUM, 0)
+    return tables
+
+
+  def _count_gnu_hash_symbols(self, offset):
+    """Count the dynamic symbols from a DT_GNU_HASH table."""
+    word = struct.Struct(self._words)
+    nbuckets, symoffset, bloom_size, _ = struct.unpack_from(
+        self._words[0] + 'IIII', self._buf, offset)
+    word_size = 4 if self._header.ei_class == _ELFCLASS32 else 8
+    buckets_offset = offset + 16 + bloom_size * word_size
+    buckets = struct.unpack_from(
+        '{}{}I'.format(self._words[0], nbuckets), self._buf, buckets_offset)
+    last_sym = max(buckets) if buckets else 0
+    if last_sym < symoffset:
+      return symoffset
+    chains_offset = buckets_offset + nbuckets * 4
+    # Follow the chain of the last bucket until the end marker.
+    while not word.unpack_from(
+        self._buf, chains_offset + (last_sym - symoffset) * 4)[0] & 1:
+      last_sym += 1
+    return last_sym + 1
+
+
+  def _get_string(self, strtab, offset):
+    start = strtab + offset
+    end = self._buf.find(b'\0', start)
+    if end == -1:
+      raise ELFError('unterminated string at {:#x}'.format(start))
+    return self._buf[start:end].decode('utf-8')
+
+
+  def _read_version_names(self, tables):
+    """Map symbol version indices to version names."""
+    names = {}
+    strtab = tables['strtab']
+
+    offset = tables['verdef']
+    for _ in range(tables['verdefnum'] if offset is not None else 0):
+      (_, _, vd_ndx, vd_cnt, _, vd_aux,
+       vd_next) = self._verdef.unpack_from(self._buf, offset)
+      if vd_cnt:
+        vda_name, _ = self._verdaux.unpack_from(self._buf, offset + vd_aux)
+        names[vd_ndx] = self._get_string(strtab, vda_name)
+      if not vd_next:
+        break
+      offset += vd_next
+
+    offset = tables['verneed']
+    for _ in range(tables['verneednum'] if offset is not None else 0):
+      _, vn_cnt, _, vn_aux, vn_next = self._verneed.unpack_from(
+          self._buf, offset)
+      aux_offset = offset + vn_aux
+      for _ in range(vn_cnt):
+        _, _, vna_other, vna_name, vna_next = self._vernaux.unpack_from(
+            self._buf, aux_offset)
+        names[vna_other] = self._get_string(strtab, vna_name)
+        if not vna_next:
+          break
+        aux_offset += vna_next
+      if not vn_next:
+        break
+      offset += vn_next
+
+    return names
+
+
+  def _read_dynamic_symbols(self, tables):
+    """Collect imported and exported symbols from the dynamic symbol table."""
+    imported = collections.defaultdict(set)
+    exported = collections.defaultdict(set)
+
+    symtab = tables['symtab']
+    if symtab is None:
+      return ({}, {})
+    strtab = tables['strtab']
+    versym = tables['versym']
+    version_names = self._read_version_names(tables)
+    is_32 = self._header.ei_class == _ELFCLASS32
+
+    for i in range(tables['num_syms']):
+      fields = self._sym.unpack_from(self._buf, symtab + i * self._sym.size)
+      if is_32:
+        st_name, _, _, st_info, _, st_shndx = fields
+      else:
+        st_name, st_info, _, st_shndx, _, _ = fields
+      name = self._get_string(strtab, st_name)
+      if not name:
+        continue
+
+      version = ''
+      if versym is not None:
+        version_index = self._half.unpack_from(
+            self._buf, versym + i * 2)[0] & _VERSYM_VERSION
+        if version_index > _VER_NDX_GLOBAL:
+          version = version_names.get(version_index, '')
+
+      binding = st_info >> 4
+      if st_shndx == _SHN_UNDEF:
+        if binding != _STB_WEAK:
+          imported[name].add(version)
+      else:
+        if binding != _STB_LOCAL:
+          exported[name].add(version)
+
+    # Freeze the returned imported/exported dict.
+    return (dict(imported), dict(exported))
+
+
+class SharedLibCache(object):
+  """Persistent cache of the parsed shared libraries.
+
+  The same shared libraries are loaded by the checks of all their dependents.
+  Each of them is kept in a JSON file named after its path, and is valid as long
+  as the size and the modification time of the library don't change. The files
+  are replaced atomically, so that concurrent checks may share the cache.
+  """
+
+  def __init__(self, cache_dir):
+    self._cache_dir = cache_dir
+    os.makedirs(cache_dir, exist_ok=True)
+
+
+  def _entry_path(self, path):
+    digest = hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()
+    return os.path.join(self._cache_dir, digest + '.json')
+
+
+  def get(self, path):
+    """Return the cached ELF of `path`, or None if it is missing or stale."""
+    try:
+      st = os.stat(path)
+      with open(self._entry_path(path), 'r') as entry_file:
+        entry = json.load(entry_file)
+    except (IOError, OSError, ValueError):
+      return None
+    if (entry.get('path') != os.path.abspath(path) or
+        entry.get('size') != st.st_size or
+        entry.get('mtime_ns') != st.st_mtime_ns):
+      return None
+    try:
+      header = entry['header']
+      header['ei_magic'] = bytes.fromhex(header['ei_magic'])
+      header['ei_pad'] = bytes.fromhex(header['ei_pad'])
+      return ELF(entry['alignments'], entry['dt_soname'], entry['dt_needed'],
+                 {name: set(vers) for name, vers in entry['imported'].items()},
+                 {name: set(vers) for name, vers in entry['exported'].items()},
+                 ELFHeader(**header))
+    except (KeyError, TypeError, ValueError):
+      return None
+
+
+  def put(self, path, elf, st):
+    """Store the ELF of `path`, parsed when the file had the stat `st`."""
+    header = elf.header._asdict()
+    header['ei_magic'] = header['ei_magic'].hex()
+    header['ei_pad'] = header['ei_pad'].hex()
+    entry = {
+      'path': os.path.abspath(path),
+      'size': st.st_size,
+      'mtime_ns': st.st_mtime_ns,
+      'alignments': elf.alignments,
+      'dt_soname': elf.dt_soname,
+      'dt_needed': elf.dt_needed,
+      'imported': {name: sorted(vers) for name, vers in elf.imported.items()},
+      'exported': {name: sorted(vers) for name, vers in elf.exported.items()},
+      'header': header,
+    }
+    entry_path = self._entry_path(path)
+    tmp_path = '{}.{}.tmp'.format(entry_path, os.getpid())
+    try:
+      with open(tmp_path, 'w') as entry_file:
+        json.dump(entry, entry_file)
+      os.replace(tmp_path, entry_path)
+    except (IOError, OSError):
+      # The cache is an optimization only.
+      try:
+        os.unlink(tmp_path)
+      except OSError:
+        pass
+
+
 class Checker(object):
   """ELF file checker that checks DT_SONAME, DT_NEEDED, and symbols."""
 
-  def __init__(self, llvm_readobj):
+  def __init__(self, llvm_readobj=None, shared_lib_cache=None, output=None):
     self._file_path = ''
     self._file_under_test = None
     self._shared_libs = []
 
     self._llvm_readobj = llvm_readobj
+    self._shared_lib_cache = shared_lib_cache
+    self._output = output if output else sys.stderr
 
 
   if sys.stderr.isatty():
@@ -393,12 +820,12 @@ class Checker(object):
 
   def _error(self, *args):
     """Emit an error to stderr."""
-    print(self._file_path + ': ' + self._ERROR_TAG, *args, file=sys.stderr)
+    print(self._file_path + ': ' + self._ERROR_TAG, *args, file=self._output)
 
 
   def _note(self, *args):
     """Emit a note to stderr."""
-    print(self._file_path + ': ' + self._NOTE_TAG, *args, file=sys.stderr)
+    print(self._file_path + ': ' + self._NOTE_TAG, *args, file=self._output)
 
 
   def _load_elf_file(self, path, skip_bad_elf_magic):
@@ -430,10 +857,28 @@ class Checker(object):
       sys.exit(0)
 
 
+  def _load_shared_lib(self, path):
+    """Load a shared library, from the cache if possible."""
+    if not self._shared_lib_cache:
+      return self._load_elf_file(path, False)
+
+    elf = self._shared_lib_cache.get(path)
+    if elf:
+      return elf
+    try:
+      st = os.stat(path)
+    except OSError:
+      self._error('Failed to open "{}".'.format(path))
+      sys.exit(2)
+    elf = self._load_elf_file(path, False)
+    self._shared_lib_cache.put(path, elf, st)
+    return elf
+
+
   def load_shared_libs(self, shared_lib_paths):
     """Load shared libraries."""
     for path in shared_lib_paths:
-      self._shared_libs.append(self._load_elf_file(path, False))
+      self._shared_libs.append(self._load_shared_lib(path))
 
 
   def check_dt_soname(self, soname):
@@ -560,12 +1005,164 @@ class Checker(object):
       sys.exit(2)
 
 
+class _LoadedSharedLibs(object):
+  """In-memory cache of the shared libraries loaded by the batch mode."""
+
+  def __init__(self, elfs):
+    self._elfs = elfs
+
+
+  def get(self, path):
+    return self._elfs.get(path)
+
+
+  def put(self, path, elf, st):
+    self._elfs[path] = elf
+
+
+def check_file(checker, path, soname=None, shared_libs=(),
+               system_shared_libs=(), skip_bad_elf_magic=False,
+               skip_unknown_elf_machine=False, allow_undefined_symbols=False,
+               max_page_size=None):
+  """Run all the checks on the file at `path`. Exits on the first failure."""
+  checker.load_file_under_test(
+    path, skip_bad_elf_magic, skip_unknown_elf_machine)
+  checker.load_shared_libs(shared_libs)
+
+  if soname:
+    checker.check_dt_soname(soname)
+
+  checker.check_dt_needed(system_shared_libs)
+
+  if max_page_size:
+    checker.check_max_page_size(max_page_size)
+
+  if not allow_undefined_symbols:
+    checker.check_symbols()
+
+
+# The optional keys of a batch manifest entry, which are the keyword arguments
+# of check_file().
+_BATCH_ENTRY_KEYS = (
+  'soname',
+  'shared_libs',
+  'system_shared_libs',
+  'skip_bad_elf_magic',
+  'skip_unknown_elf_machine',
+  'allow_undefined_symbols',
+  'max_page_size',
+)
+
+
+def read_batch_manifest(manifest_path):
+  """Read the list of files to be checked by the batch mode.
+
+  The manifest is a JSON list of objects with a "file" path, and optionally
+  "soname", "shared_libs", "system_shared_libs", "max_page_size",
+  "skip_bad_elf_magic", "skip_unknown_elf_machine" and
+  "allow_undefined_symbols", which have the meaning of the command line
+  options.
+  """
+  with open(manifest_path, 'r') as manifest_file:
+    entries = json.load(manifest_file)
+  if not isinstance(entries, list):
+    raise ValueError('{}: the manifest must be a list'.format(manifest_path))
+  for entry in entries:
+    if 'file' not in entry:
+      raise ValueError('{}: missing "file" in {}'.format(manifest_path, entry))
+    unknown_keys = set(entry) - set(_BATCH_ENTRY_KEYS) - {'file'}
+    if unknown_keys:
+      raise ValueError('{}: unknown keys {} in {}'.format(
+          manifest_path, sorted(unknown_keys), entry))
+  return entries
+
+
+# The state of the batch mode worker processes.
+_batch_llvm_readobj = None
+_batch_shared_lib_cache = None
+
+
+def _init_batch_worker(llvm_readobj, shared_lib_cache):
+  global _batch_llvm_readobj, _batch_shared_lib_cache
+  _batch_llvm_readobj = llvm_readobj
+  _batch_shared_lib_cache = shared_lib_cache
+
+
+def _load_batch_shared_lib(path):
+  """Load a shared library for the batch mode.
+
+  Returns None if it fails, so that the error is reported by the checks of the
+  files that depend on it.
+  """
+  try:
+    if _batch_shared_lib_cache:
+      elf = _batch_shared_lib_cache.get(path)
+      if elf:
+        return elf
+      st = os.stat(path)
+    elf = ELFParser.open(path, _batch_llvm_readobj)
+    if _batch_shared_lib_cache:
+      _batch_shared_lib_cache.put(path, elf, st)
+    return elf
+  except Exception:  # pylint: disable=broad-except
+    return None
+
+
+def _check_batch_entry(entry):
+  """Check a batch manifest entry. Returns the exit status and the output."""
+  output = io.StringIO()
+  checker = Checker(_batch_llvm_readobj, _batch_shared_lib_cache, output)
+  kwargs = {key: entry[key] for key in _BATCH_ENTRY_KEYS if key in entry}
+  try:
+    check_file(checker, entry['file'], **kwargs)
+    status = 0
+  except SystemExit as e:
+    status = e.code
+  except Exception as e:  # pylint: disable=broad-except
+    print('{}: {} {!r}'.format(entry['file'], Checker._ERROR_TAG, e),
+          file=output)
+    status = 2
+  return (status, output.getvalue())
+
+
+def check_batch(entries, llvm_readobj=None, shared_lib_cache=None, jobs=None):
+  """Check the files of the batch manifest entries on a pool of processes.
+
+  Every distinct shared library is loaded once, then the files are checked
+  with the loaded libraries. The output of each file is written to stderr in
+  the order of the entries, as if each of them were checked by a separate
+  invocation.
+
+  Returns:
+    The exit status: 0 if all the files pass the checks, 2 otherwise.
+  """
+  shared_lib_paths = sorted({path for entry in entries
+                             for path in entry.get('shared_libs', [])})
+
+  with multiprocessing.Pool(
+      jobs, initializer=_init_batch_worker,
+      initargs=(llvm_readobj, shared_lib_cache)) as pool:
+    elfs = pool.map(_load_batch_shared_lib, shared_lib_paths, chunksize=16)
+  loaded_shared_libs = _LoadedSharedLibs(
+    {path: elf for path, elf in zip(shared_lib_paths, elfs) if elf})
+
+  exit_status = 0
+  with multiprocessing.Pool(
+      jobs, initializer=_init_batch_worker,
+      initargs=(llvm_readobj, loaded_shared_libs)) as pool:
+    for status, output in pool.imap(_check_batch_entry, entries):
+      sys.stderr.write(output)
+      if status:
+        exit_status = 2
+  return exit_status
+
+
 def _parse_args():
   """Parse command line options."""
   parser = argparse.ArgumentParser()
 
   # Input file
-  parser.add_argument('file',
+  parser.add_argument('file', nargs='?',
                       help='Path to the input file to be checked')
   parser.add_argument('--soname',
                       help='Shared object name of the input file')
@@ -589,38 +1186,57 @@ def _parse_args():
   parser.add_argument('--max-page-size', action='store', type=int,
                       help='Required page size alignment support')
 
+  # Batch mode
+  parser.add_argument('--batch',
+                      help='Path to a JSON manifest of the files to be checked '
+                      'instead of the input file')
+  parser.add_argument('-j', '--jobs', type=int,
+                      help='Number of processes checking the files of the '
+                      'batch manifest')
+
   # Other options
   parser.add_argument('--llvm-readobj',
-                      help='Path to the llvm-readobj executable')
+                      help='Path to the llvm-readobj executable, used with '
+                      '--use-llvm-readobj')
+  parser.add_argument('--use-llvm-readobj', action='store_true',
+                      help='Parse the ELF files with llvm-readobj instead of '
+                      'in-process')
+  parser.add_argument('--shared-lib-cache-dir',
+                      help='Directory to cache the parsed shared libraries in')
 
-  return parser.parse_args()
+  args = parser.parse_args()
+  if bool(args.file) == bool(args.batch):
+    parser.error('either the input file or --batch is required')
+  return args
 
 
 def main():
   """Main function"""
   args = _parse_args()
 
-  llvm_readobj = args.llvm_readobj
-  if not llvm_readobj:
-    llvm_readobj = _get_llvm_readobj()
-
-  # Load ELF files
-  checker = Checker(llvm_readobj)
-  checker.load_file_under_test(
-    args.file, args.skip_bad_elf_magic, args.skip_unknown_elf_machine)
-  checker.load_shared_libs(args.shared_lib)
-
-  # Run checks
-  if args.soname:
-    checker.check_dt_soname(args.soname)
-
-  checker.check_dt_needed(args.system_shared_lib)
-
-  if args.max_page_size:
-    checker.check_max_page_size(args.max_page_size)
-
-  if not args.allow_undefined_symbols:
-    checker.check_symbols()
+  llvm_readobj = None
+  if args.use_llvm_readobj:
+    llvm_readobj = args.llvm_readobj
+    if not llvm_readobj:
+      llvm_readobj = _get_llvm_readobj()
+
+  shared_lib_cache = None
+  if args.shared_lib_cache_dir:
+    shared_lib_cache = SharedLibCache(args.shared_lib_cache_dir)
+
+  if args.batch:
+    sys.exit(check_batch(read_batch_manifest(args.batch), llvm_readobj,
+                         shared_lib_cache, args.jobs))
+
+  checker = Checker(llvm_readobj, shared_lib_cache)
+  check_file(checker, args.file,
+             soname=args.soname,
+             shared_libs=args.shared_lib,
+             system_shared_libs=args.system_shared_lib,
+             skip_bad_elf_magic=args.skip_bad_elf_magic,
+             skip_unknown_elf_machine=args.skip_unknown_elf_machine,
+             allow_undefined_symbols=args.allow_undefined_symbols,
+             max_page_size=args.max_page_size)
 
 
 if __name__ == '__main__':
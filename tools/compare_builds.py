@@ -118,12 +118,17 @@ of the commandline flags. Here are a sampling of useful combinations.
 """
 
 import argparse
+import concurrent.futures
+import hashlib
 import itertools
+import json
+import mmap
 import os
 import shutil
 import stat
 import subprocess
 import sys
+import threading
 
 
 # Soong
@@ -203,6 +208,14 @@ def main():
       help="Make target to run. The default is droid")
   argparser.add_argument("--touch", nargs="+", default=[],
       help="Files to touch between builds. Must pair with --incremental.")
+  argparser.add_argument("--jobs", "-j", type=int,
+      help="Number of threads used to compare files. Defaults to the number of CPUs.")
+  argparser.add_argument("--hash-cache",
+      help="File that caches the hashes of the compared files, so that comparing the same"
+           + " out dirs again doesn't need to read them. Defaults to a file in out_full/."
+           + " Pass an empty string to disable it.")
+  argparser.add_argument("--json-report",
+      help="Also write the results as JSON to this file.")
   args = argparser.parse_args(sys.argv[1:])
 
   if args.detect_embedded_paths and args.incremental:
@@ -292,7 +305,13 @@ def main():
     printer.PrintList("Touched in incremental build", touched_incrementally)
   else:
     # Compare the two out dirs
-    added, removed, changed = DiffFileList(first_files, second_files)
+    hash_cache_file = args.hash_cache
+    if hash_cache_file is None:
+      hash_cache_file = dir_prefix + "/hash_cache.json"
+    hash_cache = HashCache(hash_cache_file) if hash_cache_file else None
+    added, removed, changed = DiffFileList(first_files, second_files, hash_cache, args.jobs)
+    if hash_cache is not None:
+      hash_cache.Save()
     printer.PrintList("Added", added)
     printer.PrintList("Removed", removed)
     printer.PrintList("Changed", changed, "%s %s")
@@ -311,6 +330,9 @@ def main():
   if not printer.printed_anything:
     print("No bad behaviors found.")
 
+  if args.json_report:
+    printer.WriteJsonReport(args.json_report)
+
 
 def AssertAtTop():
   """If the current directory is not the top of an android source tree, print an error
@@ -384,59 +406,73 @@ def RunBuild(work_dir, out_dir, target, hide_build_output):
     sys.exit(1)
 
 
-def DiffFileList(first_files, second_files):
+def DiffFileList(first_files, second_files, hash_cache=None, jobs=None):
   """Examines the files.
 
+  Every file is stat'ed once, and the files present in both lists are compared
+  on a pool of jobs threads.
+
   Returns:
     Filenames of files in first_filelist but not second_filelist (added files)
     Filenames of files in second_filelist but not first_filelist (removed files)
     2-Tuple of filenames for the files that are in both but are different (changed files)
   """
-  # List of files, relative to their respective PRODUCT_OUT directories
-  first_filelist = sorted([x for x in first_files], key=lambda x: x[1])
-  second_filelist = sorted([x for x in second_files], key=lambda x: x[1])
-
-  added = []
-  removed = []
-  changed = []
-
-  first_index = 0
-  second_index = 0
-
-  while first_index < len(first_filelist) and second_index < len(second_filelist):
-    # Path relative to source root and path relative to PRODUCT_OUT
-    first_full_filename, first_relative_filename = first_filelist[first_index]
-    second_full_filename, second_relative_filename = second_filelist[second_index]
-
-    if first_relative_filename < second_relative_filename:
-      # Removed
-      removed.append(first_full_filename)
-      first_index += 1
-    elif first_relative_filename > second_relative_filename:
-      # Added
-      added.append(second_full_filename)
-      second_index += 1
-    else:
-      # Both present
-      diff_type = DiffFiles(first_full_filename, second_full_filename)
-      if diff_type != DIFF_NONE:
-        changed.append((first_full_filename, second_full_filename))
-      first_index += 1
-      second_index += 1
-
-  while first_index < len(first_filelist):
-    first_full_filename, first_relative_filename = first_filelist[first_index]
-    removed.append(first_full_filename)
-    first_index += 1
-
-  while second_index < len(second_filelist):
-    second_full_filename, second_relative_filename = second_filelist[second_index]
-    added.append(second_full_filename)
-    second_index += 1
-
-  return (SortByTimestamp(added),
-          SortByTimestamp(removed),
-          SortByTimestamp(changed, key=lambda item: item[1]))
+  with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+    # List of (full, relative, stat) tuples, relative to their respective
+    # PRODUCT_OUT directories
+    first_filelist = sorted(StatFiles(executor, first_files), key=lambda x: x[1])
+    second_filelist = sorted(StatFiles(executor, second_files), key=lambda x: x[1])
+
+    added = []
+    removed = []
+    both = []
+
+    first_index = 0
+    second_index = 0
+
+    while first_index < len(first_filelist) and second_index < len(second_filelist):
+      # Path relative to source root and path relative to PRODUCT_OUT
+      first_relative_filename = first_filelist[first_index][1]
+      second_relative_filename = second_filelist[second_index][1]
+
+      if first_relative_filename < second_relative_filename:
+        # Removed
+        removed.append(first_filelist[first_index])
+        first_index += 1
+      elif first_relative_filename > second_relative_filename:
+        # Added
+        added.append(second_filelist[second_index])
+        second_index += 1
+      else:
+        # Both present
+        both.append((first_filelist[first_index], second_filelist[second_index]))
+        first_index += 1
+        second_index += 1
+
+    removed.extend(first_filelist[first_index:])
+    added.extend(second_filelist[second_index:])
+
+    def Compare(pair):
+      (first_full_filename, _, first_stat), (second_full_filename, _, second_stat) = pair
+      return DiffFiles(first_full_filename, second_full_filename, first_stat, second_stat,
+                       hash_cache)
+
+    changed = [pair for pair, diff_type in zip(both, executor.map(Compare, both))
+               if diff_type != DIFF_NONE]
+
+  def ByTimestamp(items, key=lambda item: item):
+    return sorted(items, key=lambda item: key(item)[2].st_mtime)
+
+  return ([full for full, _, _ in ByTimestamp(added)],
+          [full for full, _, _ in ByTimestamp(removed)],
+          [(first[0], second[0]) for first, second in ByTimestamp(changed, lambda item: item[1])])
+
+
+def StatFiles(executor, files):
+  """Returns a list of (full, relative, stat) tuples for the files iterator."""
+  files = list(files)
+  stats = executor.map(lambda f: os.stat(f[0], follow_symlinks=False), files)
+  return [(full, relative, st) for (full, relative), st in zip(files, stats)]
 
 
 def FindOutFilesTouchedAfter(files, timestamp):
@@ -455,16 +491,6 @@ def GetFileTimestamp(filename):
   return st.st_mtime
 
 
-def SortByTimestamp(items, key=lambda item: item):
-  """Sort the list by timestamp of files.
-  Args:
-    items - the list of items to sort
-    key - a function to extract a filename from each element in items
-  """
-  return [x[0] for x in sorted([(item, GetFileTimestamp(key(item))) for item in items],
-                               key=lambda y: y[1])]
-
-
 def FindSourceFilesTouchedAfter(timestamp):
   """Find files in the source tree that have changed after timestamp. Ignores
   the out directory."""
@@ -503,10 +529,63 @@ def TouchFile(filename):
   os.utime(filename)
 
 
-def DiffFiles(first_filename, second_filename):
+def HashFile(filename, size):
+  """Returns the hex digest of the contents of a file of the given size."""
+  h = hashlib.blake2b()
+  if size:
+    with open(filename, "rb") as f:
+      with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as contents:
+        h.update(contents)
+  return h.hexdigest()
+
+
+class HashCache(object):
+  """Content hashes of files, optionally persisted in a JSON file.
+
+  An entry is only used while the size, mtime and inode of its file are
+  unchanged, so repeated comparisons of the same out dirs don't need to read
+  the files again.
+  """
+  def __init__(self, filename=None):
+    self._filename = filename
+    self._entries = {}
+    self._lock = threading.Lock()
+    self._modified = False
+    if filename:
+      try:
+        with open(filename) as f:
+          self._entries = json.load(f)
+      except (FileNotFoundError, ValueError):
+        pass
+
+  def GetHash(self, filename, st):
+    key = [st.st_size, st.st_mtime_ns, st.st_ino]
+    entry = self._entries.get(filename)
+    if entry and entry[:3] == key:
+      return entry[3]
+    digest = HashFile(filename, st.st_size)
+    with self._lock:
+      self._entries[filename] = key + [digest]
+      self._modified = True
+    return digest
+
+  def Save(self):
+    if not self._filename or not self._modified:
+      return
+    dirname = os.path.dirname(self._filename)
+    if dirname:
+      os.makedirs(dirname, exist_ok=True)
+    tmp_filename = self._filename + ".tmp"
+    with open(tmp_filename, "w") as f:
+      json.dump(self._entries, f)
+    os.replace(tmp_filename, self._filename)
+
+
+def DiffFiles(first_filename, second_filename, first_stat=None, second_stat=None,
+              hash_cache=None):
   def AreFileContentsSame(remaining, first_filename, second_filename):
     """Compare the file contents. They must be known to be the same size."""
-    CHUNK_SIZE = 32*1024
+    CHUNK_SIZE = 1024*1024
     with open(first_filename, "rb") as first_file:
       with open(second_filename, "rb") as second_file:
         while remaining > 0:
@@ -516,8 +595,10 @@ def DiffFiles(first_filename, second_filename):
           remaining -= size
         return True
 
-  first_stat = os.stat(first_filename, follow_symlinks=False)
-  second_stat = os.stat(first_filename, follow_symlinks=False)
+  if first_stat is None:
+    first_stat = os.stat(first_filename, follow_symlinks=False)
+  if second_stat is None:
+    second_stat = os.stat(second_filename, follow_symlinks=False)
 
   # Mode bits
   if first_stat.st_mode != second_stat.st_mode:
@@ -532,7 +613,11 @@ def DiffFiles(first_filename, second_filename):
     if os.readlink(first_filename) != os.readlink(second_filename):
       return DIFF_SYMLINK
   elif stat.S_ISREG(first_stat.st_mode):
-    if not AreFileContentsSame(first_stat.st_size, first_filename, second_filename):
+    if hash_cache is not None:
+      if (hash_cache.GetHash(first_filename, first_stat)
+          != hash_cache.GetHash(second_filename, second_stat)):
+        return DIFF_CONTENTS
+    elif not AreFileContentsSame(first_stat.st_size, first_filename, second_filename):
       return DIFF_CONTENTS
 
   return DIFF_NONE
@@ -640,6 +725,7 @@ def RemoveItemsFromList(haystack, needles):
 class Printer(object):
   def __init__(self):
     self.printed_anything = False
+    self.sections = []
 
   def PrintList(self, title, items, fmt="%s"):
     if items:
@@ -649,6 +735,13 @@ class Printer(object):
       for item in items:
         sys.stdout.write("  %s\n" % fmt % item)
       self.printed_anything = True
+    self.sections.append({"title": title, "items": items})
+
+  def WriteJsonReport(self, filename):
+    """Writes the lists printed so far as JSON, including the empty ones."""
+    with open(filename, "w") as f:
+      json.dump(self.sections, f, indent=2)
+      f.write("\n")
 
 
 if __name__ == "__main__":
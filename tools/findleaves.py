@@ -20,51 +20,179 @@
 # the search in a given subdirectory when the file is found.
 #
 
+import concurrent.futures
+import json
 import os
 import sys
+import threading
+import time
 
-def perform_find(mindepth, prune, dirlist, filenames):
+# Directories modified less than this many seconds before the scan are not
+# cached, since further changes within the same mtime tick wouldn't be noticed.
+RACY_MTIME_SECONDS = 2
+
+class DirLister(object):
+  """Lists directories, caching the listings in memory and optionally on disk.
+
+  A listing is the tuple (found, dirs). found is the list of the requested
+  filenames present in the directory. dirs is the list of (name, key, is_link)
+  tuples of its subdirectories, following symlinks, in the order os.scandir
+  returns them. key is the (st_dev, st_ino) of the subdirectory.
+
+  With a cache file, the listing of a directory whose mtime hasn't changed
+  since the previous invocation is reused without reading the directory.
+  """
+
+  def __init__(self, filenames, cache_file=None):
+    self._filenames = filenames
+    self._cache_file = cache_file
+    self._listings = {}
+    self._cached_listings = {}
+    self._lock = threading.Lock()
+    self._racy_mtime_ns = (time.time() - RACY_MTIME_SECONDS) * 1e9
+    if cache_file:
+      try:
+        with open(cache_file) as f:
+          cache = json.load(f)
+        if cache.get("filenames") == filenames:
+          self._cached_listings = cache["dirs"]
+      except (OSError, ValueError, KeyError, AttributeError):
+        pass
+
+  def list(self, path):
+    """Returns the listing of path, or None if it can't be read."""
+    listing = self._listings.get(path)
+    if listing is None:
+      listing = self._read(path)
+      with self._lock:
+        self._listings[path] = listing
+    return listing[1:] if listing else None
+
+  def _read(self, path):
+    try:
+      mtime_ns = os.stat(path).st_mtime_ns
+    except OSError:
+      return None
+    if mtime_ns >= self._racy_mtime_ns:
+      mtime_ns = None
+    else:
+      cached = self._cached_listings.get(path)
+      if cached and cached[0] == mtime_ns:
+        return [mtime_ns, cached[1],
+                [(name, tuple(key), is_link) for name, key, is_link in cached[2]]]
+
+    found = []
+    dirs = []
+    try:
+      with os.scandir(path) as it:
+        for entry in it:
+          # Same as os.walk(followlinks=True): anything that isn't a
+          # directory, including broken symlinks, is a file.
+          if entry.is_dir():
+            try:
+              st = entry.stat()
+            except OSError:
+              continue
+            dirs.append((entry.name, (st.st_dev, st.st_ino), entry.is_symlink()))
+          elif entry.name in self._filenames:
+            found.append(entry.name)
+    except OSError:
+      return None
+    return [mtime_ns, found, dirs]
+
+  def save(self):
+    if not self._cache_file:
+      return
+    dirs = {path: listing for path, listing in self._listings.items()
+            if listing and listing[0] is not None}
+    tmp_file = self._cache_file + ".tmp"
+    with open(tmp_file, "w") as f:
+      json.dump({"filenames": self._filenames, "dirs": dirs}, f)
+    os.replace(tmp_file, self._cache_file)
+
+def prefetch(lister, mindepth, prune, rootdir, jobs=None):
+  """Lists the directories under rootdir ahead of perform_find, in parallel.
+
+  Each top-level directory is walked on its own thread, pruned the same way as
+  perform_find, but without following symlinks.
+  """
+  rootdepth = rootdir.count("/")
+
+  def walk(top):
+    stack = [top]
+    while stack:
+      root = stack.pop()
+      listing = lister.list(root)
+      if listing is None:
+        continue
+      found, dirs = listing
+      if found and 1 + root.count("/") - rootdepth >= mindepth:
+        continue
+      for name, _, is_link in dirs:
+        if name not in prune and not is_link:
+          stack.append(os.path.join(root, name))
+
+  listing = lister.list(rootdir)
+  if listing is None:
+    return
+  with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+    futures = [executor.submit(walk, os.path.join(rootdir, name))
+               for name, _, is_link in listing[1]
+               if name not in prune and not is_link]
+    for future in futures:
+      future.result()
+
+def perform_find(mindepth, prune, dirlist, filenames, jobs=None, cache_file=None):
   result = []
   pruneleaves = set(map(lambda x: os.path.split(x)[1], prune))
   seen = set()
+  lister = DirLister(filenames, cache_file)
+  for rootdir in dirlist:
+    prefetch(lister, mindepth, prune, rootdir, jobs)
+
+  # Walk the listings in the same order as os.walk(followlinks=True), so that
+  # the same paths are kept when a directory is reachable through symlinks.
   for rootdir in dirlist:
     rootdepth = rootdir.count("/")
-    for root, dirs, files in os.walk(rootdir, followlinks=True):
+    stack = [rootdir]
+    while stack:
+      root = stack.pop()
+      listing = lister.list(root)
+      if listing is None:
+        continue
+      found, dirs = listing[0], list(listing[1])
       # prune
       check_prune = False
-      for d in dirs:
+      for d, _, _ in dirs:
         if d in pruneleaves:
           check_prune = True
           break
       if check_prune:
-        i = 0
-        while i < len(dirs):
-          if dirs[i] in prune:
-            del dirs[i]
-          else:
-            i += 1
+        dirs = [entry for entry in dirs if entry[0] not in prune]
       # mindepth
+      skip = False
       if mindepth > 0:
         depth = 1 + root.count("/") - rootdepth
         if depth < mindepth:
-          continue
-      # match
-      for filename in filenames:
-        if filename in files:
-          result.append(os.path.join(root, filename))
-          del dirs[:]
-
-      # filter out inodes that have already been seen due to symlink loops
-      i = 0
-      while i < len(dirs):
-        st = os.stat(os.path.join(root, dirs[i]))
-        key = (st.st_dev, st.st_ino)
-        if key in seen:
-          del dirs[i]
-        else:
-          i += 1
-          seen.add(key)
+          skip = True
+      if not skip:
+        # match
+        for filename in filenames:
+          if filename in found:
+            result.append(os.path.join(root, filename))
+            dirs = []
 
+        # filter out inodes that have already been seen due to symlink loops
+        unseen = []
+        for entry in dirs:
+          key = entry[1]
+          if key not in seen:
+            unseen.append(entry)
+            seen.add(key)
+        dirs = unseen
+      stack.extend(os.path.join(root, entry[0]) for entry in reversed(dirs))
+
+  lister.save()
   return result
 
 def usage():
@@ -79,6 +207,13 @@ Options:
        Add a directory to search.  May be repeated multiple times.  For backwards
        compatibility, if no --dir argument is provided then all but the last entry
        in <filenames> are treated as directories.
+   --jobs=<jobs>
+       Number of threads listing the directories. Defaults to the number of
+       CPUs.
+   --cache=<file>
+       Cache the directory listings in <file>, so that directories that haven't
+       been modified since the previous run with the same <filenames> aren't
+       read again.
 """ % {
       "progName": os.path.split(sys.argv[0])[1],
     })
@@ -88,6 +223,8 @@ def main(argv):
   mindepth = -1
   prune = []
   dirlist = []
+  jobs = None
+  cache_file = None
   i=1
   while i<len(argv) and len(argv[i])>2 and argv[i][0:2] == "--":
     arg = argv[i]
@@ -106,6 +243,15 @@ def main(argv):
       if len(d) == 0:
         usage()
       dirlist.append(d)
+    elif arg.startswith("--jobs="):
+      try:
+        jobs = int(arg[len("--jobs="):])
+      except ValueError:
+        usage()
+    elif arg.startswith("--cache="):
+      cache_file = arg[len("--cache="):]
+      if len(cache_file) == 0:
+        usage()
     else:
       usage()
     i += 1
@@ -118,7 +264,8 @@ def main(argv):
     if len(argv)-i < 1: # need <filename>
       usage()
     filenames = argv[i:]
-  results = list(set(perform_find(mindepth, prune, dirlist, filenames)))
+  results = list(set(perform_find(mindepth, prune, dirlist, filenames, jobs,
+                                  cache_file)))
   results.sort()
   for r in results:
     print(r)
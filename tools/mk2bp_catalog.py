@@ -10,8 +10,10 @@ import argparse
 import csv
 import itertools
 import json
+import multiprocessing
 import os
 import re
+import sqlite3
 import sys
 
 DIRECTORY_PATTERNS = [x.split("/") for x in (
@@ -119,21 +121,104 @@ class Summary(object):
     self.makefiles[makefile.filename] = makefile
     self.directories.setdefault(directory_group(makefile.filename), []).append(makefile)
 
+# Bump when ANALYZERS change, to invalidate the cached analyses.
+ANALYZERS_VERSION = 1
+
+def analyze_makefile(filename):
+  """Run the ANALYZERS over the file.
+
+  Returns the line matches of each analyzer, in the order of ANALYZERS, or None
+  for the analyzers that didn't match."""
+  with open(filename, "r", errors="ignore") as f:
+    try:
+      lines = f.readlines()
+    except UnicodeDecodeError as ex:
+      sys.stderr.write("Filename: %s\n" % filename)
+      raise ex
+  lines = [line.strip() for line in lines]
+
+  results = []
+  for analyzer in ANALYZERS:
+    analysis = analyze_lines(filename, lines, analyzer.func)
+    results.append(analysis.line_matches if analysis else None)
+  return results
+
 class Makefile(object):
-  def __init__(self, filename):
+  def __init__(self, filename, line_matches=None):
+    """line_matches is the result of analyze_makefile(filename), which is
+    called if it isn't given."""
     self.filename = filename
 
     # Analyze the file
-    with open(filename, "r", errors="ignore") as f:
-      try:
-        lines = f.readlines()
-      except UnicodeDecodeError as ex:
-        sys.stderr.write("Filename: %s\n" % filename)
-        raise ex
-    lines = [line.strip() for line in lines]
-
-    self.analyses = dict([(analyzer, analyze_lines(filename, lines, analyzer.func)) for analyzer
-        in ANALYZERS])
+    if line_matches is None:
+      line_matches = analyze_makefile(filename)
+
+    self.analyses = dict([(analyzer, Analysis(filename, matches) if matches else None)
+        for analyzer, matches in zip(ANALYZERS, line_matches)])
+
+class MakefileCache(object):
+  """The analyses of the makefiles, in an sqlite database.
+
+  An entry is used as long as the size and modification time of the makefile
+  stay the same."""
+  def __init__(self, path):
+    self.conn = sqlite3.connect(path)
+    self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)")
+    version = self.conn.execute(
+        "SELECT value FROM meta WHERE key = 'analyzers_version'").fetchone()
+    if not version or version[0] != ANALYZERS_VERSION:
+      self.conn.execute("DROP TABLE IF EXISTS makefiles")
+      self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('analyzers_version', ?)",
+          (ANALYZERS_VERSION,))
+    self.conn.execute("""CREATE TABLE IF NOT EXISTS makefiles (
+        path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, line_matches TEXT)""")
+
+  def get(self, filename, st):
+    row = self.conn.execute(
+        "SELECT mtime_ns, size, line_matches FROM makefiles WHERE path = ?",
+        (filename,)).fetchone()
+    if not row or row[0] != st.st_mtime_ns or row[1] != st.st_size:
+      return None
+    return [[tuple(match) for match in matches] if matches else None
+            for matches in json.loads(row[2])]
+
+  def put(self, filename, st, line_matches):
+    self.conn.execute("INSERT OR REPLACE INTO makefiles VALUES (?, ?, ?, ?)",
+        (filename, st.st_mtime_ns, st.st_size, json.dumps(line_matches)))
+
+  def close(self):
+    self.conn.commit()
+    self.conn.close()
+
+def load_makefiles(filenames, cache_path=None, jobs=None):
+  """Analyze the makefiles on a pool of processes.
+
+  With cache_path, only the makefiles that changed since the previous run are
+  analyzed again. Returns a dict of the filenames to their Makefile."""
+  cache = MakefileCache(cache_path) if cache_path else None
+  try:
+    results = dict()
+    stats = dict()
+    for filename in filenames:
+      st = os.stat(filename)
+      line_matches = cache.get(filename, st) if cache else None
+      if line_matches is None:
+        stats[filename] = st
+      else:
+        results[filename] = line_matches
+
+    if stats:
+      with multiprocessing.Pool(jobs) as pool:
+        for filename, line_matches in zip(stats, pool.imap(analyze_makefile, stats,
+                                                           chunksize=64)):
+          results[filename] = line_matches
+          if cache:
+            cache.put(filename, stats[filename], line_matches)
+  finally:
+    if cache:
+      cache.close()
+
+  return dict([(filename, Makefile(filename, results[filename])) for filename in filenames])
 
 def find_android_mk():
   cwd = os.getcwd()
@@ -174,16 +259,29 @@ def is_clean(makefile):
       return False
   return True
 
-def clean_and_only_blocked_by_clean(soong, all_makefiles, makefile):
+def get_blocked_by_unclean(soong, all_makefiles):
+  """Return the modules that transitively depend on a module that is defined in
+  a makefile that isn't clean."""
+  unclean_modules = set()
+  for filename, makefile in all_makefiles.items():
+    if not is_clean(makefile):
+      unclean_modules.update(soong.reverse_makefiles.get(filename, []))
+  return soong.deps_graph.reverse_transitive_deps(unclean_modules)
+
+def clean_and_only_blocked_by_clean(soong, all_makefiles, makefile,
+                                    blocked_by_unclean=None):
+  """Whether the makefile is clean and only depends on clean makefiles.
+
+  blocked_by_unclean is the result of get_blocked_by_unclean(), which can be
+  computed once for all the makefiles."""
   if not is_clean(makefile):
     return False
+  if blocked_by_unclean is None:
+    blocked_by_unclean = get_blocked_by_unclean(soong, all_makefiles)
   modules = soong.reverse_makefiles[makefile.filename]
   for module in modules:
-    for dep in soong.transitive_deps(module):
-      for filename in soong.makefiles.get(dep, []):
-        m = all_makefiles.get(filename)
-        if m and not is_clean(m):
-          return False
+    if module in blocked_by_unclean:
+      return False
   return True
 
 class Annotations(object):
@@ -196,6 +294,192 @@ class Annotations(object):
     self.count += 1
     return self.count-1
 
+class DepGraph(object):
+  """Index of a dependency graph for transitive queries.
+
+  The strongly connected components of the graph are condensed into a DAG, so
+  that the modules of a dependency cycle share their transitive closure. The
+  size of the transitive closure of every module is computed on the first
+  query, with the closures as bitsets of modules that are merged along the
+  DAG.
+  """
+  def __init__(self, deps):
+    """deps maps each module to the list of its direct dependencies."""
+    self.deps = deps
+    self._closure_sizes = None
+    self._reverse_closure_sizes = None
+
+    # Number the modules, including the dependencies that aren't modules.
+    self._names = []
+    self._index = dict()
+    for module, module_deps in deps.items():
+      self._add_node(module)
+      for dep in module_deps:
+        self._add_node(dep)
+    self._edges = [[] for _ in self._names]
+    for module, module_deps in deps.items():
+      edges = self._edges[self._index[module]]
+      for dep in module_deps:
+        edges.append(self._index[dep])
+
+    self._components = self._strongly_connected_components(self._edges)
+    self._component_of = [0] * len(self._names)
+    for c, nodes in enumerate(self._components):
+      for node in nodes:
+        self._component_of[node] = c
+
+  def _add_node(self, name):
+    if name not in self._index:
+      self._index[name] = len(self._names)
+      self._names.append(name)
+
+  @staticmethod
+  def _strongly_connected_components(edges):
+    """Tarjan's algorithm, without recursion.
+
+    Returns the lists of nodes of the components in reverse topological order,
+    so that every component comes after the ones it depends on."""
+    index = [-1] * len(edges)
+    lowlink = [0] * len(edges)
+    on_stack = [False] * len(edges)
+    stack = []
+    components = []
+    counter = 0
+    for root in range(len(edges)):
+      if index[root] >= 0:
+        continue
+      index[root] = lowlink[root] = counter
+      counter += 1
+      stack.append(root)
+      on_stack[root] = True
+      work = [(root, iter(edges[root]))]
+      while work:
+        node, it = work[-1]
+        for succ in it:
+          if index[succ] < 0:
+            index[succ] = lowlink[succ] = counter
+            counter += 1
+            stack.append(succ)
+            on_stack[succ] = True
+            work.append((succ, iter(edges[succ])))
+            break
+          if on_stack[succ] and index[succ] < lowlink[node]:
+            lowlink[node] = index[succ]
+        else:
+          work.pop()
+          if work:
+            parent = work[-1][0]
+            if lowlink[node] < lowlink[parent]:
+              lowlink[parent] = lowlink[node]
+          if lowlink[node] == index[node]:
+            component = []
+            while True:
+              member = stack.pop()
+              on_stack[member] = False
+              component.append(member)
+              if member == node:
+                break
+            components.append(component)
+    return components
+
+  def _component_edges(self, reverse):
+    """Returns the sets of components each component depends on, or is
+    depended on by if reverse is set."""
+    component_edges = [set() for _ in self._components]
+    for node, edges in enumerate(self._edges):
+      c = self._component_of[node]
+      for succ in edges:
+        s = self._component_of[succ]
+        if s != c:
+          if reverse:
+            component_edges[s].add(c)
+          else:
+            component_edges[c].add(s)
+    return component_edges
+
+  def _compute_closure_sizes(self, reverse):
+    """Returns the number of modules reachable from each component, including
+    its own modules.
+
+    The components are visited in topological order of the dependencies, so
+    that the closures they're merged from are already known. The bit of a
+    module is its position in that order. A closure is dropped once all the
+    components that need it have been visited."""
+    component_edges = self._component_edges(reverse)
+    order = range(len(self._components))
+    if reverse:
+      order = reversed(order)
+    order = list(order)
+
+    first_bit = [0] * len(self._components)
+    bit = 0
+    for c in order:
+      first_bit[c] = bit
+      bit += len(self._components[c])
+
+    users = [0] * len(self._components)
+    for succs in component_edges:
+      for s in succs:
+        users[s] += 1
+
+    closures = dict()
+    sizes = [0] * len(self._components)
+    for c in order:
+      closure = ((1 << len(self._components[c])) - 1) << first_bit[c]
+      for s in component_edges[c]:
+        closure |= closures[s]
+        users[s] -= 1
+        if not users[s]:
+          del closures[s]
+      sizes[c] = closure.bit_count()
+      if users[c]:
+        closures[c] = closure
+    return sizes
+
+  def closure_size(self, module, reverse=False):
+    """Count the transitive dependencies of the module, or the modules that
+    transitively depend on it if reverse is set. The module itself isn't
+    counted."""
+    if module not in self._index:
+      return 0
+    if reverse:
+      if self._reverse_closure_sizes is None:
+        self._reverse_closure_sizes = self._compute_closure_sizes(True)
+      sizes = self._reverse_closure_sizes
+    else:
+      if self._closure_sizes is None:
+        self._closure_sizes = self._compute_closure_sizes(False)
+      sizes = self._closure_sizes
+    return sizes[self._component_of[self._index[module]]] - 1
+
+  def transitive_deps(self, module):
+    """Return the set of the transitive dependencies of the module. It only
+    contains the module itself if it is part of a dependency cycle."""
+    results = set()
+    pending = [module]
+    while pending:
+      for dep in self.deps.get(pending.pop(), []):
+        if not dep in results:
+          results.add(dep)
+          pending.append(dep)
+    return results
+
+  def reverse_transitive_deps(self, modules):
+    """Return the set of the modules that transitively depend on one of the
+    modules."""
+    reverse_edges = [[] for _ in self._names]
+    for node, edges in enumerate(self._edges):
+      for succ in edges:
+        reverse_edges[succ].append(node)
+    results = set()
+    pending = [self._index[m] for m in modules if m in self._index]
+    while pending:
+      for node in reverse_edges[pending.pop()]:
+        if node not in results:
+          results.add(node)
+          pending.append(node)
+    return {self._names[node] for node in results}
+
 class SoongData(object):
   def __init__(self, reader):
     """Read the input file and store the modules and dependency mappings.
@@ -227,15 +511,10 @@ class SoongData(object):
         self.installed[f] = module
         self.reverse_installed.setdefault(module, []).append(f)
 
+    self.deps_graph = DepGraph(self.deps)
+
   def transitive_deps(self, module):
-    results = set()
-    def traverse(module):
-      for dep in self.deps.get(module, []):
-        if not dep in results:
-          results.add(dep)
-          traverse(module)
-    traverse(module)
-    return results
+    return self.deps_graph.transitive_deps(module)
 
   def contains_unblocked_modules(self, filename):
     for m in self.reverse_makefiles[filename]:
@@ -253,14 +532,19 @@ def count_deps(depsdb, module, seen):
   """Based on the depsdb, count the number of transitive dependencies.
 
   You can pass in an reversed dependency graph to count the number of
-  modules that depend on the module."""
+  modules that depend on the module. For the graphs of a SoongData, use
+  DepGraph.closure_size instead, which is memoized."""
+  seen = set(seen)
+  seen.add(module)
+  pending = [module]
   count = 0
-  seen.append(module)
-  if module in depsdb:
-    for dep in depsdb[module]:
+  while pending:
+    for dep in depsdb.get(pending.pop(), []):
       if dep in seen:
         continue
-      count += 1 + count_deps(depsdb, dep, seen)
+      seen.add(dep)
+      pending.append(dep)
+      count += 1
   return count
 
 OTHER_PARTITON = "_other"
@@ -337,6 +621,14 @@ def main():
   parser.add_argument("--mode", type=str,
                       default="html",
                       help="output format: csv or html")
+  parser.add_argument("--makefile-cache", type=str,
+                      default=None,
+                      help="Database of the makefile analyses to reuse across runs."
+                        + " Default is mk2bp_catalog_cache.db in the out directory."
+                        + " Set to '' to disable.")
+  parser.add_argument("-j", "--jobs", type=int,
+                      default=None,
+                      help="number of processes analyzing the makefiles")
 
   args = parser.parse_args()
 
@@ -360,11 +652,11 @@ def main():
     soong = SoongData(csv.reader(csvfile))
 
   # Read the makefiles
-  all_makefiles = dict()
-  for filename, modules in soong.reverse_makefiles.items():
-    if filename.startswith(args.out_dir + "/"):
-      continue
-    all_makefiles[filename] = Makefile(filename)
+  if args.makefile_cache is None:
+    args.makefile_cache = os.path.join(args.out_dir, "mk2bp_catalog_cache.db")
+  all_makefiles = load_makefiles([filename for filename in soong.reverse_makefiles
+                                  if not filename.startswith(args.out_dir + "/")],
+                                 cache_path=args.makefile_cache, jobs=args.jobs)
 
   # Get all the modules in $(PRODUCT_PACKAGES) and the correspoding deps
   product_package_modules_plus_deps = set()
@@ -386,6 +678,7 @@ class HtmlProcessor(object):
     self.all_makefiles = all_makefiles
     self.product_packages_modules = product_packages_modules
     self.annotations = Annotations()
+    self.blocked_by_unclean = get_blocked_by_unclean(soong, all_makefiles)
 
   def execute(self):
     if self.args.title:
@@ -740,8 +1033,8 @@ class HtmlProcessor(object):
         </table>
       """)
 
-      module_details = [(count_deps(self.soong.deps, m, []),
-                         -count_deps(self.soong.reverse_deps, m, []), m)
+      module_details = [(self.soong.deps_graph.closure_size(m),
+                         -self.soong.deps_graph.closure_size(m, reverse=True), m)
                  for m in modules]
       module_details.sort()
       module_details = [m[2] for m in module_details]
@@ -768,9 +1061,9 @@ class HtmlProcessor(object):
         print("  <td><a name='module_%s'></a>%s</td>" % (module, module))
         print("  <td class='AnalysisCol'>%s</td>" % " ".join(["<span class='Analysis'>%s</span>" % title
             for title in analyses]))
-        print("  <td>%s</td>" % count_deps(self.soong.deps, module, []))
+        print("  <td>%s</td>" % self.soong.deps_graph.closure_size(module))
         print("  <td>%s</td>" % format_module_list(self.soong.deps.get(module, [])))
-        print("  <td>%s</td>" % count_deps(self.soong.reverse_deps, module, []))
+        print("  <td>%s</td>" % self.soong.deps_graph.closure_size(module, reverse=True))
         print("  <td>%s</td>" % format_module_list(self.soong.reverse_deps.get(module, [])))
         print("</tr>")
       print("""</table>""")
@@ -956,7 +1249,8 @@ class HtmlProcessor(object):
 
   def traverse_ready_makefiles(self, summary, makefiles):
     return [Analysis(makefile.filename, []) for makefile in makefiles
-        if clean_and_only_blocked_by_clean(self.soong, self.all_makefiles, makefile)]
+        if clean_and_only_blocked_by_clean(self.soong, self.all_makefiles, makefile,
+                                           self.blocked_by_unclean)]
 
   def print_analysis_row(self, summary, modules, rowtitle, rowclass, makefiles):
     all_makefiles = [Analysis(makefile.filename, []) for makefile in makefiles]
@@ -1013,6 +1307,7 @@ class CsvProcessor(object):
     self.soong = soong
     self.all_makefiles = all_makefiles
     self.product_packages_modules = product_packages_modules
+    self.blocked_by_unclean = get_blocked_by_unclean(soong, all_makefiles)
 
   def execute(self):
     csvout = csv.writer(sys.stdout)
@@ -1038,7 +1333,8 @@ class CsvProcessor(object):
                                         in self.soong.reverse_installed.get(module, [])]))))
         # Easy
         row.append(1
-            if clean_and_only_blocked_by_clean(self.soong, self.all_makefiles, makefile)
+            if clean_and_only_blocked_by_clean(self.soong, self.all_makefiles, makefile,
+                                               self.blocked_by_unclean)
             else "")
         # Unblocked Clean
         row.append(1
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark of the module graph queries of mk2bp_catalog on a synthetic graph.
+
+The graph looks like a build: modules mostly depend on modules defined before
+them, with a few dependency cycles, and a long tail of heavily used libraries.
+"""
+
+import argparse
+import random
+import time
+
+import mk2bp_catalog
+
+
+def make_deps(num_modules, avg_deps, cycles, seed):
+  rng = random.Random(seed)
+  names = ["module_%d" % i for i in range(num_modules)]
+  deps = dict()
+  for i, name in enumerate(names):
+    module_deps = set()
+    for _ in range(rng.randint(0, 2 * avg_deps) if i else 0):
+      # Mostly recent modules, sometimes a core library
+      if rng.random() < 0.2:
+        j = int(rng.paretovariate(1.0)) - 1
+      else:
+        j = i - 1 - int(rng.expovariate(1.0 / 200))
+      if 0 <= j < i:
+        module_deps.add(names[j])
+    deps[name] = sorted(module_deps)
+  for _ in range(cycles):
+    i = rng.randrange(1, num_modules)
+    j = rng.randrange(max(0, i - 50), i)
+    deps[names[j]].append(names[i])
+  return deps
+
+
+def timed(title, func):
+  start = time.perf_counter()
+  result = func()
+  print("%-40s %8.3fs" % (title, time.perf_counter() - start))
+  return result
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark mk2bp_catalog graph queries.")
+  parser.add_argument("--modules", type=int, default=100000,
+                      help="number of modules")
+  parser.add_argument("--avg-deps", type=int, default=5,
+                      help="average number of direct dependencies")
+  parser.add_argument("--cycles", type=int, default=100,
+                      help="number of dependency cycles")
+  parser.add_argument("--seed", type=int, default=0,
+                      help="random seed")
+  parser.add_argument("--baseline-sample", type=int, default=100,
+                      help="number of modules to time count_deps on")
+  args = parser.parse_args()
+
+  deps = timed("generate %d modules" % args.modules,
+               lambda: make_deps(args.modules, args.avg_deps, args.cycles, args.seed))
+  graph = timed("index", lambda: mk2bp_catalog.DepGraph(deps))
+  modules = list(deps)
+  sizes = timed("closure sizes",
+                lambda: [graph.closure_size(m) for m in modules])
+  reverse_sizes = timed("reverse closure sizes",
+                        lambda: [graph.closure_size(m, reverse=True) for m in modules])
+  unclean = random.Random(args.seed).sample(modules, len(modules) // 100)
+  timed("reverse transitive deps of 1% modules",
+        lambda: graph.reverse_transitive_deps(unclean))
+
+  # The per-module traversal it replaces, extrapolated from a sample
+  sample = random.Random(args.seed).sample(range(len(modules)),
+                                           min(args.baseline_sample, len(modules)))
+  start = time.perf_counter()
+  for i in sample:
+    assert mk2bp_catalog.count_deps(deps, modules[i], []) == sizes[i]
+  elapsed = time.perf_counter() - start
+  print("%-40s %8.3fs (extrapolated)" % ("count_deps for all modules",
+                                         elapsed * len(modules) / max(len(sample), 1)))
+
+  print("max closure size %d, max reverse closure size %d"
+        % (max(sizes), max(reverse_sizes)))
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# Copyright (C) 2026 The Android Open Source Project
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests of the synthetic target files packages of releasetools_benchmarks."""
+
+import importlib.machinery
+import importlib.util
+import os
+import pathlib
+import tempfile
+import unittest
+import zipfile
+
+
+def _load_releasetools_benchmarks():
+    "Import the releasetools_benchmarks script, which has no .py extension"
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "releasetools_benchmarks")
+    loader = importlib.machinery.SourceFileLoader("releasetools_benchmarks", path)
+    module = importlib.util.module_from_spec(importlib.util.spec_from_loader(loader.name, loader))
+    loader.exec_module(module)
+    return module
+
+
+releasetools_benchmarks = _load_releasetools_benchmarks()
+
+_SPEC = releasetools_benchmarks.TargetFilesSpec(id="test", files=20, mean_file_size=4096,
+                                                apks=2, mean_apk_size=16 * 1024)
+
+
+def _props(data):
+    return dict(line.split("=", 1) for line in data.decode().splitlines()
+                if line and not line.startswith("#"))
+
+
+class GenerateTargetFilesTest(unittest.TestCase):
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.temp_dir = pathlib.Path(temp_dir.name)
+        # The generator reads the test APK and key paths from the top of the tree.
+        top = self.temp_dir / "top"
+        (top / "build").mkdir(parents=True)
+        (top / "build" / "make").symlink_to(pathlib.Path(__file__).resolve().parents[2])
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(top)
+
+    def generate(self, updated=False):
+        output = self.temp_dir / ("updated.zip" if updated else "target_files.zip")
+        releasetools_benchmarks.GenerateTargetFiles(_SPEC, output, updated=updated)
+        return zipfile.ZipFile(output)
+
+    def test_partition_dirs(self):
+        with self.generate() as target_files:
+            names = set(target_files.namelist())
+        self.assertIn("ROOT/", names)
+        self.assertIn("META/", names)
+        for partition, dirs in releasetools_benchmarks._PARTITION_DIRS.items():
+            prefix = partition.upper() + "/"
+            self.assertIn(prefix, names)
+            self.assertIn(prefix + "build.prop", names)
+            for directory in dirs:
+                self.assertIn(f"{prefix}{directory}/", names)
+        apks = [name for name in names if name.endswith(".apk")]
+        self.assertEqual(len(apks), _SPEC.apks)
+        self.assertTrue(all(apk.startswith("SYSTEM/app/") for apk in apks))
+
+    def test_build_props(self):
+        with self.generate() as target_files:
+            system_props = _props(target_files.read("SYSTEM/build.prop"))
+            vendor_props = _props(target_files.read("VENDOR/build.prop"))
+        with self.generate(updated=True) as updated:
+            updated_props = _props(updated.read("SYSTEM/build.prop"))
+        for key in ("ro.build.fingerprint", "ro.build.version.sdk",
+                    "ro.build.version.all_codenames", "ro.treble.enabled"):
+            self.assertIn(key, system_props)
+        for partition, props in (("system", system_props), ("vendor", vendor_props)):
+            for key in ("fingerprint", "date.utc", "version.incremental", "security_patch"):
+                self.assertIn(f"ro.{partition}.build.{key}", props)
+        self.assertNotEqual(updated_props["ro.build.fingerprint"],
+                            system_props["ro.build.fingerprint"])
+        self.assertGreater(int(updated_props["ro.build.date.utc"]),
+                           int(system_props["ro.build.date.utc"]))
+
+    def test_meta_files(self):
+        with self.generate() as target_files:
+            names = set(target_files.namelist())
+            misc_info = _props(target_files.read("META/misc_info.txt"))
+            dynamic_partitions_info = _props(
+                target_files.read("META/dynamic_partitions_info.txt"))
+            ab_partitions = target_files.read("META/ab_partitions.txt").decode().split()
+            apkcerts = target_files.read("META/apkcerts.txt").decode().splitlines()
+        for name in ("META/apexkeys.txt", "META/file_contexts.bin",
+                     "META/postinstall_config.txt", "META/update_engine_config.txt"):
+            self.assertIn(name, names)
+        partitions = list(releasetools_benchmarks._PARTITION_DIRS)
+        self.assertEqual(ab_partitions, partitions)
+        self.assertEqual(misc_info["ab_update"], "true")
+        for partition in partitions:
+            self.assertEqual(misc_info[f"building_{partition}_image"], "true")
+            self.assertGreater(int(misc_info[f"{partition}_size"]), 0)
+        self.assertEqual(dynamic_partitions_info["dynamic_partition_list"].split(), partitions)
+        for key, value in dynamic_partitions_info.items():
+            self.assertEqual(misc_info[key], value)
+        self.assertEqual(len(apkcerts), _SPEC.apks)
+
+    @unittest.skipUnless(releasetools_benchmarks._host_tool("mke2fs")
+                         and releasetools_benchmarks._host_tool("debugfs"),
+                         "needs e2fsprogs")
+    def test_add_images(self):
+        target_files = self.temp_dir / "target_files.zip"
+        self.generate().close()
+        releasetools_benchmarks.AddImages(target_files)
+        with zipfile.ZipFile(target_files) as target_files:
+            misc_info = _props(target_files.read("META/misc_info.txt"))
+            for partition in releasetools_benchmarks._PARTITION_DIRS:
+                with target_files.open(f"IMAGES/{partition}.img") as image:
+                    header = image.read(releasetools_benchmarks._SPARSE_HEADER.size)
+                magic, _, _, _, _, block_size, total_blocks, _, _ = (
+                    releasetools_benchmarks._SPARSE_HEADER.unpack(header))
+                self.assertEqual(magic, releasetools_benchmarks._SPARSE_MAGIC)
+                self.assertEqual(block_size * total_blocks, int(misc_info[f"{partition}_size"]))
+
+                prefix = partition.upper() + "/"
+                files = {f"/{partition}/{name[len(prefix):]}" for name in target_files.namelist()
+                         if name.startswith(prefix) and not name.endswith("/")}
+                block_map = target_files.read(f"IMAGES/{partition}.map").decode().splitlines()
+                self.assertEqual({line.split()[0] for line in block_map}, files)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
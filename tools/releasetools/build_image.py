@@ -32,6 +32,7 @@ import os.path
 import re
 import shlex
 import shutil
+import stat
 import sys
 import uuid
 import tempfile
@@ -46,6 +47,15 @@ OPTIONS = common.OPTIONS
 BLOCK_SIZE = common.BLOCK_SIZE
 BYTES_IN_MB = 1024 * 1024
 
+# ext4 layout constants, from external/e2fsprogs.
+EXT4_DESC_SIZE = 32
+EXT4_EXTENTS_PER_BLOCK = 340
+EXT4_FIRST_INODE = 11
+EXT4_INLINE_SYMLINK_LEN = 60
+EXT4_INODE_EXTENTS = 4
+EXT4_LOST_AND_FOUND_BLOCKS = 4
+EXT4_MAX_EXTENT_BLOCKS = 32768
+
 # Use a fixed timestamp (01/01/2009 00:00:00 UTC) for files when packaging
 # images. (b/24377993, b/80600931)
 FIXED_FILE_TIMESTAMP = int((
@@ -60,33 +70,35 @@ class BuildImageError(Exception):
     Exception.__init__(self, message)
 
 
-def GetDiskUsage(path):
+def GetDiskUsage(path, tree_stats=None):
   """Returns the number of bytes that "path" occupies on host.
 
   Args:
     path: The directory or file to calculate size on.
+    tree_stats: The common.TreeStats of path, if already collected.
 
   Returns:
     The number of bytes based on a 1K block_size.
   """
-  cmd = ["du", "-b", "-k", "-s", path]
-  output = common.RunAndCheckOutput(cmd, verbose=False)
-  return int(output.split()[0]) * 1024
+  if tree_stats is None:
+    tree_stats = common.TreeStats(path)
+  return tree_stats.disk_usage
 
 
-def GetInodeUsage(path):
+def GetInodeUsage(path, tree_stats=None):
   """Returns the number of inodes that "path" occupies on host.
 
   Args:
     path: The directory or file to calculate inode number on.
+    tree_stats: The common.TreeStats of path, if already collected.
 
   Returns:
     The number of inodes used.
   """
-  cmd = ["find", path, "-print"]
-  output = common.RunAndCheckOutput(cmd, verbose=False)
+  if tree_stats is None:
+    tree_stats = common.TreeStats(path)
   # increase by > 6% as number of files and directories is not whole picture.
-  inodes = output.count('\n')
+  inodes = tree_stats.inodes
   spare_inodes = inodes * 6 // 100
   min_spare_inodes = 12
   if spare_inodes < min_spare_inodes:
@@ -205,7 +217,13 @@ def SetUpInDirAndFsConfig(origin_in, prop_dict):
   return in_dir, fs_config
 
 
-def CheckHeadroom(ext4fs_output, prop_dict):
+def _FormatLargestDirs(tree_stats, count=5):
+  return ", ".join(
+      "{} ({} MB)".format(path, size // BYTES_IN_MB)
+      for path, size in tree_stats.LargestDirs(count))
+
+
+def CheckHeadroom(ext4fs_output, prop_dict, tree_stats=None):
   """Checks if there's enough headroom space available.
 
   Headroom is the reserved space on system image (via PRODUCT_SYSTEM_HEADROOM),
@@ -216,6 +234,8 @@ def CheckHeadroom(ext4fs_output, prop_dict):
   Args:
     ext4fs_output: The output string from mke2fs command.
     prop_dict: The property dict.
+    tree_stats: The common.TreeStats of the input directory, if available.
+        Used to report the largest directories on failure.
 
   Raises:
     AssertionError: On invalid input.
@@ -237,11 +257,15 @@ def CheckHeadroom(ext4fs_output, prop_dict):
   adjusted_blocks = total_blocks - headroom_blocks
   if used_blocks > adjusted_blocks:
     mount_point = prop_dict["mount_point"]
-    raise BuildImageError(
+    message = (
         "Error: Not enough room on {} (total: {} blocks, used: {} blocks, "
         "headroom: {} blocks, available: {} blocks)".format(
             mount_point, total_blocks, used_blocks, headroom_blocks,
             adjusted_blocks))
+    if tree_stats:
+      message += "; largest directories: {}".format(
+          _FormatLargestDirs(tree_stats))
+    raise BuildImageError(message)
 
 
 def CalculateSizeAndReserved(prop_dict, size):
@@ -263,7 +287,8 @@ def CalculateSizeAndReserved(prop_dict, size):
   return int(size * 1.1) + reserved_size
 
 
-def BuildImageMkfs(in_dir, prop_dict, out_file, target_out, fs_config):
+def BuildImageMkfs(in_dir, prop_dict, out_file, target_out, fs_config,
+                   tree_stats=None):
   """Builds a pure image for the files under in_dir and writes it to out_file.
 
   Args:
@@ -276,6 +301,8 @@ def BuildImageMkfs(in_dir, prop_dict, out_file, target_out, fs_config):
         under system/core/libcutils) reads device specific FS config files from
         there.
     fs_config: The fs_config file that drives the prototype
+    tree_stats: The common.TreeStats of in_dir, if already collected. Only
+        used to report the tree size on failures.
 
   Raises:
     BuildImageError: On build image failures.
@@ -447,12 +474,15 @@ def BuildImageMkfs(in_dir, prop_dict, out_file, target_out, fs_config):
     mkfs_output = common.RunAndCheckOutput(build_command)
   except:
     try:
-      du = GetDiskUsage(in_dir)
+      if tree_stats is None:
+        tree_stats = common.TreeStats(in_dir)
+      du = GetDiskUsage(in_dir, tree_stats)
       du_str = "{} bytes ({} MB)".format(du, du // BYTES_IN_MB)
     # Suppress any errors from GetDiskUsage() to avoid hiding the real errors
     # from common.RunAndCheckOutput().
     except Exception:  # pylint: disable=broad-except
-      logger.exception("Failed to compute disk usage with du")
+      logger.exception("Failed to compute disk usage")
+      tree_stats = None
       du_str = "unknown"
     print(
         "Out of space? Out of inodes? The tree size of {} is {}, "
@@ -468,6 +498,9 @@ def BuildImageMkfs(in_dir, prop_dict, out_file, target_out, fs_config):
               int(prop_dict["image_size"]) // BYTES_IN_MB,
               int(prop_dict["partition_size"]),
               int(prop_dict["partition_size"]) // BYTES_IN_MB))
+    if tree_stats:
+      print("The largest directories are: {}.".format(
+          _FormatLargestDirs(tree_stats)))
     raise
 
   if run_fsck and prop_dict.get("skip_fsck") != "true":
@@ -516,6 +549,220 @@ def SetUUIDIfNotExist(image_props):
   image_props["hash_seed"] = str(uuid.uuid5(uuid.NAMESPACE_URL, hash_seed))
 
 
+def _TrimExt4Size(size, free_size, reserved_size, block_size):
+  """Shrinks an ext4 image size down to its used space plus reserved space."""
+  if free_size <= reserved_size:
+    logger.info(
+        "Not worth reducing image %d <= %d.", free_size, reserved_size)
+    return size
+  size -= free_size
+  size += reserved_size
+  if reserved_size == 0:
+    # add .3% margin
+    size = size * 1003 // 1000
+  # Use a minimum size, otherwise we will fail to calculate an AVB footer
+  # or fail to construct an ext4 image.
+  size = max(size, 256 * 1024)
+  if block_size <= 4096:
+    size = common.RoundUpTo4K(size)
+  else:
+    size = ((size + block_size - 1) // block_size) * block_size
+  return size
+
+
+def _AddSpareInodes(inodes):
+  # add .2% margin or 1 inode, whichever is greater
+  spare_inodes = inodes * 2 // 1000
+  min_spare_inodes = 1
+  if spare_inodes < min_spare_inodes:
+    spare_inodes = min_spare_inodes
+  return inodes + spare_inodes
+
+
+def CalculateExt4SizeWithFirstPass(in_dir, prop_dict, out_file, target_out,
+                                   fs_config, size, tree_stats=None):
+  """Calculates the ext4 image size and inode count by building it once.
+
+  A throwaway image is built with the given estimated size, and the free
+  blocks and inodes it reports are trimmed off.
+
+  Returns:
+    A tuple of (size, inodes) to build the final image with.
+  """
+  fs_type = prop_dict.get("fs_type", "")
+  disable_sparse = "disable_sparse" in prop_dict
+  prop_dict["partition_size"] = str(size)
+  prop_dict["image_size"] = str(size)
+  if "extfs_inode_count" not in prop_dict:
+    prop_dict["extfs_inode_count"] = str(GetInodeUsage(in_dir, tree_stats))
+  logger.info(
+      "First Pass based on estimates of %d MB and %s inodes.",
+      size // BYTES_IN_MB, prop_dict["extfs_inode_count"])
+  BuildImageMkfs(in_dir, prop_dict, out_file, target_out, fs_config,
+                 tree_stats)
+  sparse_image = False
+  if "extfs_sparse_flag" in prop_dict and not disable_sparse:
+    sparse_image = True
+  fs_dict = GetFilesystemCharacteristics(fs_type, out_file, sparse_image)
+  os.remove(out_file)
+  block_size = int(fs_dict.get("Block size", "4096"))
+  free_size = int(fs_dict.get("Free blocks", "0")) * block_size
+  reserved_size = int(prop_dict.get("partition_reserved_size", 0))
+  partition_headroom = int(fs_dict.get("partition_headroom", 0))
+  if fs_type.startswith("ext4") and partition_headroom > reserved_size:
+    reserved_size = partition_headroom
+  size = _TrimExt4Size(size, free_size, reserved_size, block_size)
+  extfs_inode_count = prop_dict["extfs_inode_count"]
+  inodes = int(fs_dict.get("Inode count", extfs_inode_count))
+  inodes -= int(fs_dict.get("Free inodes", "0"))
+  return size, _AddSpareInodes(inodes)
+
+
+def _ReadFsConfigCapabilities(fs_config):
+  """Returns the paths in an fs_config file that are given capabilities."""
+  paths = set()
+  if not fs_config:
+    return paths
+  with open(fs_config) as f:
+    for line in f:
+      fields = line.split()
+      for field in fields[4:]:
+        key, _, value = field.partition("=")
+        if key == "capabilities" and int(value, 16) != 0:
+          paths.add(fields[0])
+  return paths
+
+
+def _GetExt4DirBlocks(names, block_size):
+  """Returns the number of blocks of a directory holding the given names."""
+  blocks = 1
+  # "." and ".." entries.
+  used = 24
+  for name in names:
+    rec_len = (8 + len(os.fsencode(name)) + 3) & ~3
+    if used + rec_len > block_size:
+      blocks += 1
+      used = 0
+    used += rec_len
+  # Directories spanning multiple blocks get an htree root block (dir_index).
+  if blocks > 1:
+    blocks += 1
+  return blocks
+
+
+def _GetExt4MetadataBlocks(total_blocks, inode_count, inode_size, block_size):
+  """Returns the number of blocks mke2fs reserves for filesystem metadata.
+
+  This follows the mke2fs.conf used for Android images: sparse_super, 32-byte
+  group descriptors and no resize inode.
+  """
+  blocks_per_group = 8 * block_size
+  groups = max(1, (total_blocks + blocks_per_group - 1) // blocks_per_group)
+  inodes_per_block = block_size // inode_size
+  inodes_per_group = (inode_count + groups - 1) // groups
+  # Inode tables are made of whole blocks, with a multiple of 8 inodes.
+  alignment = max(8, inodes_per_block)
+  inodes_per_group = (
+      (inodes_per_group + alignment - 1) // alignment * alignment)
+  inode_table_blocks = (
+      (inodes_per_group + inodes_per_block - 1) // inodes_per_block)
+  gdt_blocks = (groups * EXT4_DESC_SIZE + block_size - 1) // block_size
+
+  backup_groups = 0
+  for group in range(groups):
+    if group <= 1:
+      backup_groups += 1
+      continue
+    for base in (3, 5, 7):
+      n = group
+      while n % base == 0:
+        n //= base
+      if n == 1:
+        backup_groups += 1
+        break
+
+  return (backup_groups * (1 + gdt_blocks) +
+          groups * (2 + inode_table_blocks))
+
+
+def EstimateExt4Size(tree_stats, prop_dict, fs_config, size):
+  """Estimates the ext4 image size and inode count without building it.
+
+  The staging directory entries are used to add up the data, directory,
+  symlink and xattr blocks that e2fsdroid allocates, plus the metadata of the
+  resulting filesystem layout. The size is then trimmed the same way as
+  CalculateExt4SizeWithFirstPass(), so both yield comparable results.
+
+  Args:
+    tree_stats: The common.TreeStats of the input directory.
+    prop_dict: The property dict.
+    fs_config: The fs_config file that drives the prototype.
+    size: The initial size estimate based on the tree size.
+
+  Returns:
+    A tuple of (size, inodes), or None if the image can't be estimated (e.g.
+    because it uses a journal, reserved blocks or a base fs layout).
+  """
+  if prop_dict.get("journal_size", "0") != "0":
+    return None
+  if prop_dict.get("extfs_rsv_pct", "0") != "0":
+    return None
+  if "base_fs_file" in prop_dict:
+    return None
+
+  block_size = BLOCK_SIZE
+  inode_size = 512 if prop_dict.get("needs_projid", 0) else 256
+  mount_point = prop_dict["mount_point"].strip("/")
+  capabilities = _ReadFsConfigCapabilities(fs_config)
+
+  # The reserved inodes (root directory included) and lost+found.
+  inodes = EXT4_FIRST_INODE
+  data_blocks = EXT4_LOST_AND_FOUND_BLOCKS
+  for rel_dir, entries in tree_stats.dir_entries.items():
+    for name, mode, entry_size in entries:
+      inodes += 1
+      if os.path.join(mount_point, rel_dir, name) in capabilities:
+        # security.capability doesn't fit in the inode next to the selinux
+        # label, so it takes an xattr block.
+        data_blocks += 1
+      if stat.S_ISLNK(mode):
+        # The size of a symlink is the length of its target.
+        if entry_size >= EXT4_INLINE_SYMLINK_LEN:
+          data_blocks += 1
+      elif stat.S_ISREG(mode):
+        file_blocks = (entry_size + block_size - 1) // block_size
+        data_blocks += file_blocks
+        extents = (file_blocks + EXT4_MAX_EXTENT_BLOCKS - 1) // \
+            EXT4_MAX_EXTENT_BLOCKS
+        if extents > EXT4_INODE_EXTENTS:
+          data_blocks += (extents + EXT4_EXTENTS_PER_BLOCK - 1) // \
+              EXT4_EXTENTS_PER_BLOCK
+    data_blocks += _GetExt4DirBlocks(
+        [name for name, _, _ in entries], block_size)
+
+  if "extfs_inode_count" in prop_dict:
+    inode_count = int(prop_dict["extfs_inode_count"])
+  else:
+    inode_count = _AddSpareInodes(inodes)
+
+  # The metadata size depends on the number of block groups, so iterate until
+  # the total number of blocks settles.
+  used_blocks = data_blocks
+  while True:
+    total_blocks = data_blocks + _GetExt4MetadataBlocks(
+        used_blocks, inode_count, inode_size, block_size)
+    if total_blocks <= used_blocks:
+      break
+    used_blocks = total_blocks
+
+  used_size = used_blocks * block_size
+  if used_size > size:
+    return None
+  reserved_size = int(prop_dict.get("partition_reserved_size", 0))
+  size = _TrimExt4Size(size, size - used_size, reserved_size, block_size)
+  return size, inode_count
+
+
 def BuildImage(in_dir, prop_dict, out_file, target_out=None):
   """Builds an image for the files under in_dir and writes it to out_file.
 
@@ -532,6 +779,8 @@ def BuildImage(in_dir, prop_dict, out_file, target_out=None):
   Raises:
     BuildImageError: On build image failures.
   """
+  origin_in = in_dir
+  origin_prop_dict = prop_dict.copy()
   in_dir, fs_config = SetUpInDirAndFsConfig(in_dir, prop_dict)
   SetUUIDIfNotExist(prop_dict)
 
@@ -550,6 +799,9 @@ def BuildImage(in_dir, prop_dict, out_file, target_out=None):
 
   disable_sparse = "disable_sparse" in prop_dict
   mkfs_output = None
+  size_estimated = False
+  # Statistics of in_dir, shared by sizing and reporting.
+  tree_stats = None
   if (prop_dict.get("use_dynamic_partition_size") == "true" and
           "partition_size" not in prop_dict):
     # If partition_size is not defined, use output of `du' + reserved_size.
@@ -564,57 +816,35 @@ def BuildImage(in_dir, prop_dict, out_file, target_out=None):
       else:
         size = GetDiskUsage(out_file)
     else:
-      size = GetDiskUsage(in_dir)
+      tree_stats = common.TreeStats(in_dir)
+      size = GetDiskUsage(in_dir, tree_stats)
     logger.info(
         "The tree size of %s is %d MB.", in_dir, size // BYTES_IN_MB)
     size = CalculateSizeAndReserved(prop_dict, size)
     # Round this up to a multiple of 4K so that avbtool works
     size = common.RoundUpTo4K(size)
     if fs_type.startswith("ext"):
-      prop_dict["partition_size"] = str(size)
-      prop_dict["image_size"] = str(size)
-      if "extfs_inode_count" not in prop_dict:
-        prop_dict["extfs_inode_count"] = str(GetInodeUsage(in_dir))
-      logger.info(
-          "First Pass based on estimates of %d MB and %s inodes.",
-          size // BYTES_IN_MB, prop_dict["extfs_inode_count"])
-      BuildImageMkfs(in_dir, prop_dict, out_file, target_out, fs_config)
-      sparse_image = False
-      if "extfs_sparse_flag" in prop_dict and not disable_sparse:
-        sparse_image = True
-      fs_dict = GetFilesystemCharacteristics(fs_type, out_file, sparse_image)
-      os.remove(out_file)
-      block_size = int(fs_dict.get("Block size", "4096"))
-      free_size = int(fs_dict.get("Free blocks", "0")) * block_size
-      reserved_size = int(prop_dict.get("partition_reserved_size", 0))
-      partition_headroom = int(fs_dict.get("partition_headroom", 0))
-      if fs_type.startswith("ext4") and partition_headroom > reserved_size:
-        reserved_size = partition_headroom
-      if free_size <= reserved_size:
+      estimator = prop_dict.get("ext4_size_estimator")
+      estimate = None
+      if estimator in ("true", "validate"):
+        estimate = EstimateExt4Size(tree_stats, prop_dict, fs_config, size)
+      if estimate and estimator == "true":
+        size, inodes = estimate
+        size_estimated = True
         logger.info(
-            "Not worth reducing image %d <= %d.", free_size, reserved_size)
+            "Skipping first pass based on estimates of %d MB and %d inodes.",
+            size // BYTES_IN_MB, inodes)
       else:
-        size -= free_size
-        size += reserved_size
-        if reserved_size == 0:
-          # add .3% margin
-          size = size * 1003 // 1000
-        # Use a minimum size, otherwise we will fail to calculate an AVB footer
-        # or fail to construct an ext4 image.
-        size = max(size, 256 * 1024)
-        if block_size <= 4096:
-          size = common.RoundUpTo4K(size)
-        else:
-          size = ((size + block_size - 1) // block_size) * block_size
-      extfs_inode_count = prop_dict["extfs_inode_count"]
-      inodes = int(fs_dict.get("Inode count", extfs_inode_count))
-      inodes -= int(fs_dict.get("Free inodes", "0"))
-      # add .2% margin or 1 inode, whichever is greater
-      spare_inodes = inodes * 2 // 1000
-      min_spare_inodes = 1
-      if spare_inodes < min_spare_inodes:
-        spare_inodes = min_spare_inodes
-      inodes += spare_inodes
+        size, inodes = CalculateExt4SizeWithFirstPass(
+            in_dir, prop_dict, out_file, target_out, fs_config, size,
+            tree_stats)
+        if estimate:
+          estimated_size, estimated_inodes = estimate
+          logger.info(
+              "Ext4 size estimate for %s: %d bytes (%+.2f%%), %d inodes "
+              "(%+d); first pass: %d bytes, %d inodes.", out_file,
+              estimated_size, (estimated_size - size) * 100.0 / size,
+              estimated_inodes, estimated_inodes - inodes, size, inodes)
       prop_dict["extfs_inode_count"] = str(inodes)
       prop_dict["partition_size"] = str(size)
       logger.info(
@@ -622,7 +852,8 @@ def BuildImage(in_dir, prop_dict, out_file, target_out=None):
     elif fs_type.startswith("f2fs") and prop_dict.get("f2fs_compress") == "true":
       prop_dict["partition_size"] = str(size)
       prop_dict["image_size"] = str(size)
-      BuildImageMkfs(in_dir, prop_dict, out_file, target_out, fs_config)
+      BuildImageMkfs(in_dir, prop_dict, out_file, target_out, fs_config,
+                     tree_stats)
       sparse_image = False
       if "f2fs_sparse_flag" in prop_dict and not disable_sparse:
         sparse_image = True
@@ -646,8 +877,24 @@ def BuildImage(in_dir, prop_dict, out_file, target_out=None):
     prop_dict["image_size"] = str(max_image_size)
 
   if not mkfs_output:
-    mkfs_output = BuildImageMkfs(
-        in_dir, prop_dict, out_file, target_out, fs_config)
+    try:
+      mkfs_output = BuildImageMkfs(
+          in_dir, prop_dict, out_file, target_out, fs_config, tree_stats)
+    except common.ExternalError:
+      if not size_estimated:
+        raise
+      # The estimate was too tight; start over with a first pass.
+      logger.warning(
+          "Failed to build %s with the estimated size, retrying with a first "
+          "pass.", out_file)
+      first_pass = prop_dict.get("first_pass")
+      prop_dict.clear()
+      prop_dict.update(origin_prop_dict)
+      if first_pass:
+        prop_dict["first_pass"] = first_pass
+      prop_dict["ext4_size_estimator"] = "false"
+      BuildImage(origin_in, prop_dict, out_file, target_out)
+      return
 
   # Update the image (eg filesystem size). This can be different eg if mkfs
   # rounds the requested size down due to alignment.
@@ -655,7 +902,7 @@ def BuildImage(in_dir, prop_dict, out_file, target_out=None):
 
   # Check if there's enough headroom space available for ext4 image.
   if "partition_headroom" in prop_dict and fs_type.startswith("ext4"):
-    CheckHeadroom(mkfs_output, prop_dict)
+    CheckHeadroom(mkfs_output, prop_dict, tree_stats)
 
   if not fs_spans_partition and verity_image_builder:
     verity_image_builder.PadSparseImage(out_file)
@@ -736,6 +983,7 @@ def ImagePropFromGlobalDict(glob_dict, mount_point):
       "avb_enable",
       "avb_avbtool",
       "use_dynamic_partition_size",
+      "ext4_size_estimator",
       "fingerprint",
       "timestamp",
   )
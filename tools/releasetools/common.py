@@ -336,6 +336,90 @@ def RoundUpTo4K(value):
   return rounded_up - (rounded_up % 4096)
 
 
+class TreeStats(object):
+  """Statistics of a file tree, collected in a single os.scandir() walk.
+
+  Attributes:
+    apparent_size: Apparent size in bytes of all the files, directories and
+        symlinks, counting hard-linked files once (as `du -b -s`).
+    allocated_size: Bytes allocated on the host filesystem (as `du -s`).
+    inodes: Number of entries, including the root (as `find -print`).
+    dir_sizes: Apparent size in bytes of each directory subtree, keyed by the
+        path relative to the root ('' for the root itself).
+    dir_entries: A list of (name, mode, size) for the entries of each
+        directory, keyed by the path relative to the root.
+  """
+
+  def __init__(self, path):
+    self.path = path
+    self.apparent_size = 0
+    self.allocated_size = 0
+    self.inodes = 0
+    self.dir_sizes = {}
+    self.dir_entries = {}
+    self._Collect()
+
+  def _Collect(self):
+    seen_links = set()
+
+    def _Account(st):
+      if st.st_nlink > 1 and not stat.S_ISDIR(st.st_mode):
+        key = (st.st_dev, st.st_ino)
+        if key in seen_links:
+          return 0
+        seen_links.add(key)
+      self.allocated_size += st.st_blocks * 512
+      return st.st_size
+
+    self.inodes = 1
+    st = os.lstat(self.path)
+    size = _Account(st)
+    if not stat.S_ISDIR(st.st_mode):
+      self.apparent_size = size
+      return
+
+    direct_sizes = {'': size}
+    dirs = ['']
+    while dirs:
+      rel_dir = dirs.pop()
+      entries = []
+      with os.scandir(os.path.join(self.path, rel_dir)) as it:
+        for entry in it:
+          st = entry.stat(follow_symlinks=False)
+          entries.append((entry.name, st.st_mode, st.st_size))
+          size = _Account(st)
+          self.inodes += 1
+          if stat.S_ISDIR(st.st_mode):
+            rel_path = os.path.join(rel_dir, entry.name)
+            direct_sizes[rel_path] = size
+            dirs.append(rel_path)
+          else:
+            direct_sizes[rel_dir] += size
+      self.dir_entries[rel_dir] = entries
+
+    # Roll the sizes up from the deepest directories.
+    for rel_dir in sorted(direct_sizes, key=lambda d: d.count(os.sep),
+                          reverse=True):
+      self.dir_sizes[rel_dir] = (direct_sizes[rel_dir] +
+                                 self.dir_sizes.get(rel_dir, 0))
+      if rel_dir:
+        parent = os.path.dirname(rel_dir)
+        self.dir_sizes[parent] = (self.dir_sizes.get(parent, 0) +
+                                  self.dir_sizes[rel_dir])
+    self.apparent_size = self.dir_sizes['']
+
+  @property
+  def disk_usage(self):
+    """The apparent size rounded up to 1K blocks, as `du -b -k -s`."""
+    return (self.apparent_size + 1023) // 1024 * 1024
+
+  def LargestDirs(self, count, depth=1):
+    """Returns the (path, size) of the largest directories at a given depth."""
+    dirs = [(d, size) for d, size in self.dir_sizes.items()
+            if d and d.count(os.sep) == depth - 1]
+    return sorted(dirs, key=lambda x: x[1], reverse=True)[:count]
+
+
 def CloseInheritedPipes():
   """ Gmake in MAC OS has file descriptor (PIPE) leak. We close those fds
   before doing other work."""
@@ -2182,6 +2266,46 @@ def UnzipSingleFile(input_zip: zipfile.ZipFile, info: zipfile.ZipInfo, dirname:
   return target
 
 
+def CompileFnmatchPatterns(patterns):
+  """Compiles a list of fnmatch patterns into a single regex.
+
+  The returned regex matches a name if fnmatch.fnmatch() matches the name
+  against any of the patterns. An empty list matches nothing.
+  """
+  if not patterns:
+    return re.compile(r'(?!)')
+  return re.compile('|'.join(fnmatch.translate(p) for p in patterns))
+
+
+def FixZip64HeaderOffsets(entries):
+  """Fixes up the header offsets of the ZipInfo entries of a zip64 archive."""
+  # b/283033491
+  # Per https://en.wikipedia.org/wiki/ZIP_(file_format)#Central_directory_file_header
+  # In zip64 mode, central directory record's header_offset field might be
+  # set to 0xFFFFFFFF if header offset is > 2^32. In this case, the extra
+  # fields will contain an 8 byte little endian integer at offset 20
+  # to indicate the actual local header offset.
+  # As of python3.11, python does not handle zip64 central directories
+  # correctly, so we will manually do the parsing here.
+
+  # ZIP64 central directory extra field has two required fields:
+  # 2 bytes header ID and 2 bytes size field. Thes two require fields have
+  # a total size of 4 bytes. Then it has three other 8 bytes field, followed
+  # by a 4 byte disk number field. The last disk number field is not required
+  # to be present, but if it is present, the total size of extra field will be
+  # divisible by 8(because 2+2+4+8*n is always going to be multiple of 8)
+  # Most extra fields are optional, but when they appear, their must appear
+  # in the order defined by zip64 spec. Since file header offset is the 2nd
+  # to last field in zip64 spec, it will only be at last 8 bytes or last 12-4
+  # bytes, depending on whether disk number is present.
+  for entry in entries:
+    if entry.header_offset == 0xFFFFFFFF:
+      if len(entry.extra) % 8 == 0:
+        entry.header_offset = int.from_bytes(entry.extra[-12:-4], "little")
+      else:
+        entry.header_offset = int.from_bytes(entry.extra[-8:], "little")
+
+
 def UnzipToDir(filename, dirname, patterns=None):
   """Unzips the archive to the given directory.
 
@@ -2195,43 +2319,26 @@ def UnzipToDir(filename, dirname, patterns=None):
   with zipfile.ZipFile(filename, allowZip64=True, mode="r") as input_zip:
     # Filter out non-matching patterns. unzip will complain otherwise.
     entries = input_zip.infolist()
-    # b/283033491
-    # Per https://en.wikipedia.org/wiki/ZIP_(file_format)#Central_directory_file_header
-    # In zip64 mode, central directory record's header_offset field might be
-    # set to 0xFFFFFFFF if header offset is > 2^32. In this case, the extra
-    # fields will contain an 8 byte little endian integer at offset 20
-    # to indicate the actual local header offset.
-    # As of python3.11, python does not handle zip64 central directories
-    # correctly, so we will manually do the parsing here.
-
-    # ZIP64 central directory extra field has two required fields:
-    # 2 bytes header ID and 2 bytes size field. Thes two require fields have
-    # a total size of 4 bytes. Then it has three other 8 bytes field, followed
-    # by a 4 byte disk number field. The last disk number field is not required
-    # to be present, but if it is present, the total size of extra field will be
-    # divisible by 8(because 2+2+4+8*n is always going to be multiple of 8)
-    # Most extra fields are optional, but when they appear, their must appear
-    # in the order defined by zip64 spec. Since file header offset is the 2nd
-    # to last field in zip64 spec, it will only be at last 8 bytes or last 12-4
-    # bytes, depending on whether disk number is present.
-    for entry in entries:
-      if entry.header_offset == 0xFFFFFFFF:
-        if len(entry.extra) % 8 == 0:
-          entry.header_offset = int.from_bytes(entry.extra[-12:-4], "little")
-        else:
-          entry.header_offset = int.from_bytes(entry.extra[-8:], "little")
+    FixZip64HeaderOffsets(entries)
     if patterns is not None:
-      filtered = [info for info in entries if any(
-          [fnmatch.fnmatch(info.filename, p) for p in patterns])]
+      # Match all the patterns in a single pass over the entries.
+      matcher = CompileFnmatchPatterns(patterns)
+      filtered = [info for info in entries if matcher.match(info.filename)]
 
       # There isn't any matching files. Don't unzip anything.
       if not filtered:
         return
-      for info in filtered:
-        UnzipSingleFile(input_zip, info, dirname)
     else:
-      for info in entries:
-        UnzipSingleFile(input_zip, info, dirname)
+      filtered = entries
+
+    # Create the directories upfront, so that multiple archives can be unzipped
+    # into the same dir concurrently.
+    for entry_dir in sorted(set(
+        os.path.dirname(info.filename) for info in filtered)):
+      if entry_dir:
+        os.makedirs(os.path.join(dirname, entry_dir), exist_ok=True)
+    for info in filtered:
+      UnzipSingleFile(input_zip, info, dirname)
 
 
 def UnzipTemp(filename, patterns=None):
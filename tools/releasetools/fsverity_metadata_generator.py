@@ -28,17 +28,36 @@ side backend of an authfs filesystem. `fd_server` uses this file in case when
 the underlying filesystem (ext4, etc.) on the device doesn't support the
 fsverity feature natively in which case the information is read directly from
 the filesystem using ioctl.
+
+With `--input-list`, metadata is generated for all the listed files in one
+process. Unsigned metadata is then computed in-process on a thread pool, and
+signed metadata still goes through the `fsverity` program, with the key
+converted only once.
 """
 
 import argparse
+import concurrent.futures
+import hashlib
 import os
 import re
 import shutil
 import subprocess
 import sys
 import tempfile
+import time
 from struct import *
 
+BLOCK_SIZE = 4096
+
+# From include/uapi/linux/fsverity.h
+FS_VERITY_HASH_ALGS = {
+    'sha256': 1,
+    'sha512': 2,
+}
+
+# Amount of file data read at once when computing merkle trees in-process.
+READ_CHUNK_SIZE = 256 * BLOCK_SIZE
+
 class TempDirectory(object):
   def __enter__(self):
     self.name = tempfile.mkdtemp()
@@ -70,6 +89,7 @@ class FSVerityMetadataGenerator:
   def set_signature(self, signature):
     self._signature = signature
 
+  @staticmethod
   def _raw_signature(pkcs7_sig_file):
     """ Extracts raw signature from DER formatted PKCS#7 detached signature file
 
@@ -104,17 +124,70 @@ class FSVerityMetadataGenerator:
     out = subprocess.check_output(cmd, universal_newlines=True).strip()
     return bytes(bytearray.fromhex(out))
 
-  def generate(self, input_file, output_file):
+  def _check_signing_args(self):
     if self._signature != 'none':
       if not self._key:
         raise RuntimeError("key must be specified.")
       if not self._cert:
         raise RuntimeError("cert must be specified.")
 
+  def _pem_key(self, work_dir):
+    """ Returns the signing key in PEM format, converting it if needed """
+    # If key is DER, convert DER private key to PEM
+    if self._key_format != 'der':
+      return self._key
+    pem_key = os.path.join(work_dir, 'key.pem')
+    key_cmd = ['openssl', 'pkcs8']
+    key_cmd.extend(['-inform', 'DER'])
+    key_cmd.extend(['-in', self._key])
+    key_cmd.extend(['-nocrypt'])
+    key_cmd.extend(['-out', pem_key])
+    subprocess.check_call(key_cmd)
+    return pem_key
+
+  def generate(self, input_file, output_file):
+    self._check_signing_args()
+
     with TempDirectory() as temp_dir:
-      self._do_generate(input_file, output_file, temp_dir)
+      pem_key = None
+      if self._signature != 'none':
+        pem_key = self._pem_key(temp_dir)
+      self._do_generate(input_file, output_file, temp_dir, pem_key)
+
+  def generate_batch(self, files, jobs=None):
+    """ Generates metadata for many files in one go
 
-  def _do_generate(self, input_file, output_file, work_dir):
+    Args:
+      files: a list of (input_file, output_file) tuples.
+      jobs: the number of worker threads. Defaults to the number of CPUs.
+    """
+    self._check_signing_args()
+
+    with TempDirectory() as temp_dir:
+      pem_key = None
+      if self._signature != 'none':
+        pem_key = self._pem_key(temp_dir)
+
+      def generate_one(input_file, output_file):
+        if self._signature == 'none':
+          self._do_generate_in_process(input_file, output_file)
+        else:
+          work_dir = tempfile.mkdtemp(dir=temp_dir)
+          self._do_generate(input_file, output_file, work_dir, pem_key)
+          shutil.rmtree(work_dir)
+
+      with concurrent.futures.ThreadPoolExecutor(
+          max_workers=jobs or os.cpu_count()) as executor:
+        futures = [executor.submit(generate_one, input_file, output_file)
+                   for input_file, output_file in files]
+        for future in futures:
+          future.result()
+
+  def _do_generate_in_process(self, input_file, output_file):
+    descriptor, merkle_tree = compute_merkle_tree(input_file, self._hash_alg)
+    self._write_metadata(output_file, descriptor, None, merkle_tree)
+
+  def _do_generate(self, input_file, output_file, work_dir, pem_key):
     # temporary files
     desc_file = os.path.join(work_dir, 'desc')
     merkletree_file = os.path.join(work_dir, 'merkletree')
@@ -129,34 +202,30 @@ class FSVerityMetadataGenerator:
       cmd.append('sign')
       cmd.append(input_file)
       cmd.append(sig_file)
-
-      # If key is DER, convert DER private key to PEM
-      if self._key_format == 'der':
-        pem_key = os.path.join(work_dir, 'key.pem')
-        key_cmd = ['openssl', 'pkcs8']
-        key_cmd.extend(['-inform', 'DER'])
-        key_cmd.extend(['-in', self._key])
-        key_cmd.extend(['-nocrypt'])
-        key_cmd.extend(['-out', pem_key])
-        subprocess.check_call(key_cmd)
-      else:
-        pem_key = self._key
-
       cmd.extend(['--key', pem_key])
       cmd.extend(['--cert', self._cert])
     cmd.extend(['--hash-alg', self._hash_alg])
-    cmd.extend(['--block-size', '4096'])
+    cmd.extend(['--block-size', str(BLOCK_SIZE)])
     cmd.extend(['--out-merkle-tree', merkletree_file])
     cmd.extend(['--out-descriptor', desc_file])
-    subprocess.check_call(cmd, stdout=open(os.devnull, 'w'))
-
+    with open(os.devnull, 'w') as devnull:
+      subprocess.check_call(cmd, stdout=devnull)
+
+    with open(desc_file, 'rb') as f:
+      descriptor = f.read()
+    with open(merkletree_file, 'rb') as f:
+      merkle_tree = f.read()
+    self._write_metadata(output_file, descriptor,
+                         None if self._signature == 'none' else sig_file,
+                         merkle_tree)
+
+  def _write_metadata(self, output_file, descriptor, sig_file, merkle_tree):
     with open(output_file, 'wb') as out:
       # 1. version
       out.write(pack('<I', 1))
 
       # 2. fsverity_descriptor
-      with open(desc_file, 'rb') as f:
-        out.write(f.read())
+      out.write(descriptor)
 
       # 3. signature
       SIG_TYPE_NONE = 0
@@ -178,17 +247,153 @@ class FSVerityMetadataGenerator:
         out.write(pack('<I', 0))
 
       # 4. merkle tree
-      with open(merkletree_file, 'rb') as f:
-        # merkle tree is placed at the next nearest page boundary to make
-        # mmapping possible
-        out.seek(next_page(out.tell()))
-        out.write(f.read())
+      # merkle tree is placed at the next nearest page boundary to make
+      # mmapping possible
+      out.seek(next_page(out.tell()))
+      out.write(merkle_tree)
+
+def _hash_blocks(hash_alg, data):
+  """ Returns the concatenated hashes of each (zero-padded) block of `data` """
+  hashes = []
+  for offset in range(0, len(data), BLOCK_SIZE):
+    block = data[offset:offset + BLOCK_SIZE]
+    h = hashlib.new(hash_alg, block)
+    if len(block) < BLOCK_SIZE:
+      h.update(bytes(BLOCK_SIZE - len(block)))
+    hashes.append(h.digest())
+  return b''.join(hashes)
+
+def compute_merkle_tree(input_file, hash_alg):
+  """ Computes the fsverity merkle tree of a file, like `fsverity digest`
+
+  Returns:
+    A tuple of the fsverity_descriptor and the merkle tree, in the formats
+    written by `fsverity digest --out-descriptor --out-merkle-tree`.
+  """
+  digest_size = hashlib.new(hash_alg).digest_size
+
+  # Hash the data blocks, reading the file in larger chunks.
+  data_hashes = []
+  data_size = 0
+  with open(input_file, 'rb') as f:
+    while True:
+      chunk = f.read(READ_CHUNK_SIZE)
+      if not chunk:
+        break
+      data_size += len(chunk)
+      data_hashes.append(_hash_blocks(hash_alg, memoryview(chunk)))
+  hashes = b''.join(data_hashes)
+
+  # Build the levels up from the leaves, until a single block remains. The
+  # tree is stored starting from the root level.
+  levels = []
+  if data_size == 0:
+    # Root hash of empty file is all 0's
+    root_hash = bytes(digest_size)
+  elif data_size <= BLOCK_SIZE:
+    root_hash = hashes
+  else:
+    while True:
+      level = hashes + bytes(-len(hashes) % BLOCK_SIZE)
+      levels.append(level)
+      hashes = _hash_blocks(hash_alg, memoryview(level))
+      if len(level) == BLOCK_SIZE:
+        root_hash = hashes
+        break
+  merkle_tree = b''.join(reversed(levels))
+
+  # struct fsverity_descriptor from include/uapi/linux/fsverity.h
+  descriptor = pack('<BBBBIQ64s32s144s',
+                    1,  # version
+                    FS_VERITY_HASH_ALGS[hash_alg],
+                    BLOCK_SIZE.bit_length() - 1,  # log_blocksize
+                    0,  # salt_size
+                    0,  # sig_size
+                    data_size,
+                    root_hash,
+                    b'',  # salt
+                    b'')  # reserved
+  return descriptor, merkle_tree
 
 def next_page(n):
   """ Returns the next nearest page boundary from `n` """
   PAGE_SIZE = 4096
   return (n + PAGE_SIZE - 1) // PAGE_SIZE * PAGE_SIZE
 
+def prepare_output(input_file, output_file):
+  """ Prepares `output_file` for `input_file`
+
+  Returns:
+    False if `input_file` is a symlink, in which case `output_file` is created
+    as a symlink to the metadata of its target. True otherwise.
+  """
+  # remove the output file first, as switching between a file and a symlink can be complicated
+  try:
+    os.remove(output_file)
+  except FileNotFoundError:
+    pass
+
+  if os.path.islink(input_file):
+    target = os.readlink(input_file) + '.fsv_meta'
+    os.symlink(target, output_file)
+    return False
+  return True
+
+def read_input_list(input_list):
+  """ Reads (input, output) pairs from a file with one input per line
+
+  A line may also hold the output path after the input, separated by a space.
+  Otherwise the output is <INPUT>.fsv_meta.
+  """
+  files = []
+  with open(input_list) as f:
+    for line in f:
+      fields = line.split()
+      if not fields:
+        continue
+      if len(fields) == 1:
+        fields.append(fields[0] + '.fsv_meta')
+      files.append((fields[0], fields[1]))
+  return files
+
+def benchmark(generator, args, files):
+  """ Compares --input-list against running this script once per file """
+  with TempDirectory() as temp_dir:
+    cli_files = []
+    batch_files = []
+    for i, (input_file, _) in enumerate(files):
+      cli_files.append((input_file, os.path.join(temp_dir, '%d.cli' % i)))
+      batch_files.append((input_file, os.path.join(temp_dir, '%d.batch' % i)))
+
+    start = time.monotonic()
+    for input_file, output_file in cli_files:
+      cmd = [sys.executable, os.path.abspath(__file__),
+             '--fsverity-path', args.fsverity_path,
+             '--signature', args.signature,
+             '--key-format', args.key_format,
+             '--hash-alg', args.hash_alg,
+             '--output', output_file, input_file]
+      if args.key:
+        cmd.extend(['--key', args.key, '--cert', args.cert])
+      subprocess.check_call(cmd)
+    cli_time = time.monotonic() - start
+
+    start = time.monotonic()
+    generator.generate_batch(batch_files, args.jobs)
+    batch_time = time.monotonic() - start
+
+    mismatches = 0
+    for (input_file, cli_output), (_, batch_output) in zip(cli_files,
+                                                           batch_files):
+      with open(cli_output, 'rb') as f1, open(batch_output, 'rb') as f2:
+        if f1.read() != f2.read():
+          print('Mismatching metadata for ' + input_file, file=sys.stderr)
+          mismatches += 1
+
+  print('%d files: per-file CLI %.3fs, batch %.3fs (%.1fx)' % (
+      len(files), cli_time, batch_time, cli_time / max(batch_time, 1e-9)))
+  return mismatches == 0
+
 if __name__ == '__main__':
   p = argparse.ArgumentParser()
   p.add_argument(
@@ -198,7 +403,24 @@ if __name__ == '__main__':
       default=None)
   p.add_argument(
       'input',
+      nargs='?',
       help='input file to be signed')
+  p.add_argument(
+      '--input-list',
+      help='file listing the input files to be signed, one per line, '
+      'optionally followed by the output file. Outputs default to '
+      '<INPUT>.fsv_meta')
+  p.add_argument(
+      '--jobs',
+      type=int,
+      default=None,
+      help='number of files processed in parallel with --input-list. '
+      'Default is the number of CPUs')
+  p.add_argument(
+      '--benchmark',
+      action='store_true',
+      help='with --input-list, compare the timing and output against running '
+      'this program once per file, without writing the outputs')
   p.add_argument(
       '--key-format',
       choices=['pem', 'der'],
@@ -226,20 +448,10 @@ if __name__ == '__main__':
       required=True)
   args = p.parse_args(sys.argv[1:])
 
-  output_file = args.output
-  if not output_file:
-    output_file = input_file + '.fsv_meta'
-
-  # remove the output file first, as switching between a file and a symlink can be complicated
-  try:
-    os.remove(output_file)
-  except FileNotFoundError:
-    pass
-
-  if os.path.islink(args.input):
-    target = os.readlink(args.input) + '.fsv_meta'
-    os.symlink(target, output_file)
-    sys.exit(0)
+  if bool(args.input) == bool(args.input_list):
+    raise ValueError("Exactly one of input and --input-list must be set")
+  if args.input_list and args.output:
+    raise ValueError("--output can't be used with --input-list")
 
   generator = FSVerityMetadataGenerator(args.fsverity_path)
   generator.set_signature(args.signature)
@@ -253,4 +465,21 @@ if __name__ == '__main__':
     generator.set_cert(args.cert)
   generator.set_key_format(args.key_format)
   generator.set_hash_alg(args.hash_alg)
+
+  if args.input_list:
+    files = read_input_list(args.input_list)
+    if args.benchmark:
+      files = [f for f in files if not os.path.islink(f[0])]
+      sys.exit(0 if benchmark(generator, args, files) else 1)
+    files = [f for f in files if prepare_output(*f)]
+    generator.generate_batch(files, args.jobs)
+    sys.exit(0)
+
+  output_file = args.output
+  if not output_file:
+    output_file = args.input + '.fsv_meta'
+
+  if not prepare_output(args.input, output_file):
+    sys.exit(0)
+
   generator.generate(args.input, output_file)
@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2026 The Android Open Source Project
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+#
+"""Writes the merged target files archive.
+
+Most of the files in a merged target files package are extracted unmodified
+from the framework and vendor packages. Instead of compressing all of them
+again, the entries of the files that are byte-identical to an entry of an input
+package are copied from there with their compressed data as is. Only the new
+or modified files get compressed, on a pool of threads.
+"""
+
+import collections
+import concurrent.futures
+import io
+import logging
+import os
+import stat
+import struct
+import tempfile
+import zipfile
+import zlib
+
+import common
+
+logger = logging.getLogger(__name__)
+
+# Use a fixed timestamp so the output is repeatable. This is the same one that
+# soong_zip uses.
+ZIP_TIMESTAMP = (2008, 1, 1, 0, 0, 0)
+
+# Amount of data read at once when comparing or compressing a file.
+READ_CHUNK_SIZE = 1024 * 1024
+
+# Compressed files up to this size are kept in memory until they're written.
+MAX_IN_MEMORY_SIZE = 1024 * 1024
+
+_LOCAL_FILE_HEADER_SIGNATURE = b'PK\x03\x04'
+_LOCAL_FILE_HEADER_SIZE = 30
+
+# The entry to write for an item, and a function that opens its data. The data
+# is zinfo.compress_size bytes, already compressed with zinfo.compress_type.
+# copied tells whether the data comes from one of the source zips.
+_PreparedEntry = collections.namedtuple('_PreparedEntry',
+                                        ['zinfo', 'open_data', 'copied'])
+
+
+def ListArchiveItems(source_dir):
+  """Lists the files and dirs under source_dir in archive order.
+
+  META/ and its contents come first, as in the target files packages from the
+  build system, which allows extracting them quickly. The rest follows in
+  sorted order.
+
+  Returns:
+    A list of paths relative to source_dir.
+  """
+  items = []
+  for root, dirs, files in os.walk(source_dir):
+    for name in dirs + files:
+      items.append(os.path.relpath(os.path.join(root, name), source_dir))
+  items.sort()
+  meta_items = [item for item in items
+                if item == 'META' or item.startswith('META/')]
+  other_items = [item for item in items
+                 if item != 'META' and not item.startswith('META/')]
+  return meta_items + other_items
+
+
+def _EntryDataEquals(input_file, data_offset, info, path):
+  """Returns whether the data of the entry in input_file is the file's data."""
+  if info.compress_type == zipfile.ZIP_DEFLATED:
+    decompressor = zlib.decompressobj(-15)
+  else:
+    decompressor = None
+  input_file.seek(data_offset)
+  remaining = info.compress_size
+  with open(path, 'rb') as f:
+    while remaining:
+      data = input_file.read(min(remaining, READ_CHUNK_SIZE))
+      if not data:
+        return False
+      remaining -= len(data)
+      if decompressor is None:
+        if f.read(len(data)) != data:
+          return False
+        continue
+      # Bound the size of the decompressed data, which may be much larger than
+      # the compressed one.
+      data = decompressor.decompress(data, READ_CHUNK_SIZE)
+      while True:
+        if f.read(len(data)) != data:
+          return False
+        if not decompressor.unconsumed_tail:
+          break
+        data = decompressor.decompress(decompressor.unconsumed_tail,
+                                       READ_CHUNK_SIZE)
+    if decompressor is not None:
+      data = decompressor.flush()
+      if f.read(len(data)) != data:
+        return False
+    return not f.read(1)
+
+
+def _GetDataOffset(input_file, info):
+  """Returns the offset of the compressed data of an entry in input_file.
+
+  Returns None if the local file header doesn't match the entry.
+  """
+  input_file.seek(info.header_offset)
+  header = input_file.read(_LOCAL_FILE_HEADER_SIZE)
+  if (len(header) != _LOCAL_FILE_HEADER_SIZE or
+      header[:4] != _LOCAL_FILE_HEADER_SIGNATURE):
+    return None
+  name_length, extra_length = struct.unpack('<HH', header[26:30])
+  return (info.header_offset + _LOCAL_FILE_HEADER_SIZE + name_length +
+          extra_length)
+
+
+class TargetFilesArchiveWriter(object):
+  """Writes a dir into a zip, reusing compressed data from source zips.
+
+  Attributes:
+    source_dir: The dir to be archived.
+    worker_threads: The number of threads that prepare the entries.
+    temp_dir: Where to keep the compressed data of large files until it's
+        written.
+    copied_entries: The number of entries copied from the source zips.
+    compressed_entries: The number of the other entries written.
+  """
+
+  def __init__(self, source_dir, source_zips, worker_threads=None,
+               temp_dir=None):
+    """Indexes the entries of source_zips, where source_dir files may be from.
+    """
+    self.source_dir = source_dir
+    self.temp_dir = temp_dir
+    self.worker_threads = worker_threads or os.cpu_count() or 1
+    self.copied_entries = 0
+    self.compressed_entries = 0
+
+    # Maps the entry names to the (source zip, ZipInfo) tuples.
+    self._source_entries = collections.defaultdict(list)
+    for source_zip in source_zips:
+      with zipfile.ZipFile(source_zip, allowZip64=True) as input_zip:
+        entries = input_zip.infolist()
+      common.FixZip64HeaderOffsets(entries)
+      for info in entries:
+        if info.compress_type in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+          self._source_entries[info.filename].append((source_zip, info))
+
+  def Write(self, output_zip, items=None):
+    """Writes the items under source_dir to output_zip.
+
+    Args:
+      output_zip: The name of the zip file to be created.
+      items: The paths to be archived relative to source_dir, in the order of
+          the entries. Defaults to ListArchiveItems(source_dir).
+    """
+    if items is None:
+      items = ListArchiveItems(self.source_dir)
+
+    # Prepare the entries ahead of the one being written, but only a few of
+    # them to bound the memory used by the compressed data.
+    max_pending = self.worker_threads * 4
+    with zipfile.ZipFile(output_zip, 'w', allowZip64=True) as output, \
+        concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.worker_threads) as executor:
+      pending = collections.deque()
+      for item in items:
+        pending.append(executor.submit(self._PrepareEntry, item))
+        if len(pending) >= max_pending:
+          self._WriteEntry(output, pending.popleft().result())
+      while pending:
+        self._WriteEntry(output, pending.popleft().result())
+
+  def _PrepareEntry(self, item):
+    path = os.path.join(self.source_dir, item)
+    st = os.lstat(path)
+
+    zinfo = zipfile.ZipInfo(item, ZIP_TIMESTAMP)
+    zinfo.external_attr = (st.st_mode & 0xFFFF) << 16
+    if stat.S_ISDIR(st.st_mode):
+      zinfo.filename += '/'
+      zinfo.external_attr |= 0x10  # MS-DOS directory flag
+      return self._StoredEntry(zinfo, b'')
+    if stat.S_ISLNK(st.st_mode):
+      return self._StoredEntry(zinfo, os.readlink(path).encode())
+
+    entry = self._CopiedEntry(zinfo, path, st.st_size)
+    if entry:
+      return entry
+    return self._CompressedEntry(zinfo, path, st.st_size)
+
+  @staticmethod
+  def _StoredEntry(zinfo, data):
+    zinfo.compress_type = zipfile.ZIP_STORED
+    zinfo.file_size = zinfo.compress_size = len(data)
+    zinfo.CRC = zlib.crc32(data)
+    return _PreparedEntry(zinfo, lambda: io.BytesIO(data), False)
+
+  def _CopiedEntry(self, zinfo, path, file_size):
+    """Returns the entry copied from a source zip, if there's a matching one."""
+    candidates = [(source_zip, info)
+                  for source_zip, info in self._source_entries.get(
+                      zinfo.filename, [])
+                  if info.file_size == file_size]
+    if not candidates:
+      return None
+
+    # Compare the data itself rather than its CRC-32, so that a modified file
+    # is never replaced with the data of a different one.
+    for source_zip, info in candidates:
+      with open(source_zip, 'rb') as input_file:
+        data_offset = _GetDataOffset(input_file, info)
+        if data_offset is None:
+          logger.warning('Failed to locate %s in %s', info.filename,
+                         source_zip)
+          continue
+        if not _EntryDataEquals(input_file, data_offset, info, path):
+          continue
+
+      zinfo.compress_type = info.compress_type
+      zinfo.file_size = file_size
+      zinfo.compress_size = info.compress_size
+      zinfo.CRC = info.CRC
+
+      def OpenData(source_zip=source_zip, data_offset=data_offset):
+        input_file = open(source_zip, 'rb')
+        input_file.seek(data_offset)
+        return input_file
+
+      return _PreparedEntry(zinfo, OpenData, True)
+    return None
+
+  def _CompressedEntry(self, zinfo, path, file_size):
+    compressor = zlib.compressobj(
+        zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    compressed = tempfile.SpooledTemporaryFile(
+        max_size=MAX_IN_MEMORY_SIZE, dir=self.temp_dir)
+    crc = 0
+    with open(path, 'rb') as f:
+      while True:
+        data = f.read(READ_CHUNK_SIZE)
+        if not data:
+          break
+        crc = zlib.crc32(data, crc)
+        compressed.write(compressor.compress(data))
+    compressed.write(compressor.flush())
+
+    zinfo.file_size = file_size
+    zinfo.CRC = crc
+    zinfo.compress_size = compressed.tell()
+    # Store the file as is if it doesn't compress.
+    if zinfo.compress_size >= file_size:
+      compressed.close()
+      zinfo.compress_type = zipfile.ZIP_STORED
+      zinfo.compress_size = file_size
+      return _PreparedEntry(zinfo, lambda: open(path, 'rb'), False)
+
+    zinfo.compress_type = zipfile.ZIP_DEFLATED
+
+    def OpenData():
+      compressed.seek(0)
+      return compressed
+
+    return _PreparedEntry(zinfo, OpenData, False)
+
+  def _WriteEntry(self, output, entry):
+    """Writes the entry with its data as is into the output ZipFile."""
+    zinfo = entry.zinfo
+    zip64 = (zinfo.file_size > zipfile.ZIP64_LIMIT or
+             zinfo.compress_size > zipfile.ZIP64_LIMIT)
+    zinfo.header_offset = output.fp.tell()
+    output.fp.write(zinfo.FileHeader(zip64))
+    with entry.open_data() as data:
+      remaining = zinfo.compress_size
+      while remaining:
+        chunk = data.read(min(remaining, READ_CHUNK_SIZE))
+        if not chunk:
+          raise IOError('Unexpected end of data for %s' % zinfo.filename)
+        output.fp.write(chunk)
+        remaining -= len(chunk)
+
+    # Register the entry like ZipFile.write() does, so that it ends up in the
+    # central directory.
+    output.filelist.append(zinfo)
+    output.NameToInfo[zinfo.filename] = zinfo
+    output.start_dir = output.fp.tell()
+    output._didModify = True  # pylint: disable=protected-access
+
+    if entry.copied:
+      self.copied_entries += 1
+    else:
+      self.compressed_entries += 1
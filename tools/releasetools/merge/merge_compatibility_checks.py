@@ -16,9 +16,11 @@
 #
 """Compatibility checks that should be performed on merged target_files."""
 
+import concurrent.futures
 import json
 import logging
 import os
+import time
 from xml.etree import ElementTree
 
 import apex_utils
@@ -33,24 +35,55 @@ OPTIONS = common.OPTIONS
 def CheckCompatibility(target_files_dir, partition_map):
   """Runs various compatibility checks.
 
+  The checks are independent of each other and mostly wait on host tools
+  (checkvintf, host_init_verifier, secilc), so they run concurrently.
+
   Returns a possibly-empty list of error messages.
   """
-  errors = []
-
-  errors.extend(CheckVintf(target_files_dir))
-  errors.extend(CheckShareduidViolation(target_files_dir, partition_map))
-  errors.extend(CheckApexDuplicatePackages(target_files_dir, partition_map))
-
-  # The remaining checks only use the following partitions:
-  partition_map = {
+  # The init.rc and sepolicy checks only use the following partitions:
+  core_partition_map = {
       partition: path
       for partition, path in partition_map.items()
       if partition in ('system', 'system_ext', 'product', 'vendor', 'odm')
   }
 
-  errors.extend(CheckInitRcFiles(target_files_dir, partition_map))
-  errors.extend(CheckCombinedSepolicy(target_files_dir, partition_map))
+  return RunChecks([
+      (CheckVintf, (target_files_dir,)),
+      (CheckShareduidViolation, (target_files_dir, partition_map)),
+      (CheckApexDuplicatePackages, (target_files_dir, partition_map)),
+      (CheckInitRcFiles, (target_files_dir, core_partition_map)),
+      (CheckCombinedSepolicy, (target_files_dir, core_partition_map)),
+  ])
+
+
+def RunChecks(checks):
+  """Runs the given checks on a thread pool and logs the time each one took.
 
+  Args:
+    checks: A list of (check, args) tuples, where check(*args) returns a
+      possibly-empty list of error messages.
+
+  Returns:
+    The errors of all the checks, in the order of the checks regardless of
+    which one finishes first.
+  """
+
+  def RunCheck(check, args):
+    start_time = time.time()
+    try:
+      return check(*args)
+    finally:
+      logger.info('%s took %.1fs', check.__name__, time.time() - start_time)
+
+  start_time = time.time()
+  errors = []
+  with concurrent.futures.ThreadPoolExecutor(
+      max_workers=max(len(checks), 1)) as executor:
+    futures = [executor.submit(RunCheck, check, args) for check, args in checks]
+    for future in futures:
+      errors.extend(future.result())
+  logger.info('Ran %d compatibility checks in %.1fs', len(checks),
+              time.time() - start_time)
   return errors
 
 
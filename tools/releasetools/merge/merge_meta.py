@@ -333,5 +333,8 @@ def UpdateCareMapImageSizeProps(images_dir):
       image_props = build_image.ImagePropFromGlobalDict(
           OPTIONS.merged_misc_info, partition)
       verity_image_builder = verity_utils.CreateVerityImageBuilder(image_props)
+      # As in add_img_to_target_files, only the images with verity have a size.
+      if not verity_image_builder:
+        continue
       image_size = verity_image_builder.CalculateMaxImageSize(partition_size)
       OPTIONS.merged_misc_info['{}_image_size'.format(partition)] = image_size
@@ -114,11 +114,12 @@ Usage: merge_target_files [args]
       If provided, the location of vendor's dexpreopt_config.zip.
 """
 
+import concurrent.futures
 import logging
 import os
 import shutil
-import subprocess
 import sys
+import time
 import zipfile
 
 import add_img_to_target_files
@@ -126,6 +127,7 @@ import build_image
 import build_super_image
 import common
 import img_from_target_files
+import merge_archive
 import merge_compatibility_checks
 import merge_dexopt
 import merge_meta
@@ -211,20 +213,41 @@ def create_merged_package(temp_dir):
   # items do not need special case processing.
 
   output_target_files_temp_dir = os.path.join(temp_dir, 'output')
-  merge_utils.CollectTargetFiles(
-      input_zipfile_or_dir=OPTIONS.framework_target_files,
-      output_dir=output_target_files_temp_dir,
-      item_list=OPTIONS.framework_item_list)
-  merge_utils.CollectTargetFiles(
-      input_zipfile_or_dir=OPTIONS.vendor_target_files,
-      output_dir=output_target_files_temp_dir,
-      item_list=OPTIONS.vendor_item_list)
 
-  if OPTIONS.boot_image_dir_path:
+  def CollectInput(name, input_zipfile_or_dir, item_list):
+    start_time = time.time()
     merge_utils.CollectTargetFiles(
-        input_zipfile_or_dir=OPTIONS.boot_image_dir_path,
+        input_zipfile_or_dir=input_zipfile_or_dir,
         output_dir=output_target_files_temp_dir,
-        item_list=['IMAGES/boot.img'])
+        item_list=item_list)
+    logger.info('Collected %s items from %s in %.1fs', name,
+                input_zipfile_or_dir, time.time() - start_time)
+
+  # ValidateConfigLists only checks that no partition comes from both inputs,
+  # other items may still be in both item lists. In that case the vendor items
+  # override the framework ones, so the inputs are collected one after the
+  # other, otherwise they are collected concurrently.
+  if merge_utils.ItemListsMayOverlap(OPTIONS.framework_item_list,
+                                     OPTIONS.vendor_item_list):
+    max_workers = 1
+  else:
+    max_workers = 2
+  with concurrent.futures.ThreadPoolExecutor(
+      max_workers=max_workers) as executor:
+    futures = [
+        executor.submit(CollectInput, 'framework',
+                        OPTIONS.framework_target_files,
+                        OPTIONS.framework_item_list),
+        executor.submit(CollectInput, 'vendor', OPTIONS.vendor_target_files,
+                        OPTIONS.vendor_item_list),
+    ]
+    for future in futures:
+      future.result()
+
+  # The boot image overrides the one from the inputs, if any.
+  if OPTIONS.boot_image_dir_path:
+    CollectInput('boot image', OPTIONS.boot_image_dir_path,
+                 ['IMAGES/boot.img'])
 
   # Perform special case processing on META/* items.
   # After this function completes successfully, all the files we need to create
@@ -403,49 +426,32 @@ def generate_super_empty_image(target_dir, output_super_empty):
 def create_target_files_archive(output_zip, source_dir, temp_dir):
   """Creates a target_files zip archive from the input source dir.
 
+  META content appears first in the zip, as in the target files packages from
+  the build system. Files that are unmodified from the input target files
+  packages keep their compressed data from there, while the other files are
+  compressed in parallel.
+
   Args:
     output_zip: The name of the zip archive target files package.
     source_dir: The target directory contains package to be archived.
-    temp_dir: Path to temporary directory for any intermediate files.
+    temp_dir: Path to temporary directory for the compressed files.
   """
-  output_target_files_list = os.path.join(temp_dir, 'output.list')
-  output_target_files_meta_dir = os.path.join(source_dir, 'META')
-
-  def files_from_path(target_path, extra_args=None):
-    """Gets files under the given path and return a sorted list."""
-    find_command = ['find', target_path] + (extra_args or [])
-    find_process = common.Run(
-        find_command, stdout=subprocess.PIPE, verbose=False)
-    return common.RunAndCheckOutput(['sort'],
-                                    stdin=find_process.stdout,
-                                    verbose=False)
-
-  # META content appears first in the zip. This is done by the
-  # standard build system for optimized extraction of those files,
-  # so we do the same step for merged target_files.zips here too.
-  meta_content = files_from_path(output_target_files_meta_dir)
-  other_content = files_from_path(
-      source_dir,
-      ['-path', output_target_files_meta_dir, '-prune', '-o', '-print'])
-
-  with open(output_target_files_list, 'w') as f:
-    f.write(meta_content)
-    f.write(other_content)
-
-  command = [
-      'soong_zip',
-      '-d',
-      '-o',
-      os.path.abspath(output_zip),
-      '-C',
-      source_dir,
-      '-r',
-      output_target_files_list,
+  source_zips = [
+      target_files
+      for target_files in (OPTIONS.framework_target_files,
+                           OPTIONS.vendor_target_files)
+      if zipfile.is_zipfile(target_files)
   ]
 
   logger.info('creating %s', output_zip)
-  common.RunAndCheckOutput(command, verbose=True)
-  logger.info('finished creating %s', output_zip)
+  start_time = time.time()
+  writer = merge_archive.TargetFilesArchiveWriter(
+      source_dir, source_zips, temp_dir=temp_dir)
+  writer.Write(os.path.abspath(output_zip))
+  logger.info(
+      'finished creating %s in %.1fs: %d entries copied from the inputs, %d '
+      'compressed', output_zip, time.time() - start_time,
+      writer.copied_entries, writer.compressed_entries)
 
 
 def merge_target_files(temp_dir):
@@ -491,9 +497,11 @@ def merge_target_files(temp_dir):
   # Finally, create the output target files zip archive and/or copy the
   # output items to the output target files directory.
 
+  # The temp dir isn't modified from here on, so the output items can be hard
+  # links to its files.
   if OPTIONS.output_dir:
     merge_utils.CopyItems(output_target_files_temp_dir, OPTIONS.output_dir,
-                          OPTIONS.output_item_list)
+                          OPTIONS.output_item_list, hard_link=True)
 
   if not OPTIONS.output_target_files:
     return
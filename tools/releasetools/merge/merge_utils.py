@@ -19,11 +19,14 @@
 Expects items in OPTIONS prepared by merge_target_files.py.
 """
 
+import concurrent.futures
+import fcntl
 import fnmatch
 import logging
 import os
 import re
 import shutil
+import sys
 import zipfile
 
 import common
@@ -31,58 +34,125 @@ import common
 logger = logging.getLogger(__name__)
 OPTIONS = common.OPTIONS
 
+# The FICLONE ioctl from linux/fs.h, which makes a file share the blocks of
+# another one (reflink).
+_FICLONE = 0x40049409
+
 
 def ExtractItems(input_zip, output_dir, extract_item_list):
-  """Extracts items in extract_item_list from a zip to a dir."""
+  """Extracts items in extract_item_list from a zip to a dir.
+
+  Patterns in extract_item_list that match no item in the zip file are ignored.
+  It's safe to extract other zips into the same output_dir concurrently.
+  """
+  common.UnzipToDir(input_zip, output_dir, extract_item_list)
 
-  # Filter the extract_item_list to remove any items that do not exist in the
-  # zip file. Otherwise, the extraction step will fail.
 
-  with zipfile.ZipFile(input_zip, allowZip64=True) as input_zipfile:
-    input_namelist = input_zipfile.namelist()
+def _PatternDirPrefix(pattern):
+  """Returns the dir that all the paths matching the fnmatch pattern are under.
 
-  filtered_extract_item_list = []
-  for pattern in extract_item_list:
-    if fnmatch.filter(input_namelist, pattern):
-      filtered_extract_item_list.append(pattern)
+  For example, 'SYSTEM/*' and 'SYSTEM/bin/s?' give 'SYSTEM/' and 'SYSTEM/bin/',
+  while '*.txt' gives '', since '*' also matches '/'.
+  """
+  wildcard = re.search(r'[*?[]', pattern)
+  literal = pattern[:wildcard.start()] if wildcard else pattern
+  return literal[:literal.rfind('/') + 1]
 
-  common.UnzipToDir(input_zip, output_dir, filtered_extract_item_list)
 
+def _ListMatchingItems(from_dir, copy_item_list):
+  """Lists the items under from_dir that match any of copy_item_list.
 
-def CopyItems(from_dir, to_dir, copy_item_list):
+  Only walks into the dirs that may contain matching items.
+
+  Returns:
+    A list of (relative path, os.DirEntry) tuples, with the parent dirs listed
+    before their contents.
+  """
+  matcher = common.CompileFnmatchPatterns(copy_item_list)
+  prefixes = set(_PatternDirPrefix(pattern) for pattern in copy_item_list)
+
+  def ShouldWalk(dir_prefix):
+    return any(
+        prefix.startswith(dir_prefix) or dir_prefix.startswith(prefix)
+        for prefix in prefixes)
+
+  items = []
+  dirs_to_walk = ['']
+  while dirs_to_walk:
+    dir_prefix = dirs_to_walk.pop()
+    with os.scandir(os.path.join(from_dir, dir_prefix)) as it:
+      for entry in it:
+        item = dir_prefix + entry.name
+        if matcher.match(item):
+          items.append((item, entry))
+        if (entry.is_dir(follow_symlinks=False) and
+            ShouldWalk(item + '/')):
+          dirs_to_walk.append(item + '/')
+  items.sort(key=lambda item: item[0])
+  return items
+
+
+def _CloneFile(original_path, copied_path):
+  """Copies a file, sharing its blocks (reflink) if the filesystem allows."""
+  if sys.platform.startswith('linux'):
+    with open(original_path, 'rb') as src, open(copied_path, 'wb') as dst:
+      try:
+        fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+        return
+      except OSError:
+        # Not supported by the filesystem. Fall back to copying.
+        pass
+  shutil.copyfile(original_path, copied_path)
+
+
+def CopyItems(from_dir, to_dir, copy_item_list, hard_link=False,
+              worker_threads=None):
   """Copies the items in copy_item_list from source to destination directory.
 
   copy_item_list may include files and directories. Will copy the matched
-  files and create the matched directories.
+  files and create the matched directories. Files are copied on a thread pool,
+  sharing their blocks with the originals where the filesystem supports it.
 
   Args:
     from_dir: The source directory.
     to_dir: The destination directory.
     copy_item_list: Items to be copied.
+    hard_link: Whether to hard-link the files rather than copying them, when
+      from_dir and to_dir are on the same filesystem. The files then must not
+      be modified in place on either side.
+    worker_threads: The number of threads that copy the files. Defaults to the
+      number of CPUs.
   """
-  item_paths = []
-  for root, dirs, files in os.walk(from_dir):
-    item_paths.extend(
-        os.path.relpath(path=os.path.join(root, item_name), start=from_dir)
-        for item_name in files + dirs)
-
-  filtered = set()
-  for pattern in copy_item_list:
-    filtered.update(fnmatch.filter(item_paths, pattern))
-
-  for item in filtered:
-    original_path = os.path.join(from_dir, item)
+  files = []
+  for item, entry in _ListMatchingItems(from_dir, copy_item_list):
+    original_path = entry.path
     copied_path = os.path.join(to_dir, item)
     copied_parent_path = os.path.dirname(copied_path)
-    if not os.path.exists(copied_parent_path):
-      os.makedirs(copied_parent_path)
-    if os.path.islink(original_path):
+    # Other inputs may be copied into to_dir concurrently.
+    os.makedirs(copied_parent_path, exist_ok=True)
+    if entry.is_symlink():
       os.symlink(os.readlink(original_path), copied_path)
-    elif os.path.isdir(original_path):
-      if not os.path.exists(copied_path):
-        os.makedirs(copied_path)
+    elif entry.is_dir():
+      os.makedirs(copied_path, exist_ok=True)
     else:
-      shutil.copyfile(original_path, copied_path)
+      files.append((original_path, copied_path))
+
+  def CopyFile(original_path, copied_path):
+    if hard_link:
+      try:
+        os.link(original_path, copied_path)
+        return
+      except OSError:
+        # Most likely on different filesystems. Fall back to copying.
+        pass
+    _CloneFile(original_path, copied_path)
+
+  with concurrent.futures.ThreadPoolExecutor(
+      max_workers=worker_threads or os.cpu_count()) as executor:
+    futures = [executor.submit(CopyFile, original_path, copied_path)
+               for original_path, copied_path in files]
+    for future in futures:
+      future.result()
 
 
 def GetTargetFilesItems(target_files_zipfile_or_dir):
@@ -174,6 +244,32 @@ def ValidateConfigLists():
   return not has_error
 
 
+def _MayMatchSamePath(pattern1, pattern2):
+  """Returns whether a path may match both fnmatch patterns."""
+  wildcard1 = re.search(r'[*?[]', pattern1)
+  wildcard2 = re.search(r'[*?[]', pattern2)
+  if not wildcard1:
+    return fnmatch.fnmatchcase(pattern1, pattern2)
+  if not wildcard2:
+    return fnmatch.fnmatchcase(pattern2, pattern1)
+  literal1 = pattern1[:wildcard1.start()]
+  literal2 = pattern2[:wildcard2.start()]
+  return literal1.startswith(literal2) or literal2.startswith(literal1)
+
+
+def ItemListsMayOverlap(item_list1, item_list2):
+  """Returns whether an item of each list may match the same path.
+
+  The check is conservative: it may return True for patterns that can't match
+  the same path, like 'SYSTEM/*.so' and 'SYSTEM/*.txt'. An empty item list
+  matches all paths, as in CollectTargetFiles.
+  """
+  return any(
+      _MayMatchSamePath(pattern1, pattern2)
+      for pattern1 in item_list1 or ('*',)
+      for pattern2 in item_list2 or ('*',))
+
+
 # In an item list (framework or vendor), we may see entries that select whole
 # partitions. Such an entry might look like this 'SYSTEM/*' (e.g., for the
 # system partition). The following regex matches this and extracts the
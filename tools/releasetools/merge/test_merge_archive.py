@@ -0,0 +1,132 @@
+#
+# Copyright (C) 2026 The Android Open Source Project
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import os.path
+import zipfile
+
+import common
+import merge_archive
+import test_utils
+
+
+class MergeArchiveTest(test_utils.ReleaseToolsTestCase):
+
+  @staticmethod
+  def _write_file(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+      f.write(data)
+
+  def _create_source_zip(self, entries):
+    source_zip = common.MakeTempFile(suffix='.zip')
+    with zipfile.ZipFile(source_zip, 'w', allowZip64=True) as zfp:
+      for name, data, compress_type in entries:
+        zfp.writestr(name, data, compress_type=compress_type)
+    return source_zip
+
+  def test_ListArchiveItems_MetaFirst(self):
+    source_dir = common.MakeTempDir()
+    for name in ('IMAGES/system.img', 'META/misc_info.txt', 'META-INF/foo',
+                 'SYSTEM/bin/sh', 'ANDROID/x'):
+      self._write_file(os.path.join(source_dir, name), b'')
+    self.assertEqual(
+        ['META', 'META/misc_info.txt', 'ANDROID', 'ANDROID/x', 'IMAGES',
+         'IMAGES/system.img', 'META-INF', 'META-INF/foo', 'SYSTEM',
+         'SYSTEM/bin', 'SYSTEM/bin/sh'],
+        merge_archive.ListArchiveItems(source_dir))
+
+  def test_Write(self):
+    unchanged = b'unchanged' * 10000
+    source_zip = self._create_source_zip([
+        ('SYSTEM/unchanged', unchanged, zipfile.ZIP_DEFLATED),
+        ('SYSTEM/stored', b'stored' * 1000, zipfile.ZIP_STORED),
+        ('SYSTEM/modified', b'original' * 1000, zipfile.ZIP_DEFLATED),
+        ('META/misc_info.txt', b'a=b\n', zipfile.ZIP_DEFLATED),
+    ])
+    source_dir = common.MakeTempDir()
+    common.UnzipToDir(source_zip, source_dir)
+    self._write_file(os.path.join(source_dir, 'SYSTEM/modified'),
+                     b'modified' * 1000)
+    self._write_file(os.path.join(source_dir, 'VENDOR/new'), b'new' * 1000)
+    self._write_file(os.path.join(source_dir, 'VENDOR/random'),
+                     os.urandom(4096))
+    os.symlink('new', os.path.join(source_dir, 'VENDOR/link'))
+
+    output_zip = common.MakeTempFile(suffix='.zip')
+    writer = merge_archive.TargetFilesArchiveWriter(
+        source_dir, [source_zip], worker_threads=2)
+    writer.Write(output_zip)
+
+    with zipfile.ZipFile(source_zip) as source, \
+        zipfile.ZipFile(output_zip) as output:
+      self.assertIsNone(output.testzip())
+      self.assertEqual(
+          ['META/', 'META/misc_info.txt', 'SYSTEM/', 'SYSTEM/modified',
+           'SYSTEM/stored', 'SYSTEM/unchanged', 'VENDOR/', 'VENDOR/link',
+           'VENDOR/new', 'VENDOR/random'],
+          output.namelist())
+
+      for name in output.namelist():
+        if name.endswith('/') or name == 'VENDOR/link':
+          continue
+        with open(os.path.join(source_dir, name), 'rb') as f:
+          self.assertEqual(f.read(), output.read(name))
+
+      # The unmodified files keep their compressed data.
+      for name in ('META/misc_info.txt', 'SYSTEM/stored', 'SYSTEM/unchanged'):
+        source_info = source.getinfo(name)
+        output_info = output.getinfo(name)
+        self.assertEqual(source_info.compress_type, output_info.compress_type)
+        self.assertEqual(source_info.compress_size, output_info.compress_size)
+      self.assertEqual(zipfile.ZIP_DEFLATED,
+                       output.getinfo('SYSTEM/modified').compress_type)
+      self.assertEqual(zipfile.ZIP_STORED,
+                       output.getinfo('VENDOR/random').compress_type)
+
+      link_info = output.getinfo('VENDOR/link')
+      self.assertTrue(link_info.external_attr >> 16 & 0o120000)
+      self.assertEqual(b'new', output.read(link_info))
+
+    self.assertEqual(3, writer.copied_entries)
+    self.assertEqual(7, writer.compressed_entries)
+
+    # Unzipping the archive gives the same tree back.
+    unzipped_dir = common.MakeTempDir()
+    common.UnzipToDir(output_zip, unzipped_dir)
+    self.assertEqual('new',
+                     os.readlink(os.path.join(unzipped_dir, 'VENDOR/link')))
+    self.assertEqual(merge_archive.ListArchiveItems(source_dir),
+                     merge_archive.ListArchiveItems(unzipped_dir))
+
+  def test_Write_SameSizeAndCrc32(self):
+    # b'plumless' and b'buckeroo' have the same CRC-32.
+    source_zip = self._create_source_zip([
+        ('SYSTEM/stored', b'plumless' * 1000, zipfile.ZIP_STORED),
+        ('SYSTEM/deflated', b'plumless' * 1000, zipfile.ZIP_DEFLATED),
+    ])
+    source_dir = common.MakeTempDir()
+    for name in ('SYSTEM/stored', 'SYSTEM/deflated'):
+      self._write_file(os.path.join(source_dir, name), b'buckeroo' * 1000)
+
+    output_zip = common.MakeTempFile(suffix='.zip')
+    writer = merge_archive.TargetFilesArchiveWriter(source_dir, [source_zip])
+    writer.Write(output_zip, ['SYSTEM/stored', 'SYSTEM/deflated'])
+
+    with zipfile.ZipFile(output_zip) as output:
+      self.assertEqual(b'buckeroo' * 1000, output.read('SYSTEM/stored'))
+      self.assertEqual(b'buckeroo' * 1000, output.read('SYSTEM/deflated'))
+    self.assertEqual(0, writer.copied_entries)
@@ -16,6 +16,7 @@
 
 import os.path
 import shutil
+import threading
 
 import common
 import merge_compatibility_checks
@@ -112,3 +113,27 @@ class MergeCompatibilityChecksTest(test_utils.ReleaseToolsTestCase):
             output_dir, self.partition_map)[0],
         'Duplicate APEX package_names found in multiple partitions: com.android.wifi'
     )
+
+  def test_RunChecks_ReturnsErrorsInOrder(self):
+    # The first check only finishes after the second one has started, so they
+    # must run concurrently.
+    second_started = threading.Event()
+
+    def first_check(name):
+      self.assertTrue(second_started.wait(10))
+      return ['%s error' % name]
+
+    def second_check(name):
+      second_started.set()
+      return ['%s error 1' % name, '%s error 2' % name]
+
+    def passing_check():
+      return []
+
+    errors = merge_compatibility_checks.RunChecks([
+        (first_check, ('first',)),
+        (passing_check, ()),
+        (second_check, ('second',)),
+    ])
+    self.assertEqual(
+        ['first error', 'second error 1', 'second error 2'], errors)
@@ -16,11 +16,13 @@
 
 import os.path
 import shutil
+from unittest import mock
 
 import common
 import merge_meta
 import merge_target_files
 import test_utils
+import verity_utils
 
 
 class MergeMetaTest(test_utils.ReleaseToolsTestCase):
@@ -108,3 +110,25 @@ class MergeMetaTest(test_utils.ReleaseToolsTestCase):
       output_entries = f.read().split('\n')
 
     return self.assertEqual(merged_entries, output_entries)
+
+  def test_UpdateCareMapImageSizeProps_SkipsImagesWithoutVerity(self):
+    images_dir = common.MakeTempDir()
+    for partition in ('system', 'vendor'):
+      with open(os.path.join(images_dir, partition + '.img'), 'wb') as f:
+        f.write(b'\0' * 4096 * 4)
+    self.OPTIONS.merged_misc_info = {
+        'avb_enable': 'true',
+        'avb_avbtool': 'avbtool',
+        'avb_vendor_hashtree_enable': 'true',
+        'avb_vendor_add_hashtree_footer_args': '',
+    }
+
+    with mock.patch.object(
+        verity_utils.VerifiedBootVersion2VerityImageBuilder,
+        'CalculateMaxImageSize',
+        return_value=4096 * 3):
+      merge_meta.UpdateCareMapImageSizeProps(images_dir)
+
+    self.assertNotIn('system_image_size', self.OPTIONS.merged_misc_info)
+    self.assertEqual(self.OPTIONS.merged_misc_info['vendor_image_size'],
+                     4096 * 3)
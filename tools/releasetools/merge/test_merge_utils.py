@@ -14,7 +14,9 @@
 # limitations under the License.
 #
 
+import concurrent.futures
 import os.path
+import zipfile
 
 import common
 import merge_target_files
@@ -89,6 +91,83 @@ class MergeUtilsTest(test_utils.ReleaseToolsTestCase):
     self.assertEqual(
         os.readlink(os.path.join(output_dir, 'a_link.cpp')), 'a.cpp')
 
+  def test_CopyItems_HardLink(self):
+    input_dir = common.MakeTempDir()
+    output_dir = common.MakeTempDir()
+    os.makedirs(os.path.join(input_dir, 'SYSTEM', 'bin'))
+    os.makedirs(os.path.join(input_dir, 'VENDOR'))
+    for name in ('SYSTEM/bin/sh', 'SYSTEM/build.prop', 'VENDOR/build.prop'):
+      with open(os.path.join(input_dir, name), 'w') as f:
+        f.write(name)
+
+    merge_utils.CopyItems(input_dir, output_dir, ['SYSTEM/*'], hard_link=True)
+
+    self.assertFalse(os.path.exists(os.path.join(output_dir, 'VENDOR')))
+    for name in ('SYSTEM/bin/sh', 'SYSTEM/build.prop'):
+      self.assertTrue(os.path.samefile(os.path.join(input_dir, name),
+                                       os.path.join(output_dir, name)))
+
+  def test_PatternDirPrefix(self):
+    self.assertEqual('SYSTEM/', merge_utils._PatternDirPrefix('SYSTEM/*'))
+    self.assertEqual('SYSTEM/bin/',
+                     merge_utils._PatternDirPrefix('SYSTEM/bin/s?'))
+    self.assertEqual('META/',
+                     merge_utils._PatternDirPrefix('META/misc_info.txt'))
+    self.assertEqual('', merge_utils._PatternDirPrefix('*.txt'))
+    self.assertEqual('', merge_utils._PatternDirPrefix('[A-Z]*/foo'))
+
+  def test_ItemListsMayOverlap(self):
+    self.assertFalse(
+        merge_utils.ItemListsMayOverlap(
+            ['SYSTEM/*', 'META/liblz4.so', 'IMAGES/system.img'],
+            ['VENDOR/*', 'META/otakeys.txt', 'IMAGES/vendor.img']))
+    self.assertTrue(
+        merge_utils.ItemListsMayOverlap(['OTA/*'], ['OTA/android-info.txt']))
+    self.assertTrue(
+        merge_utils.ItemListsMayOverlap(['META/a.txt'], ['META/a.txt']))
+    self.assertFalse(
+        merge_utils.ItemListsMayOverlap(['META/a.txt'], ['META/a.txt.bak']))
+    self.assertTrue(
+        merge_utils.ItemListsMayOverlap(['SYSTEM/bin/*'], ['SYSTEM/*']))
+    self.assertTrue(merge_utils.ItemListsMayOverlap([], ['VENDOR/*']))
+
+  def test_ExtractItems_ExtractsItemsMatchingPatterns(self):
+    input_zip = common.MakeTempFile(suffix='.zip')
+    with zipfile.ZipFile(input_zip, 'w') as zfp:
+      for name in ('META/a.txt', 'META/b.txt', 'SYSTEM/bin/c',
+                   'VENDOR/lib/d.so'):
+        zfp.writestr(name, name)
+
+    output_dir = common.MakeTempDir()
+    merge_utils.ExtractItems(input_zip, output_dir,
+                             ['META/a.txt', 'SYSTEM/*', 'PRODUCT/*'])
+    self.assertTrue(os.path.exists(os.path.join(output_dir, 'META/a.txt')))
+    self.assertTrue(os.path.exists(os.path.join(output_dir, 'SYSTEM/bin/c')))
+    self.assertFalse(os.path.exists(os.path.join(output_dir, 'META/b.txt')))
+    self.assertFalse(os.path.exists(os.path.join(output_dir, 'VENDOR')))
+
+  def test_ExtractItems_Concurrently(self):
+    input_zips = []
+    for prefix in ('framework', 'vendor'):
+      input_zip = common.MakeTempFile(suffix='.zip')
+      with zipfile.ZipFile(input_zip, 'w') as zfp:
+        for i in range(50):
+          zfp.writestr('META/{}_{}.txt'.format(prefix, i), prefix)
+          zfp.writestr('IMAGES/{}/{}.img'.format(i, prefix), prefix)
+      input_zips.append(input_zip)
+
+    output_dir = common.MakeTempDir()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+      futures = [
+          executor.submit(merge_utils.ExtractItems, input_zip, output_dir,
+                          ['META/*', 'IMAGES/*'])
+          for input_zip in input_zips]
+      for future in futures:
+        future.result()
+
+    self.assertEqual(100, len(os.listdir(os.path.join(output_dir, 'META'))))
+    self.assertEqual(50, len(os.listdir(os.path.join(output_dir, 'IMAGES'))))
+
   def test_ValidateConfigLists_ReturnsFalseIfSharedExtractedPartition(self):
     self.OPTIONS.system_item_list = [
         'SYSTEM/*',
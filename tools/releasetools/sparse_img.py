@@ -18,6 +18,7 @@ from __future__ import print_function
 
 import argparse
 import bisect
+import copy
 import logging
 import os
 import struct
@@ -143,6 +144,20 @@ class SparseImage(object):
     else:
       self.file_map = {"__DATA": self.care_map}
 
+  def OpenReader(self):
+    """Returns a copy of the image that reads through its own file handle.
+
+    The copy shares the parsed chunk and file maps, so that it's cheap to get
+    one per thread when reading the image from multiple threads. The caller
+    should close the returned object."""
+    reader = copy.copy(self)
+    reader.simg_f = open(self.simg_f.name, "rb")
+    reader.generator_lock = threading.Lock()
+    return reader
+
+  def Close(self):
+    self.simg_f.close()
+
   def AppendFillChunk(self, data, blocks):
     f = self.simg_f
 
@@ -20,8 +20,8 @@ import os.path
 import common
 import test_utils
 from build_image import (
-    BuildImageError, CheckHeadroom, GetFilesystemCharacteristics,
-    SetUpInDirAndFsConfig)
+    BuildImageError, CheckHeadroom, EstimateExt4Size,
+    GetFilesystemCharacteristics, SetUpInDirAndFsConfig)
 
 
 class BuildImageTest(test_utils.ReleaseToolsTestCase):
@@ -201,3 +201,80 @@ class BuildImageTest(test_utils.ReleaseToolsTestCase):
     self.assertGreater(int(fs_dict['Inode count']), 0)      # expect ~64
     self.assertGreaterEqual(int(fs_dict['Free inodes']), 0) # expect ~53
     self.assertGreater(int(fs_dict['Inode count']), int(fs_dict['Free inodes']))
+
+  @staticmethod
+  def _CreateExt4EstimateInput():
+    input_dir = common.MakeTempDir()
+    os.makedirs(os.path.join(input_dir, 'bin'))
+    os.makedirs(os.path.join(input_dir, 'etc', 'init'))
+    with open(os.path.join(input_dir, 'bin', 'foo'), 'wb') as f:
+      f.write(b'\x00' * (4096 * 10 + 1))
+    with open(os.path.join(input_dir, 'etc', 'init', 'foo.rc'), 'w') as f:
+      f.write('service foo /vendor/bin/foo\n')
+    os.symlink('/vendor/bin/foo', os.path.join(input_dir, 'bin', 'bar'))
+    return input_dir
+
+  def test_EstimateExt4Size(self):
+    input_dir = self._CreateExt4EstimateInput()
+    prop_dict = {
+        'fs_type': 'ext4',
+        'journal_size': '0',
+        'mount_point': 'vendor',
+    }
+    size, inodes = EstimateExt4Size(
+        common.TreeStats(input_dir), prop_dict, None, 16 * 1024 * 1024)
+    # 11 reserved inodes, 6 entries and 1 spare inode.
+    self.assertEqual(18, inodes)
+    # At least the 11 data blocks of bin/foo.
+    self.assertGreater(size, 11 * 4096)
+    self.assertLess(size, 16 * 1024 * 1024)
+    self.assertEqual(0, size % 4096)
+
+  def test_EstimateExt4Size_FsConfigCapabilities(self):
+    input_dir = self._CreateExt4EstimateInput()
+    prop_dict = {
+        'fs_type': 'ext4',
+        'journal_size': '0',
+        'mount_point': 'vendor',
+        'partition_reserved_size': str(1024 * 1024),
+    }
+    size, _ = EstimateExt4Size(
+        common.TreeStats(input_dir), prop_dict, None, 16 * 1024 * 1024)
+
+    fs_config = common.MakeTempFile(suffix='.txt')
+    with open(fs_config, 'w') as f:
+      f.write('vendor/bin 0 2000 755 capabilities=0x0\n')
+      f.write('vendor/bin/foo 0 2000 755 capabilities=0x1000\n')
+    size_with_caps, _ = EstimateExt4Size(
+        common.TreeStats(input_dir), prop_dict, fs_config, 16 * 1024 * 1024)
+    self.assertEqual(size + 4096, size_with_caps)
+
+  def test_EstimateExt4Size_Unsupported(self):
+    input_dir = self._CreateExt4EstimateInput()
+    for prop in ({'journal_size': '16'}, {'extfs_rsv_pct': '1'},
+                 {'base_fs_file': 'base_fs'}):
+      prop_dict = {
+          'fs_type': 'ext4',
+          'journal_size': '0',
+          'mount_point': 'vendor',
+      }
+      prop_dict.update(prop)
+      self.assertIsNone(EstimateExt4Size(
+          common.TreeStats(input_dir), prop_dict, None, 16 * 1024 * 1024))
+
+  @test_utils.SkipIfExternalToolsUnavailable()
+  def test_EstimateExt4Size_BuildsImage(self):
+    input_dir = self._CreateExt4EstimateInput()
+    prop_dict = {
+        'fs_type': 'ext4',
+        'journal_size': '0',
+        'mount_point': 'vendor',
+    }
+    size, inodes = EstimateExt4Size(
+        common.TreeStats(input_dir), prop_dict, None, 16 * 1024 * 1024)
+    output_image = common.MakeTempFile(suffix='.img')
+    command = ['mkuserimg_mke2fs', input_dir, output_image, 'ext4',
+               '/vendor', str(size), '-j', '0', '-i', str(inodes)]
+    proc = common.Run(command)
+    proc.communicate()
+    self.assertEqual(0, proc.returncode)
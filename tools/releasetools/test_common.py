@@ -1609,6 +1609,62 @@ class CommonUtilsTest(test_utils.ReleaseToolsTestCase):
     self.assertTrue(os.path.exists(chained_partition_args.pubkey_path))
 
 
+  @staticmethod
+  def _CreateTreeStatsInput():
+    input_dir = common.MakeTempDir()
+    os.makedirs(os.path.join(input_dir, 'bin'))
+    os.makedirs(os.path.join(input_dir, 'etc', 'init'))
+    with open(os.path.join(input_dir, 'bin', 'foo'), 'wb') as f:
+      f.write(b'\x00' * 5000)
+    with open(os.path.join(input_dir, 'etc', 'init', 'foo.rc'), 'wb') as f:
+      f.write(b'\x00' * 100)
+    os.link(os.path.join(input_dir, 'bin', 'foo'),
+            os.path.join(input_dir, 'bin', 'foo2'))
+    os.symlink('foo', os.path.join(input_dir, 'bin', 'bar'))
+    return input_dir
+
+  @test_utils.SkipIfExternalToolsUnavailable()
+  def test_TreeStats_MatchesDuAndFind(self):
+    input_dir = self._CreateTreeStatsInput()
+    tree_stats = common.TreeStats(input_dir)
+
+    output = common.RunAndCheckOutput(['du', '-b', '-k', '-s', input_dir])
+    self.assertEqual(int(output.split()[0]) * 1024, tree_stats.disk_usage)
+    output = common.RunAndCheckOutput(['find', input_dir, '-print'])
+    self.assertEqual(output.count('\n'), tree_stats.inodes)
+
+  def test_TreeStats(self):
+    input_dir = self._CreateTreeStatsInput()
+    tree_stats = common.TreeStats(input_dir)
+
+    dir_size = os.lstat(input_dir).st_size
+    bin_size = os.lstat(os.path.join(input_dir, 'bin')).st_size
+    etc_size = os.lstat(os.path.join(input_dir, 'etc')).st_size
+    init_size = os.lstat(os.path.join(input_dir, 'etc', 'init')).st_size
+    # The hard link is counted once, the symlink by its target length.
+    self.assertEqual(bin_size + 5000 + 3, tree_stats.dir_sizes['bin'])
+    self.assertEqual(init_size + 100, tree_stats.dir_sizes['etc/init'])
+    self.assertEqual(etc_size + init_size + 100, tree_stats.dir_sizes['etc'])
+    self.assertEqual(
+        dir_size + bin_size + 5003 + etc_size + init_size + 100,
+        tree_stats.apparent_size)
+    self.assertEqual(0, tree_stats.disk_usage % 1024)
+    self.assertEqual(8, tree_stats.inodes)
+    self.assertEqual(
+        ['bar', 'foo', 'foo2'],
+        sorted(name for name, _, _ in tree_stats.dir_entries['bin']))
+    self.assertEqual('bin', tree_stats.LargestDirs(1)[0][0])
+
+  def test_TreeStats_File(self):
+    input_file = common.MakeTempFile()
+    with open(input_file, 'wb') as f:
+      f.write(b'\x00' * 1025)
+    tree_stats = common.TreeStats(input_file)
+    self.assertEqual(1025, tree_stats.apparent_size)
+    self.assertEqual(2048, tree_stats.disk_usage)
+    self.assertEqual(1, tree_stats.inodes)
+
+
 class InstallRecoveryScriptFormatTest(test_utils.ReleaseToolsTestCase):
   """Checks the format of install-recovery.sh.
 
@@ -0,0 +1,122 @@
+#
+# Copyright (C) 2026 The Android Open Source Project
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import hashlib
+import os
+import struct
+
+import common
+import test_utils
+from fsverity_metadata_generator import (
+    BLOCK_SIZE, FSVerityMetadataGenerator, compute_merkle_tree,
+    prepare_output)
+
+
+def _sha256(data):
+  return hashlib.sha256(data).digest()
+
+
+class FSVerityMetadataGeneratorTest(test_utils.ReleaseToolsTestCase):
+
+  @staticmethod
+  def _create_file(size):
+    input_file = common.MakeTempFile()
+    with open(input_file, 'wb') as f:
+      f.write(bytes(i % 251 for i in range(size)))
+    return input_file
+
+  def _get_root_hash(self, descriptor):
+    self.assertEqual(256, len(descriptor))
+    (version, hash_alg, log_blocksize, salt_size, _, data_size, root_hash, _,
+     _) = struct.unpack('<BBBBIQ64s32s144s', descriptor)
+    self.assertEqual(1, version)
+    self.assertEqual(1, hash_alg)
+    self.assertEqual(12, log_blocksize)
+    self.assertEqual(0, salt_size)
+    return data_size, root_hash[:32]
+
+  def test_compute_merkle_tree_EmptyFile(self):
+    descriptor, merkle_tree = compute_merkle_tree(
+        self._create_file(0), 'sha256')
+    self.assertEqual((0, bytes(32)), self._get_root_hash(descriptor))
+    self.assertEqual(b'', merkle_tree)
+
+  def test_compute_merkle_tree_SingleBlock(self):
+    input_file = self._create_file(100)
+    descriptor, merkle_tree = compute_merkle_tree(input_file, 'sha256')
+    with open(input_file, 'rb') as f:
+      data = f.read() + bytes(BLOCK_SIZE - 100)
+    self.assertEqual((100, _sha256(data)), self._get_root_hash(descriptor))
+    self.assertEqual(b'', merkle_tree)
+
+  def test_compute_merkle_tree_TwoLevels(self):
+    # 129 data blocks need 2 leaf level blocks of 128 sha256 hashes each.
+    size = 128 * BLOCK_SIZE + 10
+    input_file = self._create_file(size)
+    descriptor, merkle_tree = compute_merkle_tree(input_file, 'sha256')
+
+    with open(input_file, 'rb') as f:
+      data = f.read()
+    data += bytes(-len(data) % BLOCK_SIZE)
+    leaves = b''.join(_sha256(data[i:i + BLOCK_SIZE])
+                      for i in range(0, len(data), BLOCK_SIZE))
+    leaves += bytes(-len(leaves) % BLOCK_SIZE)
+    root_level = (_sha256(leaves[:BLOCK_SIZE]) +
+                  _sha256(leaves[BLOCK_SIZE:]))
+    root_level += bytes(BLOCK_SIZE - len(root_level))
+
+    self.assertEqual((size, _sha256(root_level)),
+                     self._get_root_hash(descriptor))
+    self.assertEqual(root_level + leaves, merkle_tree)
+
+  def test_generate_batch(self):
+    files = []
+    for size in (0, 100, 3 * BLOCK_SIZE):
+      files.append((self._create_file(size), common.MakeTempFile()))
+    generator = FSVerityMetadataGenerator('fsverity')
+    generator.generate_batch(files, jobs=2)
+
+    for input_file, output_file in files:
+      descriptor, merkle_tree = compute_merkle_tree(input_file, 'sha256')
+      with open(output_file, 'rb') as f:
+        metadata = f.read()
+      self.assertEqual(struct.pack('<I', 1) + descriptor, metadata[:260])
+      # No signature, then the merkle tree at the next page boundary.
+      self.assertEqual(struct.pack('<II', 0, 0), metadata[260:268])
+      if merkle_tree:
+        self.assertEqual(merkle_tree, metadata[BLOCK_SIZE:])
+      else:
+        self.assertEqual(268, len(metadata))
+
+  def test_prepare_output_Symlink(self):
+    input_dir = common.MakeTempDir()
+    input_file = os.path.join(input_dir, 'foo')
+    os.symlink('bar', input_file)
+    output_file = input_file + '.fsv_meta'
+    self.assertFalse(prepare_output(input_file, output_file))
+    self.assertEqual('bar.fsv_meta', os.readlink(output_file))
+
+  @test_utils.SkipIfExternalToolsUnavailable()
+  def test_generate_batch_MatchesFsverity(self):
+    generator = FSVerityMetadataGenerator('fsverity')
+    for size in (0, 100, BLOCK_SIZE, 300 * BLOCK_SIZE + 1):
+      input_file = self._create_file(size)
+      expected_output = common.MakeTempFile()
+      generator.generate(input_file, expected_output)
+      output = common.MakeTempFile()
+      generator.generate_batch([(input_file, output)])
+      with open(expected_output, 'rb') as f1, open(output, 'rb') as f2:
+        self.assertEqual(f1.read(), f2.read())
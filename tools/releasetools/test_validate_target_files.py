@@ -19,6 +19,7 @@
 import os
 import os.path
 import shutil
+import struct
 import zipfile
 
 import common
@@ -328,6 +329,81 @@ class ValidateTargetFilesTest(test_utils.ReleaseToolsTestCase):
       info_dict = {'extfs_sparse_flag': '-s'}
       ValidateFileConsistency(input_zip, input_tmp, info_dict)
 
+  @staticmethod
+  def _write_sparse_image(output_file, data):
+    """Writes data (a multiple of 4K) as a sparse image of one raw chunk."""
+    blocks = len(data) // 4096
+    with open(output_file, 'wb') as f:
+      f.write(struct.pack('<I4H4I', 0xED26FF3A, 1, 0, 28, 12, 4096, blocks, 1,
+                          0))
+      f.write(struct.pack('<2H2I', 0xCAC1, 0, blocks, len(data) + 12))
+      f.write(data)
+
+  def _prepare_sparse_system(self, files):
+    """Packs the given {name: data} files into a sparse system image.
+
+    Each file starts at a new block after block 0, in the sorted order of the
+    names. Returns the input_tmp dir and the target files zip.
+    """
+    input_tmp = common.MakeTempDir()
+    system_root = os.path.join(input_tmp, 'SYSTEM')
+    os.makedirs(system_root)
+    os.mkdir(os.path.join(input_tmp, 'IMAGES'))
+
+    # Block 0 is always treated as clobbered, so leave it out of the files.
+    image_data = b'\0' * 4096
+    all_entries = ['SYSTEM/', 'IMAGES/', 'IMAGES/system.map',
+                   'IMAGES/system.img']
+    with open(os.path.join(input_tmp, 'IMAGES', 'system.map'), 'w') as f:
+      for name in sorted(files):
+        data = files[name]
+        with open(os.path.join(system_root, name), 'wb') as file_fp:
+          file_fp.write(data)
+        padded = data + b'\0' * (common.RoundUpTo4K(len(data)) - len(data))
+        start = len(image_data) // 4096
+        f.write('/system/{} {}-{}\n'.format(
+            name, start, start + len(padded) // 4096 - 1))
+        image_data += padded
+        all_entries.append('SYSTEM/' + name)
+    self._write_sparse_image(
+        os.path.join(input_tmp, 'IMAGES', 'system.img'), image_data)
+
+    input_file = common.MakeTempFile()
+    with zipfile.ZipFile(input_file, 'w', allowZip64=True) as input_zip:
+      for name in all_entries:
+        input_zip.write(os.path.join(input_tmp, name), arcname=name)
+    return input_tmp, input_file
+
+  def test_ValidateFileConsistency_multipleThreads(self):
+    files = {
+        'a': os.urandom(100),
+        'b': os.urandom(4096 * 3),
+        'c': os.urandom(4096 * 300 + 1),
+    }
+    input_tmp, input_file = self._prepare_sparse_system(files)
+    with zipfile.ZipFile(input_file) as input_zip:
+      info_dict = {'extfs_sparse_flag': '-s'}
+      ValidateFileConsistency(input_zip, input_tmp, info_dict, 1)
+      ValidateFileConsistency(input_zip, input_tmp, info_dict, 4)
+
+  def test_ValidateFileConsistency_mismatch(self):
+    files = {
+        'a': os.urandom(100),
+        'b': os.urandom(4096 * 3),
+    }
+    input_tmp, input_file = self._prepare_sparse_system(files)
+
+    # Modify the unpacked copy of 'b' after the image has been built.
+    with open(os.path.join(input_tmp, 'SYSTEM', 'b'), 'r+b') as f:
+      f.seek(4096 * 2)
+      f.write(b'x')
+
+    with zipfile.ZipFile(input_file) as input_zip:
+      info_dict = {'extfs_sparse_flag': '-s'}
+      self.assertRaises(
+          AssertionError, ValidateFileConsistency, input_zip, input_tmp,
+          info_dict, 2)
+
   @staticmethod
   def make_build_prop(build_prop):
     input_tmp = common.MakeTempDir()
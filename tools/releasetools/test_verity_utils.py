@@ -23,11 +23,13 @@ import random
 
 import common
 import sparse_img
+import verity_utils
 from rangelib import RangeSet
 from test_utils import (
     get_testdata_dir, ReleaseToolsTestCase, SkipIfExternalToolsUnavailable)
 from verity_utils import (
-    CalculateVbmetaDigest, CreateVerityImageBuilder)
+    CalculateVbmetaDigest, CreateVerityImageBuilder,
+    VerifiedBootVersion2VerityImageBuilder)
 
 BLOCK_SIZE = common.BLOCK_SIZE
 
@@ -152,6 +154,62 @@ class VerifiedBootVersion2VerityImageBuilderTest(ReleaseToolsTestCase):
           _SizeCalculator(min_partition_size - BLOCK_SIZE),
           image_size)
 
+  def test_CalculateMaxImageSize_InProcess(self):
+    prop_dict = copy.deepcopy(self.DEFAULT_PROP_DICT)
+    prop_dict['avb_avbtool'] = 'non-existent-avbtool'
+    builder = CreateVerityImageBuilder(prop_dict)
+    # 4 MiB partition, sha1 (padded to 32 bytes), 2 FEC roots:
+    #   hashtree = 32768 + 4096, fec = 5 * 2 * 4096 + 4096.
+    self.assertEqual(4096 * 1024 - 65536 - 4096 - 36864 - 45056,
+                     builder.CalculateMaxImageSize())
+
+  def test_CalculateMaxImageSize_InProcessSigningArgs(self):
+    prop_dict = copy.deepcopy(self.DEFAULT_PROP_DICT)
+    prop_dict['avb_avbtool'] = 'non-existent-avbtool'
+    prop_dict['avb_add_hashtree_footer_args'] = (
+        '--prop com.android.build.system.os_version:14 '
+        '--hash_algorithm sha256 --do_not_generate_fec')
+    builder = CreateVerityImageBuilder(prop_dict)
+    self.assertEqual(4096 * 1024 - 65536 - 4096 - 36864,
+                     builder.CalculateMaxImageSize())
+
+    prop_dict['avb_hash_enable'] = 'true'
+    prop_dict['avb_add_hash_footer_args'] = ''
+    builder = CreateVerityImageBuilder(prop_dict)
+    self.assertEqual(4096 * 1024 - 65536 - 4096,
+                     builder.CalculateMaxImageSize())
+
+  @SkipIfExternalToolsUnavailable()
+  def test_CalculateMaxImageSize_MatchesAvbtool(self):
+    for footer_args in ('', '--hash_algorithm sha256',
+                        '--do_not_generate_fec', '--fec_num_roots 4'):
+      prop_dict = copy.deepcopy(self.DEFAULT_PROP_DICT)
+      prop_dict['avb_add_hashtree_footer_args'] = footer_args
+      builder = CreateVerityImageBuilder(prop_dict)
+      for partition_size in (BLOCK_SIZE * 256, BLOCK_SIZE * 51200,
+                             BLOCK_SIZE * 524288 + BLOCK_SIZE * 7):
+        self.assertEqual(
+            builder._CalculateMaxImageSizeWithAvbtool(partition_size),
+            builder.CalculateMaxImageSize(partition_size))
+
+  def test_CalculateMaxImageSize_Memoized(self):
+    prop_dict = copy.deepcopy(self.DEFAULT_PROP_DICT)
+    builder = CreateVerityImageBuilder(prop_dict)
+    self.assertEqual(
+        VerifiedBootVersion2VerityImageBuilder.AVB_HASHTREE_FOOTER,
+        builder.footer_type)
+    image_size = builder.CalculateMaxImageSize()
+    key = (builder.footer_type, builder.signing_args, builder.partition_size)
+    self.assertEqual(image_size, verity_utils._max_image_size_cache[key])
+
+    # Cached entries are returned without being recomputed.
+    verity_utils._max_image_size_cache[key] = image_size - BLOCK_SIZE
+    try:
+      self.assertEqual(image_size - BLOCK_SIZE,
+                       builder.CalculateMaxImageSize())
+    finally:
+      del verity_utils._max_image_size_cache[key]
+
   @SkipIfExternalToolsUnavailable()
   def test_CalculateVbmetaDigest(self):
     prop_dict = copy.deepcopy(self.DEFAULT_PROP_DICT)
@@ -31,10 +31,13 @@ It performs the following checks to assert the integrity of the input zip.
 """
 
 import argparse
+import concurrent.futures
 import filecmp
 import logging
 import os.path
 import re
+import threading
+import time
 import zipfile
 
 from hashlib import sha1
@@ -44,16 +47,46 @@ import common
 import rangelib
 
 
-def _ReadFile(file_name, unpacked_name, round_up=False):
-  """Constructs and returns a File object. Rounds up its size if needed."""
-  assert os.path.exists(unpacked_name)
+# Max amount of data read at once when hashing files, so that validating
+# large files doesn't need to hold them in memory.
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+def _Sha1OfFile(unpacked_name, round_up=False):
+  """Returns the SHA-1 and the size of a file, streaming its contents.
+
+  If round_up is True, the hash covers the file padded with zeros to 4K.
+  """
+  h = sha1()
+  file_size = 0
   with open(unpacked_name, 'rb') as f:
-    file_data = f.read()
-  file_size = len(file_data)
+    while True:
+      data = f.read(READ_CHUNK_SIZE)
+      if not data:
+        break
+      h.update(data)
+      file_size += len(data)
   if round_up:
-    file_size_rounded_up = common.RoundUpTo4K(file_size)
-    file_data += b'\0' * (file_size_rounded_up - file_size)
-  return common.File(file_name, file_data)
+    h.update(b'\0' * (common.RoundUpTo4K(file_size) - file_size))
+  return h.hexdigest(), file_size
+
+
+def _Sha1OfImageRanges(image, ranges):
+  """Returns the SHA-1 of the image blocks in ranges, in the given order.
+
+  Args:
+    image: The image to read from.
+    ranges: An iterable of (start, end) block ranges.
+  """
+  max_blocks = READ_CHUNK_SIZE // image.blocksize
+  h = sha1()
+  for start, end in ranges:
+    for piece_start in range(start, end, max_blocks):
+      piece = rangelib.RangeSet(
+          data=(piece_start, min(end, piece_start + max_blocks)))
+      for data in image.ReadRangeSet(piece):
+        h.update(data)
+  return h.hexdigest()
 
 
 def ValidateFileAgainstSha1(input_tmp, file_name, file_path, expected_sha1):
@@ -62,35 +95,80 @@ def ValidateFileAgainstSha1(input_tmp, file_name, file_path, expected_sha1):
   logging.info('Validating the SHA-1 of %s', file_name)
   unpacked_name = os.path.join(input_tmp, file_path)
   assert os.path.exists(unpacked_name)
-  actual_sha1 = _ReadFile(file_name, unpacked_name, False).sha1
+  actual_sha1, _ = _Sha1OfFile(unpacked_name)
   assert actual_sha1 == expected_sha1, \
       'SHA-1 mismatches for {}. actual {}, expected {}'.format(
           file_name, actual_sha1, expected_sha1)
 
 
-def ValidateFileConsistency(input_zip, input_tmp, info_dict):
-  """Compare the files from image files and unpacked folders."""
+def ValidateFileConsistency(input_zip, input_tmp, info_dict,
+                            worker_threads=None):
+  """Compare the files from image files and unpacked folders.
 
-  def CheckAllFiles(which):
+  Files are checked on a pool of worker_threads threads (defaults to the number
+  of CPUs), with system and vendor validated concurrently.
+  """
+
+  def LoadImage(which):
     logging.info('Checking %s image.', which)
     path = os.path.join(input_tmp, "IMAGES", which + ".img")
     if not IsSparseImage(path):
       logging.info("%s is non-sparse image", which)
-      image = common.GetNonSparseImage(which, input_tmp)
+      return common.GetNonSparseImage(which, input_tmp)
+    logging.info("%s is sparse image", which)
+    # Allow having shared blocks when loading the sparse image, because allowing
+    # that doesn't affect the checks below (we will have all the blocks on file,
+    # unless it's skipped due to the holes).
+    return common.GetSparseImage(which, input_tmp, input_zip, True)
+
+  # Each thread reads the images through its own file handles.
+  thread_local = threading.local()
+  readers = []
+  readers_lock = threading.Lock()
+
+  def GetReader(which, image):
+    if not hasattr(thread_local, 'readers'):
+      thread_local.readers = {}
+    reader = thread_local.readers.get(which)
+    if reader is None:
+      # Only sparse images have per-file entries to check.
+      reader = image.OpenReader()
+      with readers_lock:
+        readers.append(reader)
+      thread_local.readers[which] = reader
+    return reader
+
+  def CheckFile(which, image, entry, file_ranges):
+    """Checks a file against its blocks, and returns the bytes checked."""
+    # Read the blocks that the file resides. Note that it will contain the
+    # bytes past the file length, which is expected to be padded with '\0's.
+    # If the file has non-monotonic ranges, read each range in order.
+    if not file_ranges.monotonic:
+      ranges = []
+      for file_range in file_ranges.extra['text_str'].split(' '):
+        ranges.extend(rangelib.RangeSet(file_range))
     else:
-      logging.info("%s is sparse image", which)
-      # Allow having shared blocks when loading the sparse image, because allowing
-      # that doesn't affect the checks below (we will have all the blocks on file,
-      # unless it's skipped due to the holes).
-      image = common.GetSparseImage(which, input_tmp, input_zip, True)
+      ranges = file_ranges
+    blocks_sha1 = _Sha1OfImageRanges(GetReader(which, image), ranges)
+
+    # The filename under unpacked directory, such as SYSTEM/bin/sh.
+    prefix = '/' + which
+    unpacked_name = os.path.join(
+        input_tmp, which.upper(), entry[(len(prefix) + 1):])
+    assert os.path.exists(unpacked_name)
+    file_sha1, file_size = _Sha1OfFile(unpacked_name, True)
+    assert blocks_sha1 == file_sha1, \
+        'file: %s, range: %s, blocks_sha1: %s, file_sha1: %s' % (
+            entry, file_ranges, blocks_sha1, file_sha1)
+    return file_size
+
+  def GetFilesToCheck(which, image):
     prefix = '/' + which
     for entry in image.file_map:
       # Skip entries like '__NONZERO-0'.
       if not entry.startswith(prefix):
         continue
 
-      # Read the blocks that the file resides. Note that it will contain the
-      # bytes past the file length, which is expected to be padded with '\0's.
       ranges = image.file_map[entry]
 
       # Use the original RangeSet if applicable, which includes the shared
@@ -105,24 +183,7 @@ def ValidateFileConsistency(input_zip, input_tmp, info_dict):
         logging.warning('Skipping %s that has incomplete block list', entry)
         continue
 
-      # If the file has non-monotonic ranges, read each range in order.
-      if not file_ranges.monotonic:
-        h = sha1()
-        for file_range in file_ranges.extra['text_str'].split(' '):
-          for data in image.ReadRangeSet(rangelib.RangeSet(file_range)):
-            h.update(data)
-        blocks_sha1 = h.hexdigest()
-      else:
-        blocks_sha1 = image.RangeSha1(file_ranges)
-
-      # The filename under unpacked directory, such as SYSTEM/bin/sh.
-      unpacked_name = os.path.join(
-          input_tmp, which.upper(), entry[(len(prefix) + 1):])
-      unpacked_file = _ReadFile(entry, unpacked_name, True)
-      file_sha1 = unpacked_file.sha1
-      assert blocks_sha1 == file_sha1, \
-          'file: %s, range: %s, blocks_sha1: %s, file_sha1: %s' % (
-              entry, file_ranges, blocks_sha1, file_sha1)
+      yield entry, file_ranges
 
   logging.info('Validating file consistency.')
 
@@ -131,17 +192,45 @@ def ValidateFileConsistency(input_zip, input_tmp, info_dict):
     logging.warning('Skipped due to target using non-sparse images')
     return
 
+  namelist = input_zip.namelist()
+  partitions = []
   # Verify IMAGES/system.img if applicable.
   # Some targets are system.img-less.
-  if 'IMAGES/system.img' in input_zip.namelist():
-    CheckAllFiles('system')
+  if 'IMAGES/system.img' in namelist:
+    partitions.append('system')
 
   # Verify IMAGES/vendor.img if applicable.
-  if 'VENDOR/' in input_zip.namelist():
-    CheckAllFiles('vendor')
+  if 'VENDOR/' in namelist:
+    partitions.append('vendor')
 
   # Not checking IMAGES/system_other.img since it doesn't have the map file.
 
+  if not partitions:
+    return
+
+  start_time = time.time()
+  with concurrent.futures.ThreadPoolExecutor(
+      max_workers=worker_threads or os.cpu_count()) as executor:
+    images = dict(zip(partitions, executor.map(LoadImage, partitions)))
+    futures = [
+        executor.submit(CheckFile, which, image, entry, file_ranges)
+        for which, image in images.items()
+        for entry, file_ranges in GetFilesToCheck(which, image)]
+    try:
+      total_size = sum(future.result() for future in futures)
+    finally:
+      for future in futures:
+        future.cancel()
+      executor.shutdown(wait=True)
+      for reader in readers:
+        reader.Close()
+
+  elapsed = max(time.time() - start_time, 1e-6)
+  logging.info(
+      'Validated %d files (%.1f MB) from %s in %.1fs, %.1f MB/s.',
+      len(futures), total_size / (1024 * 1024), ', '.join(partitions),
+      elapsed, total_size / (1024 * 1024) / elapsed)
+
 
 def ValidateInstallRecoveryScript(input_tmp, info_dict):
   """Validate the SHA-1 embedded in install-recovery.sh.
@@ -528,6 +617,10 @@ def main():
       '--verity_key_mincrypt',
       help='the verity public key in mincrypt format to verify the system '
            'images, if target using Verified Boot 1.0')
+  parser.add_argument(
+      '--worker_threads', type=int,
+      help='the number of threads used to validate the file consistency '
+           '(defaults to the number of CPUs)')
   args = parser.parse_args()
 
   # Unprovided args will have 'None' as the value.
@@ -543,7 +636,8 @@ def main():
 
   info_dict = common.LoadInfoDict(input_tmp)
   with zipfile.ZipFile(args.target_files, 'r', allowZip64=True) as input_zip:
-    ValidateFileConsistency(input_zip, input_tmp, info_dict)
+    ValidateFileConsistency(input_zip, input_tmp, info_dict,
+                            args.worker_threads)
 
   CheckBuildPropDuplicity(input_tmp)
 
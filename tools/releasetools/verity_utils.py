@@ -22,6 +22,8 @@ Usage:  verity_utils properties_file output_image
 
 from __future__ import print_function
 
+import argparse
+import hashlib
 import logging
 import os.path
 import shlex
@@ -42,6 +44,18 @@ FIXED_SALT = "aee087a5be3b982978c923f566a94613496b417f2af592639bc80d141e34dfe7"
 # From external/avb/avbtool.py
 MAX_VBMETA_SIZE = 64 * 1024
 MAX_FOOTER_SIZE = 4096
+AVB_HASHTREE_DEFAULT_HASH_ALGORITHM = "sha1"
+AVB_HASHTREE_DEFAULT_BLOCK_SIZE = 4096
+AVB_FEC_NUM_ROOTS = 2
+
+# From system/extras/verity/fec/fec_private.h
+FEC_BLOCK_SIZE = 4096
+FEC_RSM = 255
+
+# Max image sizes computed so far, keyed by (footer type, signing args,
+# partition size). Sizing a dynamic partition probes the same sizes repeatedly,
+# and the results only depend on these inputs.
+_max_image_size_cache = {}
 
 
 class BuildVerityImageError(Exception):
@@ -224,6 +238,10 @@ class VerifiedBootVersion2VerityImageBuilder(VerityImageBuilder):
   def CalculateMaxImageSize(self, partition_size=None):
     """Calculates max image size for a given partition size.
 
+    The size is computed in-process with the same math as avbtool, falling back
+    to invoking avbtool if the signing args can't be interpreted. Results are
+    memoized per (footer type, signing args, partition size).
+
     Args:
       partition_size: The partition size, which defaults to self.partition_size
           if unspecified.
@@ -239,23 +257,34 @@ class VerifiedBootVersion2VerityImageBuilder(VerityImageBuilder):
     assert partition_size > 0, \
         "Invalid partition size: {}".format(partition_size)
 
+    key = (self.footer_type, self.signing_args, partition_size)
+    image_size = _max_image_size_cache.get(key)
+    if image_size is None:
+      image_size = CalculateAvbMaxImageSize(
+          self.footer_type, partition_size, self.signing_args)
+      if image_size is None:
+        image_size = self._CalculateMaxImageSizeWithAvbtool(partition_size)
+      if image_size <= 0:
+        raise BuildVerityImageError(
+            "Invalid max image size: {}".format(image_size))
+      _max_image_size_cache[key] = image_size
+    self.image_size = image_size
+    return image_size
+
+  def _CalculateMaxImageSizeWithAvbtool(self, partition_size):
+    """Calculates max image size by invoking avbtool."""
     add_footer = ("add_hash_footer" if self.footer_type == self.AVB_HASH_FOOTER
                   else "add_hashtree_footer")
     cmd = [self.avbtool, add_footer, "--partition_size",
            str(partition_size), "--calc_max_image_size"]
-    cmd.extend(shlex.split(self.signing_args))
+    cmd.extend(shlex.split(self.signing_args or ""))
 
     proc = common.Run(cmd)
     output, _ = proc.communicate()
     if proc.returncode != 0:
       raise BuildVerityImageError(
           "Failed to calculate max image size:\n{}".format(output))
-    image_size = int(output)
-    if image_size <= 0:
-      raise BuildVerityImageError(
-          "Invalid max image size: {}".format(output))
-    self.image_size = image_size
-    return image_size
+    return int(output)
 
   def PadSparseImage(self, out_file):
     # No-op as the padding is taken care of by avbtool.
@@ -285,6 +314,96 @@ class VerifiedBootVersion2VerityImageBuilder(VerityImageBuilder):
       raise BuildVerityImageError("Failed to add AVB footer: {}".format(output))
 
 
+def _ParseAvbSizingArgs(signing_args):
+  """Parses the avbtool args that affect the footer size.
+
+  Returns:
+    An argparse.Namespace, or None if the args can't be interpreted.
+  """
+  parser = argparse.ArgumentParser(add_help=False, allow_abbrev=False)
+  parser.add_argument("--hash_algorithm",
+                      default=AVB_HASHTREE_DEFAULT_HASH_ALGORITHM)
+  parser.add_argument("--block_size", type=int,
+                      default=AVB_HASHTREE_DEFAULT_BLOCK_SIZE)
+  parser.add_argument("--fec_num_roots", type=int, default=AVB_FEC_NUM_ROOTS)
+  parser.add_argument("--generate_fec", action="store_true")
+  parser.add_argument("--do_not_generate_fec", action="store_true")
+  parser.add_argument("--no_hashtree", action="store_true")
+  try:
+    args, _ = parser.parse_known_args(shlex.split(signing_args or ""))
+  except (SystemExit, ValueError):
+    return None
+  return args
+
+
+def _GetAvbHashtreeDigestSize(hash_algorithm):
+  """Returns the hashtree digest size, padded to a power of 2 like avbtool."""
+  if hash_algorithm == "blake2b-256":
+    digest_size = 32
+  else:
+    try:
+      digest_size = hashlib.new(hash_algorithm).digest_size
+    except ValueError:
+      return None
+  padded_size = 1
+  while padded_size < digest_size:
+    padded_size *= 2
+  return padded_size
+
+
+def CalculateHashtreeSize(image_size, block_size, digest_size):
+  """Returns the size of the hashtree for an image, as avbtool computes it."""
+  tree_size = 0
+  size = image_size
+  while size > block_size:
+    num_blocks = (size + block_size - 1) // block_size
+    level_size = num_blocks * digest_size
+    level_size = (level_size + block_size - 1) // block_size * block_size
+    tree_size += level_size
+    size = level_size
+  return tree_size
+
+
+def CalculateFecSize(image_size, num_roots):
+  """Returns the size of the FEC data, as `fec --print-fec-size` computes it."""
+  num_blocks = (image_size + FEC_BLOCK_SIZE - 1) // FEC_BLOCK_SIZE
+  rounds = (num_blocks + FEC_RSM - num_roots - 1) // (FEC_RSM - num_roots)
+  return rounds * num_roots * FEC_BLOCK_SIZE + FEC_BLOCK_SIZE
+
+
+def CalculateAvbMaxImageSize(footer_type, partition_size, signing_args):
+  """Calculates max image size the same way as `avbtool --calc_max_image_size`.
+
+  Args:
+    footer_type: AVB_HASH_FOOTER or AVB_HASHTREE_FOOTER.
+    partition_size: The partition size.
+    signing_args: The avbtool add_hash{,tree}_footer args, as a string.
+
+  Returns:
+    The maximum image size, or None if it can't be computed in-process.
+  """
+  max_metadata_size = MAX_VBMETA_SIZE + MAX_FOOTER_SIZE
+  if footer_type == VerifiedBootVersion2VerityImageBuilder.AVB_HASH_FOOTER:
+    if partition_size < max_metadata_size:
+      return None
+    return partition_size - max_metadata_size
+
+  args = _ParseAvbSizingArgs(signing_args)
+  if args is None or args.block_size <= 0:
+    return None
+  if not 0 < args.fec_num_roots < FEC_RSM:
+    return None
+  if not args.no_hashtree:
+    digest_size = _GetAvbHashtreeDigestSize(args.hash_algorithm)
+    if digest_size is None:
+      return None
+    max_metadata_size += CalculateHashtreeSize(
+        partition_size, args.block_size, digest_size)
+    if not args.do_not_generate_fec:
+      max_metadata_size += CalculateFecSize(partition_size, args.fec_num_roots)
+  return partition_size - max_metadata_size
+
+
 def CreateCustomImageBuilder(info_dict, partition_name, partition_size,
                              key_path, algorithm, signing_args):
   builder = None
@@ -313,9 +432,7 @@ def GetDiskUsage(path):
   Returns:
     The number of bytes based on a 1K block_size.
   """
-  cmd = ["du", "-b", "-k", "-s", path]
-  output = common.RunAndCheckOutput(cmd, verbose=False)
-  return int(output.split()[0]) * 1024
+  return common.TreeStats(path).disk_usage
 
 
 def CalculateVbmetaDigest(extracted_dir, avbtool):
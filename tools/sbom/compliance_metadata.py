@@ -14,6 +14,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
 import sqlite3
 
 class MetadataDb:
@@ -23,6 +24,15 @@ class MetadataDb:
     with sqlite3.connect(db) as c:
       c.backup(self.conn)
     self.reorg()
+    # Licenses are looked up for every installed file, but many files share the same module or package
+    self.module_licenses = {}
+    self.package_licenses = {}
+    # Static deps are resolved for many files, they are looked up in memory instead of a query per file
+    self.built_file_module_ids = None
+    self.soong_modules = None
+    self.module_direct_static_dep_files = {}
+    self.module_static_dep_files = {}
+    self.transitive_static_dep_files = {}
 
   def reorg(self):
     # package_license table
@@ -109,7 +119,7 @@ class MetadataDb:
     self.conn.execute('create index idx_modules_name on modules (name)')
     self.conn.execute('create index idx_package_licnese_package on package_license (package)')
     self.conn.execute('create index idx_package_licnese_license on package_license (license)')
-    self.conn.execute('create index idx_module_licnese_module on module_license (module)')
+    self.conn.execute('create index idx_module_licnese_module_package on module_license (module, package)')
     self.conn.execute('create index idx_module_licnese_license on module_license (license)')
     self.conn.execute('create index idx_module_installed_file_module_id on module_installed_file (module_id)')
     self.conn.execute('create index idx_module_installed_file_installed_file on module_installed_file (installed_file)')
@@ -121,16 +131,17 @@ class MetadataDb:
     with sqlite3.connect(debug_db) as c:
       self.conn.backup(c)
 
+  def rows_as_dicts(self, cursor):
+    try:
+      for row in cursor:
+        yield dict(row)
+    finally:
+      cursor.close()
+
   def get_installed_files(self):
     # Get all records from table make_metadata, which contains all installed files and corresponding make modules' metadata
     cursor = self.conn.execute('select installed_file, module_path, is_soong_module, is_prebuilt_make_module, product_copy_files, kernel_module_copy_files, is_platform_generated, license_text from make_metadata')
-    rows = cursor.fetchall()
-    cursor.close()
-    installed_files_metadata = []
-    for row in rows:
-      metadata = dict(zip(row.keys(), row))
-      installed_files_metadata.append(metadata)
-    return installed_files_metadata
+    return self.rows_as_dicts(cursor)
 
   def get_installed_file_in_dir(self, dir):
     dir = dir.removesuffix('/')
@@ -139,81 +150,158 @@ class MetadataDb:
         '       kernel_module_copy_files, is_platform_generated, license_text '
         'from make_metadata '
         'where installed_file like ?', (dir + '/%',))
-    rows = cursor.fetchall()
-    cursor.close()
-    installed_files_metadata = []
-    for row in rows:
-      metadata = dict(zip(row.keys(), row))
-      installed_files_metadata.append(metadata)
-    return installed_files_metadata
+    return self.rows_as_dicts(cursor)
 
   def get_soong_modules(self):
     # Get all records from table modules, which contains metadata of all soong modules
     cursor = self.conn.execute('select name, package, package as module_path, module_type as soong_module_type, built_files, installed_files, static_dep_files, whole_static_dep_files from modules')
-    rows = cursor.fetchall()
-    cursor.close()
-    soong_modules = []
-    for row in rows:
-      soong_module = dict(zip(row.keys(), row))
-      soong_modules.append(soong_module)
-    return soong_modules
+    return self.rows_as_dicts(cursor)
 
   def get_package_licenses(self, package):
-    cursor = self.conn.execute('select m.name, m.package, m.lic_license_text as license_text '
-                               'from package_license pl join modules m on pl.license = m.name '
-                               'where pl.package = ?',
-                               ('//' + package,))
-    rows = cursor.fetchall()
-    licenses = {}
-    for r in rows:
-      licenses[r['name']] = r['license_text']
-    return licenses
+    if package not in self.package_licenses:
+      cursor = self.conn.execute('select m.name, m.package, m.lic_license_text as license_text '
+                                 'from package_license pl join modules m on pl.license = m.name '
+                                 'where pl.package = ?',
+                                 ('//' + package,))
+      licenses = {}
+      for r in cursor:
+        licenses[r['name']] = r['license_text']
+      self.package_licenses[package] = licenses
+    # Return a copy, callers may modify it
+    return dict(self.package_licenses[package])
 
   def get_module_licenses(self, module_name, package):
-    licenses = {}
-    # If property "licenses" is defined on module
-    cursor = self.conn.execute('select m.name, m.package, m.lic_license_text as license_text '
-                               'from module_license ml join modules m on ml.license = m.name '
-                               'where ml.module = ? and ml.package = ?',
-                               (module_name, package))
-    rows = cursor.fetchall()
-    for r in rows:
-      licenses[r['name']] = r['license_text']
-    if len(licenses) > 0:
-      return licenses
-
-    # Use default package license
-    cursor = self.conn.execute('select m.name, m.package, m.lic_license_text as license_text '
-                               'from package_license pl join modules m on pl.license = m.name '
-                               'where pl.package = ?',
-                               ('//' + package,))
-    rows = cursor.fetchall()
-    for r in rows:
-      licenses[r['name']] = r['license_text']
-    return licenses
+    key = (module_name, package)
+    if key not in self.module_licenses:
+      licenses = {}
+      # If property "licenses" is defined on module
+      cursor = self.conn.execute('select m.name, m.package, m.lic_license_text as license_text '
+                                 'from module_license ml join modules m on ml.license = m.name '
+                                 'where ml.module = ? and ml.package = ?',
+                                 (module_name, package))
+      for r in cursor:
+        licenses[r['name']] = r['license_text']
+      if not licenses:
+        # Use default package license
+        licenses = self.get_package_licenses(package)
+      self.module_licenses[key] = licenses
+    # Return a copy, callers may modify it
+    return dict(self.module_licenses[key])
 
   def get_soong_module_of_installed_file(self, installed_file):
     cursor = self.conn.execute('select name, m.package, m.package as module_path, module_type as soong_module_type, built_files, installed_files, static_dep_files, whole_static_dep_files '
                                'from modules m join module_installed_file mif on m.id = mif.module_id '
                                'where mif.installed_file = ?',
                                (installed_file,))
-    rows = cursor.fetchall()
+    row = cursor.fetchone()
     cursor.close()
-    if rows:
-      soong_module = dict(zip(rows[0].keys(), rows[0]))
-      return soong_module
+    if row:
+      return dict(row)
 
     return None
 
-  def get_soong_module_of_built_file(self, built_file):
-    cursor = self.conn.execute('select name, m.package, m.package as module_path, module_type as soong_module_type, built_files, installed_files, static_dep_files, whole_static_dep_files '
-                               'from modules m join module_built_file mbf on m.id = mbf.module_id '
-                               'where mbf.built_file = ?',
-                               (built_file,))
-    rows = cursor.fetchall()
+  def load_built_file_modules(self):
+    if self.built_file_module_ids is not None:
+      return
+    self.soong_modules = {}
+    cursor = self.conn.execute('select id, name, package, package as module_path, module_type as soong_module_type, built_files, installed_files, static_dep_files, whole_static_dep_files '
+                               'from modules '
+                               'where id in (select module_id from module_built_file)')
+    for row in cursor:
+      soong_module = dict(row)
+      del soong_module['id']
+      self.soong_modules[row['id']] = soong_module
     cursor.close()
-    if rows:
-      soong_module = dict(zip(rows[0].keys(), rows[0]))
-      return soong_module
+    self.built_file_module_ids = {}
+    cursor = self.conn.execute('select built_file, module_id from module_built_file order by rowid')
+    for row in cursor:
+      self.built_file_module_ids.setdefault(row['built_file'], row['module_id'])
+    cursor.close()
+
+  def get_soong_module_of_built_file(self, built_file):
+    self.load_built_file_modules()
+    module_id = self.built_file_module_ids.get(built_file)
+    if module_id is not None:
+      # Return a copy, callers may modify it
+      return dict(self.soong_modules[module_id])
+
+    return None
+
+  def get_static_dep_files_of_module(self, module_id):
+    """Return the static dep files reachable from a module, as the levels of a breadth-first search."""
+    if module_id in self.module_static_dep_files:
+      return self.module_static_dep_files[module_id]
+
+    levels = []
+    seen = set()
+    dep_files = self.get_direct_static_dep_files(module_id)
+    while True:
+      level = [f for f in dict.fromkeys(dep_files) if f not in seen]
+      if not level:
+        break
+      seen.update(level)
+      levels.append(level)
+      dep_files = []
+      for dep_file in level:
+        dep_module_id = self.built_file_module_ids.get(dep_file)
+        if dep_module_id is not None:
+          dep_files += self.get_direct_static_dep_files(dep_module_id)
+
+    self.module_static_dep_files[module_id] = levels
+    return levels
+
+  def get_direct_static_dep_files(self, module_id):
+    if module_id not in self.module_direct_static_dep_files:
+      soong_module = self.soong_modules[module_id]
+      dep_files = []
+      if soong_module['static_dep_files']:
+        dep_files += soong_module['static_dep_files'].split(' ')
+      if soong_module['whole_static_dep_files']:
+        dep_files += soong_module['whole_static_dep_files'].split(' ')
+      self.module_direct_static_dep_files[module_id] = dep_files
+    return self.module_direct_static_dep_files[module_id]
+
+  def get_transitive_static_dep_files(self, dep_files):
+    """Return all static dep files reachable from dep_files, in breadth-first order."""
+    key = tuple(dep_files)
+    if key in self.transitive_static_dep_files:
+      return self.transitive_static_dep_files[key]
+
+    self.load_built_file_modules()
+    # Merge the levels of the modules of dep_files level by level, in the order of dep_files, which
+    # is the order of a breadth-first search from all of dep_files.
+    all_static_dep_files = dict.fromkeys(dep_files)
+    module_levels = []
+    for module_id in dict.fromkeys(self.built_file_module_ids.get(f) for f in all_static_dep_files):
+      if module_id is not None:
+        module_levels.append(self.get_static_dep_files_of_module(module_id))
+    for depth in range(max(map(len, module_levels), default=0)):
+      for levels in module_levels:
+        if depth < len(levels):
+          all_static_dep_files.update(dict.fromkeys(levels[depth]))
+
+    result = list(all_static_dep_files)
+    self.transitive_static_dep_files[key] = result
+    return result
+
+  def get_transitive_static_dep_files_of_all(self, dep_files):
+    """Return all static dep files reachable from dep_files, in breadth-first order.
+
+    Unlike get_transitive_static_dep_files, the static dep files reachable from each module aren't
+    memoized, which is faster for a single lookup from the dep files of all installed files.
+    """
+    self.load_built_file_modules()
+    q = collections.deque(dep_files)
+    all_static_dep_files = {}
+    while q:
+      dep_file = q.popleft()
+      if dep_file in all_static_dep_files:
+        # It has been processed
+        continue
+
+      all_static_dep_files[dep_file] = True
+      module_id = self.built_file_module_ids.get(dep_file)
+      if module_id is not None:
+        q.extend(self.get_direct_static_dep_files(module_id))
 
-    return None
\ No newline at end of file
+    return list(all_static_dep_files)
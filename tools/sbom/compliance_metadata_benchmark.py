@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2026 The Android Open Source Project
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmark of the queries of compliance_metadata.MetadataDb done by gen_sbom.py and gen_notice_xml.py.
+
+Runs them on a compliance metadata DB of a build, or on a made up DB of a platform size.
+
+Usage: compliance_metadata_benchmark.py [--metadata compliance-metadata.db]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+import compliance_metadata
+
+MODULES_COLUMNS = ['id', 'name', 'module_type', 'package', 'pkg_default_applicable_licenses', 'licenses',
+                   'installed_files', 'built_files', 'static_dep_files', 'whole_static_dep_files',
+                   'lic_license_text']
+MAKE_METADATA_COLUMNS = ['installed_file', 'module_path', 'is_soong_module', 'is_prebuilt_make_module',
+                         'product_copy_files', 'kernel_module_copy_files', 'is_platform_generated', 'license_text']
+
+
+def get_args():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--metadata', help='The compliance metadata DB file path, a DB is made up if not set.')
+  parser.add_argument('--packages', type=int, default=5000, help='Number of packages in the made up DB.')
+  parser.add_argument('--modules', type=int, default=60000, help='Number of soong modules in the made up DB.')
+  parser.add_argument('--seed', type=int, default=0, help='Seed of the made up DB.')
+  return parser.parse_args()
+
+
+def make_up_db(path, num_packages, num_modules, seed):
+  """Write a compliance metadata DB of num_modules soong modules in num_packages packages."""
+  rng = random.Random(seed)
+  license_modules = []
+  modules = []
+  for p in range(num_packages):
+    package = f'//external/project{p}'
+    license_name = f'project{p}_license'
+    license_modules.append(license_name)
+    modules.append({'name': license_name, 'module_type': 'license', 'package': package,
+                    'lic_license_text': f'external/project{p}/LICENSE'})
+    modules.append({'name': package, 'module_type': 'package', 'package': package,
+                    'pkg_default_applicable_licenses': license_name})
+  static_libs = []
+  make_metadata = []
+  for m in range(num_modules):
+    package = f'external/project{rng.randrange(num_packages)}'
+    name = f'lib{m}'
+    module = {'name': name, 'package': package}
+    out = f'out/soong/.intermediates/{package}/{name}/android_arm64_armv8-a'
+    if rng.random() < 0.3:
+      module['module_type'] = 'cc_library_static'
+      module['built_files'] = f'{out}_static/{name}.a'
+      static_libs.append(module['built_files'])
+    else:
+      module['module_type'] = 'cc_library_shared'
+      module['built_files'] = f'{out}_shared/{name}.so'
+      installed_files = [f'out/target/product/generic/system/lib64/{name}.so']
+      if rng.random() < 0.2:
+        installed_files.append(f'out/target/product/generic/system/lib/{name}.so')
+      module['installed_files'] = ' '.join(installed_files)
+      for installed_file in installed_files:
+        make_metadata.append({'installed_file': installed_file, 'module_path': package, 'is_soong_module': 'true'})
+    if static_libs and rng.random() < 0.5:
+      module['static_dep_files'] = ' '.join(rng.sample(static_libs, min(len(static_libs), rng.randint(1, 5))))
+    if rng.random() < 0.1:
+      module['licenses'] = ' '.join(rng.sample(license_modules, rng.randint(1, 2)))
+    modules.append(module)
+
+  with sqlite3.connect(path) as conn:
+    conn.execute(f'create table modules ({", ".join(MODULES_COLUMNS)})')
+    conn.executemany(f'insert into modules values ({", ".join("?" * len(MODULES_COLUMNS))})',
+                     ([str(i)] + [m.get(c, '') for c in MODULES_COLUMNS[1:]] for i, m in enumerate(modules)))
+    conn.execute(f'create table make_metadata ({", ".join(MAKE_METADATA_COLUMNS)})')
+    conn.executemany(f'insert into make_metadata values ({", ".join("?" * len(MAKE_METADATA_COLUMNS))})',
+                     ([m.get(c, '') for c in MAKE_METADATA_COLUMNS] for m in make_metadata))
+  conn.close()
+
+
+def timed(title, func):
+  start = time.perf_counter()
+  result = func()
+  print(f'{title:<50} {time.perf_counter() - start:8.3f}s')
+  return result
+
+
+def static_dep_files_of(metadata):
+  return metadata['static_dep_files'].split() + metadata['whole_static_dep_files'].split()
+
+
+def main():
+  args = get_args()
+  with tempfile.TemporaryDirectory() as temp_dir:
+    metadata = args.metadata
+    if not metadata:
+      metadata = os.path.join(temp_dir, 'compliance-metadata.db')
+      timed(f'make up DB of {args.modules} modules', lambda: make_up_db(metadata, args.packages, args.modules,
+                                                                         args.seed))
+    db = timed('load and reorg DB', lambda: compliance_metadata.MetadataDb(metadata))
+
+  installed_files_metadata = timed('get_installed_files', lambda: list(db.get_installed_files()))
+
+  def merge_soong_modules():
+    for metadata in installed_files_metadata:
+      soong_module = db.get_soong_module_of_installed_file(metadata['installed_file'])
+      if soong_module:
+        metadata.update(soong_module)
+      else:
+        metadata['static_dep_files'] = ''
+        metadata['whole_static_dep_files'] = ''
+  timed(f'get_soong_module_of_installed_file x{len(installed_files_metadata)}', merge_soong_modules)
+
+  timed(f'get_module_licenses x{len(installed_files_metadata)}',
+        lambda: [db.get_module_licenses(m.get('name', ''), m['module_path']) for m in installed_files_metadata])
+
+  # As gen_sbom.py, for all installed files at once
+  static_dep_files = timed('get_transitive_static_dep_files_of_all',
+                           lambda: db.get_transitive_static_dep_files_of_all(
+                               [f for m in installed_files_metadata for f in static_dep_files_of(m)]))
+  # As gen_notice_xml.py, for each installed file
+  timed(f'get_transitive_static_dep_files x{len(installed_files_metadata)}',
+        lambda: [[db.get_soong_module_of_built_file(f) for f in db.get_transitive_static_dep_files(static_dep_files_of(m))]
+                 for m in installed_files_metadata])
+  print(f'{len(installed_files_metadata)} installed files, {len(static_dep_files)} static dep files')
+
+
+if __name__ == '__main__':
+  main()
@@ -31,7 +31,6 @@ import gzip
 import hashlib
 import metadata_file_pb2
 import os
-import queue
 import xml.sax.saxutils
 
 
@@ -96,37 +95,19 @@ def md5_file_content(filepath):
 
 def get_transitive_static_dep_modules(installed_file_metadata, db):
   # Find all transitive static dep files of the installed files
-  q = queue.Queue()
+  dep_files = []
   if installed_file_metadata['static_dep_files']:
-    for f in installed_file_metadata['static_dep_files'].split(' '):
-      q.put(f)
+    dep_files += installed_file_metadata['static_dep_files'].split(' ')
   if installed_file_metadata['whole_static_dep_files']:
-    for f in installed_file_metadata['whole_static_dep_files'].split(' '):
-      q.put(f)
-
-  static_dep_files = {}
-  while not q.empty():
-    dep_file = q.get()
-    if dep_file in static_dep_files:
-      # It has been processed
-      continue
+    dep_files += installed_file_metadata['whole_static_dep_files'].split(' ')
 
+  static_dep_modules = []
+  for dep_file in db.get_transitive_static_dep_files(dep_files):
     soong_module = db.get_soong_module_of_built_file(dep_file)
-    if not soong_module:
-      continue
-
-    static_dep_files[dep_file] = soong_module
-
-    if soong_module['static_dep_files']:
-      for f in soong_module['static_dep_files'].split(' '):
-        if f not in static_dep_files:
-          q.put(f)
-    if soong_module['whole_static_dep_files']:
-      for f in soong_module['whole_static_dep_files'].split(' '):
-        if f not in static_dep_files:
-          q.put(f)
+    if soong_module:
+      static_dep_modules.append(soong_module)
 
-  return static_dep_files.values()
+  return static_dep_modules
 
 def main():
   global args
@@ -29,11 +29,10 @@ import argparse
 import compliance_metadata
 import datetime
 import google.protobuf.text_format as text_format
-import hashlib
 import os
 import pathlib
-import queue
 import metadata_file_pb2
+import sbom_checksums
 import sbom_data
 import sbom_writers
 
@@ -139,6 +138,7 @@ def get_args():
   parser.add_argument('--build_version', required=True, help='The build version.')
   parser.add_argument('--product_mfr', required=True, help='The product manufacturer.')
   parser.add_argument('--json', action='store_true', default=False, help='Generated SBOM file in SPDX JSON format')
+  parser.add_argument('--checksum_cache', help='The file to cache checksums of files between runs.')
 
   return parser.parse_args()
 
@@ -162,13 +162,7 @@ def new_license_id(license_name):
 
 
 def checksum(file_path):
-  h = hashlib.sha1()
-  if os.path.islink(file_path):
-    h.update(os.readlink(file_path).encode('utf-8'))
-  else:
-    with open(file_path, 'rb') as f:
-      h.update(f.read())
-  return f'SHA1: {h.hexdigest()}'
+  return file_checksums.checksum(file_path)
 
 
 def is_soong_prebuilt_module(file_metadata):
@@ -536,39 +530,20 @@ def add_licenses_of_file(file_id, file_metadata, doc):
 
 def get_all_transitive_static_dep_files_of_installed_files(installed_files_metadata, db, report):
   # Find all transitive static dep files of all installed files
-  q = queue.Queue()
+  dep_files = []
   for installed_file_metadata in installed_files_metadata:
     if installed_file_metadata['static_dep_files']:
-      for f in installed_file_metadata['static_dep_files'].split(' '):
-        q.put(f)
+      dep_files += installed_file_metadata['static_dep_files'].split(' ')
     if installed_file_metadata['whole_static_dep_files']:
-      for f in installed_file_metadata['whole_static_dep_files'].split(' '):
-        q.put(f)
-
-  all_static_dep_files = {}
-  while not q.empty():
-    dep_file = q.get()
-    if dep_file in all_static_dep_files:
-      # It has been processed
-      continue
+      dep_files += installed_file_metadata['whole_static_dep_files'].split(' ')
 
-    all_static_dep_files[dep_file] = True
-    soong_module = db.get_soong_module_of_built_file(dep_file)
-    if not soong_module:
+  all_static_dep_files = db.get_transitive_static_dep_files_of_all(dep_files)
+  for dep_file in all_static_dep_files:
+    if not db.get_soong_module_of_built_file(dep_file):
       # This should not happen, add to report[ISSUE_NO_MODULE_FOUND_FOR_STATIC_DEP]
-      report[ISSUE_NO_MODULE_FOUND_FOR_STATIC_DEP].append(f)
-      continue
-
-    if soong_module['static_dep_files']:
-      for f in soong_module['static_dep_files'].split(' '):
-        if f not in all_static_dep_files:
-          q.put(f)
-    if soong_module['whole_static_dep_files']:
-      for f in soong_module['whole_static_dep_files'].split(' '):
-        if f not in all_static_dep_files:
-          q.put(f)
+      report[ISSUE_NO_MODULE_FOUND_FOR_STATIC_DEP].append(dep_file)
 
-  return sorted(all_static_dep_files.keys())
+  return sorted(all_static_dep_files)
 
 
 def main():
@@ -576,6 +551,31 @@ def main():
   args = get_args()
   log('Args:', vars(args))
 
+  global file_checksums
+  with sbom_checksums.FileChecksums(args.checksum_cache) as file_checksums:
+    doc, report = create_sbom()
+
+  # Save SBOM records to output file
+  doc.generate_packages_verification_code()
+  doc.created = datetime.datetime.now(tz=datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+  prefix = args.output_file
+  if prefix.endswith('.spdx'):
+    prefix = prefix.removesuffix('.spdx')
+  elif prefix.endswith('.spdx.json'):
+    prefix = prefix.removesuffix('.spdx.json')
+
+  output_file = prefix + '.spdx'
+  with open(output_file, 'w', encoding="utf-8") as file:
+    sbom_writers.TagValueWriter.write(doc, file)
+  if args.json:
+    with open(prefix + '.spdx.json', 'w', encoding="utf-8") as file:
+      sbom_writers.JSONWriter.write(doc, file)
+
+  save_report(prefix + '-gen-report.txt', report)
+
+
+def create_sbom():
+  """Create the SBOM document of the installed files of the product, and the report of its issues."""
   global db
   db = compliance_metadata.MetadataDb(args.metadata)
   if args.debug:
@@ -620,7 +620,9 @@ def main():
   }
 
   # Get installed files and corresponding make modules' metadata if an installed file is from a make module.
-  installed_files_metadata = db.get_installed_files()
+  installed_files_metadata = list(db.get_installed_files())
+  # Hash the installed files in the background
+  file_checksums.prefetch(f['installed_file'] for f in installed_files_metadata)
 
   # Find which Soong module an installed file is from and merge metadata from Make and Soong
   for installed_file_metadata in installed_files_metadata:
@@ -697,7 +699,9 @@ def main():
     add_licenses_of_file(file_id, installed_file_metadata, doc)
 
   # Add all static library files to SBOM
-  for dep_file in get_all_transitive_static_dep_files_of_installed_files(installed_files_metadata, db, report):
+  static_dep_files = get_all_transitive_static_dep_files_of_installed_files(installed_files_metadata, db, report)
+  file_checksums.prefetch(static_dep_files)
+  for dep_file in static_dep_files:
     filepath = dep_file.removeprefix(args.soong_out + '/.intermediates/')
     file_id = new_file_id(filepath)
     # SHA1 of empty string. Sometimes .a files might not be built.
@@ -729,23 +733,7 @@ def main():
     # Add licenses of the static lib
     add_licenses_of_file(file_id, file_metadata, doc)
 
-  # Save SBOM records to output file
-  doc.generate_packages_verification_code()
-  doc.created = datetime.datetime.now(tz=datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
-  prefix = args.output_file
-  if prefix.endswith('.spdx'):
-    prefix = prefix.removesuffix('.spdx')
-  elif prefix.endswith('.spdx.json'):
-    prefix = prefix.removesuffix('.spdx.json')
-
-  output_file = prefix + '.spdx'
-  with open(output_file, 'w', encoding="utf-8") as file:
-    sbom_writers.TagValueWriter.write(doc, file)
-  if args.json:
-    with open(prefix + '.spdx.json', 'w', encoding="utf-8") as file:
-      sbom_writers.JSONWriter.write(doc, file)
-
-  save_report(prefix + '-gen-report.txt', report)
+  return doc, report
 
 
 if __name__ == '__main__':
@@ -27,9 +27,9 @@ import argparse
 import csv
 import datetime
 import google.protobuf.text_format as text_format
-import hashlib
 import os
 import metadata_file_pb2
+import sbom_checksums
 import sbom_data
 import sbom_writers
 
@@ -134,6 +134,7 @@ def get_args():
   parser.add_argument('--json', action='store_true', default=False, help='Generated SBOM file in SPDX JSON format')
   parser.add_argument('--unbundled_apk', action='store_true', default=False, help='Generate SBOM for unbundled APKs')
   parser.add_argument('--unbundled_apex', action='store_true', default=False, help='Generate SBOM for unbundled APEXs')
+  parser.add_argument('--checksum_cache', help='The file to cache checksums of files between runs.')
 
   return parser.parse_args()
 
@@ -153,13 +154,7 @@ def new_file_id(file_path):
 
 
 def checksum(file_path):
-  h = hashlib.sha1()
-  if os.path.islink(file_path):
-    h.update(os.readlink(file_path).encode('utf-8'))
-  else:
-    with open(file_path, 'rb') as f:
-      h.update(f.read())
-  return f'SHA1: {h.hexdigest()}'
+  return file_checksums.checksum(file_path)
 
 
 def is_soong_prebuilt_module(file_metadata):
@@ -477,10 +472,39 @@ def main():
   args = get_args()
   log('Args:', vars(args))
 
-  if args.unbundled_apk:
-    generate_sbom_for_unbundled_apk()
-    return
+  global file_checksums
+  with sbom_checksums.FileChecksums(args.checksum_cache) as file_checksums:
+    if args.unbundled_apk:
+      generate_sbom_for_unbundled_apk()
+      return
+    doc, report = create_sbom()
+
+  if args.unbundled_apex:
+    doc.describes = doc.files[0].id
+
+  # Save SBOM records to output file
+  doc.generate_packages_verification_code()
+  doc.created = datetime.datetime.now(tz=datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+  prefix = args.output_file
+  if prefix.endswith('.spdx'):
+    prefix = prefix.removesuffix('.spdx')
+  elif prefix.endswith('.spdx.json'):
+    prefix = prefix.removesuffix('.spdx.json')
+
+  output_file = prefix + '.spdx'
+  if args.unbundled_apex:
+    output_file = prefix + '-fragment.spdx'
+  with open(output_file, 'w', encoding="utf-8") as file:
+    sbom_writers.TagValueWriter.write(doc, file, fragment=args.unbundled_apex)
+  if args.json:
+    with open(prefix + '.spdx.json', 'w', encoding="utf-8") as file:
+      sbom_writers.JSONWriter.write(doc, file)
+
+  save_report(prefix + '-gen-report.txt', report)
+
 
+def create_sbom():
+  """Create the SBOM document of the installed files, and the report of its issues."""
   global metadata_file_protos
   metadata_file_protos = {}
 
@@ -524,8 +548,10 @@ def main():
 
   # Scan the metadata in CSV file and create the corresponding package and file records in SPDX
   with open(args.metadata, newline='') as sbom_metadata_file:
-    reader = csv.DictReader(sbom_metadata_file)
-    for installed_file_metadata in reader:
+    installed_files_metadata = list(csv.DictReader(sbom_metadata_file))
+    # Hash the installed files in the background
+    file_checksums.prefetch(f['build_output_path'] for f in installed_files_metadata)
+    for installed_file_metadata in installed_files_metadata:
       installed_file = installed_file_metadata['installed_file']
       module_path = installed_file_metadata['module_path']
       product_copy_files = installed_file_metadata['product_copy_files']
@@ -610,28 +636,7 @@ def main():
                                                       relationship=sbom_data.RelationshipType.STATIC_LINK,
                                                       id2=new_file_id(lib + '.a')))
 
-  if args.unbundled_apex:
-    doc.describes = doc.files[0].id
-
-  # Save SBOM records to output file
-  doc.generate_packages_verification_code()
-  doc.created = datetime.datetime.now(tz=datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
-  prefix = args.output_file
-  if prefix.endswith('.spdx'):
-    prefix = prefix.removesuffix('.spdx')
-  elif prefix.endswith('.spdx.json'):
-    prefix = prefix.removesuffix('.spdx.json')
-
-  output_file = prefix + '.spdx'
-  if args.unbundled_apex:
-    output_file = prefix + '-fragment.spdx'
-  with open(output_file, 'w', encoding="utf-8") as file:
-    sbom_writers.TagValueWriter.write(doc, file, fragment=args.unbundled_apex)
-  if args.json:
-    with open(prefix + '.spdx.json', 'w', encoding="utf-8") as file:
-      sbom_writers.JSONWriter.write(doc, file)
-
-  save_report(prefix + '-gen-report.txt', report)
+  return doc, report
 
 
 if __name__ == '__main__':
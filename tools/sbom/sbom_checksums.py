@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2026 The Android Open Source Project
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compute SHA1 checksums of files in SBOMs.
+
+Files are read in blocks and hashed on a thread pool. The checksums can be saved in a cache file, keyed by the path,
+size, mtime and inode of files, so that only the files changed since the last SBOM are hashed again.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
+
+BLOCK_SIZE = 1024 * 1024
+
+
+def file_checksum(file_path):
+  """Return the SHA1 checksum of a file, or of the target of a symbolic link."""
+  h = hashlib.sha1()
+  if os.path.islink(file_path):
+    h.update(os.readlink(file_path).encode('utf-8'))
+  else:
+    with open(file_path, 'rb') as f:
+      for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+        h.update(block)
+  return f'SHA1: {h.hexdigest()}'
+
+
+class FileChecksums:
+  """Checksums of files computed on a thread pool, with an optional persistent cache."""
+
+  def __init__(self, cache_file=None, max_workers=None):
+    self.cache_file = cache_file
+    # Maps file path to [size, mtime_ns, inode, checksum]
+    self.cache = {}
+    if cache_file and os.path.isfile(cache_file):
+      try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+          self.cache = json.load(f)
+      except (OSError, ValueError):
+        # Start over from a broken cache file
+        self.cache = {}
+    # Only the files used in this run are saved in the cache file
+    self.used_cache = {}
+    self.executor = ThreadPoolExecutor(max_workers=max_workers)
+    self.futures = {}
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    if exc_type is None:
+      self.close()
+    else:
+      # Don't wait for the files queued to be hashed, and keep the cache file, which this run didn't finish
+      self.executor.shutdown(cancel_futures=True)
+
+  def compute(self, file_path):
+    if os.path.islink(file_path):
+      return file_checksum(file_path)
+    stat = os.stat(file_path)
+    key = [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+    cached = self.cache.get(file_path)
+    if cached and cached[:3] == key:
+      sha1 = cached[3]
+    else:
+      sha1 = file_checksum(file_path)
+    self.used_cache[file_path] = key + [sha1]
+    return sha1
+
+  def prefetch(self, file_paths):
+    """Start computing the checksums of files that will be needed."""
+    for file_path in file_paths:
+      if file_path not in self.futures and (os.path.islink(file_path) or os.path.isfile(file_path)):
+        self.futures[file_path] = self.executor.submit(self.compute, file_path)
+
+  def checksum(self, file_path):
+    if file_path not in self.futures:
+      self.futures[file_path] = self.executor.submit(self.compute, file_path)
+    return self.futures[file_path].result()
+
+  def close(self):
+    self.executor.shutdown(cancel_futures=True)
+    if self.cache_file:
+      tmp_file = self.cache_file + '.tmp'
+      with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(self.used_cache, f)
+      os.replace(tmp_file, self.cache_file)
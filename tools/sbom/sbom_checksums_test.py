@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2026 The Android Open Source Project
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import os
+import tempfile
+import unittest
+from unittest import mock
+import sbom_checksums
+
+
+def sha1(data):
+  return f'SHA1: {hashlib.sha1(data).hexdigest()}'
+
+
+class FileChecksumsTest(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.TemporaryDirectory()
+    self.addCleanup(self.temp_dir.cleanup)
+    self.cache_file = os.path.join(self.temp_dir.name, 'cache.json')
+
+  def write_file(self, name, data):
+    path = os.path.join(self.temp_dir.name, name)
+    with open(path, 'wb') as f:
+      f.write(data)
+    return path
+
+  def test_checksum(self):
+    data = os.urandom(sbom_checksums.BLOCK_SIZE * 2 + 10)
+    big_file = self.write_file('big', data)
+    empty_file = self.write_file('empty', b'')
+    link = os.path.join(self.temp_dir.name, 'link')
+    os.symlink('big', link)
+    with sbom_checksums.FileChecksums() as checksums:
+      checksums.prefetch([big_file, empty_file, link, os.path.join(self.temp_dir.name, 'missing')])
+      self.assertEqual(checksums.checksum(big_file), sha1(data))
+      self.assertEqual(checksums.checksum(empty_file), 'SHA1: da39a3ee5e6b4b0d3255bfef95601890afd80709')
+      self.assertEqual(checksums.checksum(link), sha1(b'big'))
+
+  def test_cache(self):
+    file1 = self.write_file('file1', b'file1')
+    file2 = self.write_file('file2', b'file2')
+    with sbom_checksums.FileChecksums(self.cache_file) as checksums:
+      checksums.prefetch([file1, file2])
+      self.assertEqual(checksums.checksum(file1), sha1(b'file1'))
+      self.assertEqual(checksums.checksum(file2), sha1(b'file2'))
+
+    # Only the changed file is hashed again
+    self.write_file('file2', b'file2 changed')
+    with mock.patch.object(sbom_checksums, 'file_checksum', wraps=sbom_checksums.file_checksum) as file_checksum:
+      with sbom_checksums.FileChecksums(self.cache_file) as checksums:
+        self.assertEqual(checksums.checksum(file1), sha1(b'file1'))
+        self.assertEqual(checksums.checksum(file2), sha1(b'file2 changed'))
+      file_checksum.assert_called_once_with(file2)
+
+    # Files not used anymore are dropped from the cache
+    with sbom_checksums.FileChecksums(self.cache_file) as checksums:
+      checksums.checksum(file2)
+    with sbom_checksums.FileChecksums(self.cache_file) as checksums:
+      self.assertEqual(list(checksums.cache), [file2])
+
+  def test_error_cancels_prefetch(self):
+    files = [self.write_file(f'file{i}', b'file') for i in range(100)]
+    self.write_file('cache.json', b'{}')
+    with mock.patch.object(sbom_checksums, 'file_checksum', wraps=sbom_checksums.file_checksum) as file_checksum:
+      with self.assertRaises(ValueError):
+        with sbom_checksums.FileChecksums(self.cache_file, max_workers=1) as checksums:
+          checksums.prefetch(files)
+          raise ValueError()
+      self.assertLess(file_checksum.call_count, len(files))
+    with open(self.cache_file, 'rb') as f:
+      self.assertEqual(f.read(), b'{}')
+
+  def test_broken_cache(self):
+    file1 = self.write_file('file1', b'file1')
+    self.write_file('cache.json', b'{broken')
+    with sbom_checksums.FileChecksums(self.cache_file) as checksums:
+      self.assertEqual(checksums.checksum(file1), sha1(b'file1'))
+
+
+if __name__ == '__main__':
+  unittest.main(verbosity=2)
@@ -18,11 +18,15 @@
 Serialize objects defined in package sbom_data to SPDX format: tagvalue, JSON.
 """
 
+import itertools
 import json
+import types
 import sbom_data
 
 SPDX_VER = 'SPDX-2.3'
 DATA_LIC = 'CC0-1.0'
+JSON_INDENT = 4
+JSON_ENCODER = json.JSONEncoder(indent=JSON_INDENT)
 
 
 class Tags:
@@ -90,7 +94,7 @@ class TagValueWriter:
     return headers
 
   @staticmethod
-  def marshal_package(sbom_doc, package, fragment):
+  def marshal_package(sbom_doc, package, fragment, files):
     download_location = sbom_data.VALUE_NOASSERTION
     if package.download_location:
       download_location = package.download_location
@@ -124,16 +128,35 @@ class TagValueWriter:
           f'{Tags.RELATIONSHIP}: {sbom_doc.id} {sbom_data.RelationshipType.DESCRIBES} {sbom_doc.describes}')
       tagvalues.append('')
 
-    for file in sbom_doc.files:
-      if file.id in package.file_ids:
-        tagvalues += TagValueWriter.marshal_file(file)
+    for file in files:
+      tagvalues += TagValueWriter.marshal_file(file)
 
     return tagvalues
 
   @staticmethod
-  def marshal_packages(sbom_doc, fragment):
-    tagvalues = []
-    marshaled_relationships = []
+  def get_package_files(sbom_doc):
+    """Return the files of each package of sbom_doc.packages, in the order of sbom_doc.files.
+
+    The packages are told apart by their index, as packages may have the same id but other files.
+    """
+    file_packages = {}
+    for i, package in enumerate(sbom_doc.packages):
+      for file_id in package.file_ids:
+        file_packages.setdefault(file_id, {})[i] = True
+    package_files = [[] for _ in sbom_doc.packages]
+    for file in sbom_doc.files:
+      for i in file_packages.get(file.id, {}):
+        package_files[i].append(file)
+    return package_files
+
+  @staticmethod
+  def marshal_packages(sbom_doc, fragment, marshaled_relationships):
+    """Yield the lines of all packages, and add the relationships output with them to marshaled_relationships."""
+    package_files = TagValueWriter.get_package_files(sbom_doc)
+    variant_of_rels = {}
+    for r in sbom_doc.relationships:
+      if r.relationship == sbom_data.RelationshipType.VARIANT_OF:
+        variant_of_rels.setdefault((r.id1, r.id2), r)
     i = 0
     packages = sbom_doc.packages
     while i < len(packages):
@@ -142,24 +165,19 @@ class TagValueWriter:
           and packages[i + 1].id.startswith('SPDXRef-UPSTREAM-')):
         # Output SOURCE, UPSTREAM packages and their VARIANT_OF relationship together, so they are close to each other
         # in SBOMs in tagvalue format.
-        tagvalues += TagValueWriter.marshal_package(sbom_doc, packages[i], fragment)
-        tagvalues += TagValueWriter.marshal_package(sbom_doc, packages[i + 1], fragment)
-        rel = next((r for r in sbom_doc.relationships if
-                    r.id1 == packages[i].id and
-                    r.id2 == packages[i + 1].id and
-                    r.relationship == sbom_data.RelationshipType.VARIANT_OF), None)
+        yield from TagValueWriter.marshal_package(sbom_doc, packages[i], fragment, package_files[i])
+        yield from TagValueWriter.marshal_package(sbom_doc, packages[i + 1], fragment, package_files[i + 1])
+        rel = variant_of_rels.get((packages[i].id, packages[i + 1].id))
         if rel:
-          marshaled_relationships.append(rel)
-          tagvalues.append(TagValueWriter.marshal_relationship(rel))
-          tagvalues.append('')
+          marshaled_relationships.add((rel.id1, rel.id2, rel.relationship))
+          yield TagValueWriter.marshal_relationship(rel)
+          yield ''
 
         i += 2
       else:
-        tagvalues += TagValueWriter.marshal_package(sbom_doc, packages[i], fragment)
+        yield from TagValueWriter.marshal_package(sbom_doc, packages[i], fragment, package_files[i])
         i += 1
 
-    return tagvalues, marshaled_relationships
-
   @staticmethod
   def marshal_file(file):
     tagvalues = [
@@ -177,20 +195,17 @@ class TagValueWriter:
 
   @staticmethod
   def marshal_files(sbom_doc, fragment):
-    tagvalues = []
-    files_in_packages = []
+    files_in_packages = set()
     for package in sbom_doc.packages:
-      files_in_packages += package.file_ids
+      files_in_packages.update(package.file_ids)
     for file in sbom_doc.files:
       if file.id in files_in_packages:
         continue
-      tagvalues += TagValueWriter.marshal_file(file)
+      yield from TagValueWriter.marshal_file(file)
       if file.id == sbom_doc.describes and not fragment:
         # Fragment is not a full SBOM document so the relationship DESCRIBES is not applicable.
-        tagvalues.append(
-            f'{Tags.RELATIONSHIP}: {sbom_doc.id} {sbom_data.RelationshipType.DESCRIBES} {sbom_doc.describes}')
-        tagvalues.append('')
-    return tagvalues
+        yield f'{Tags.RELATIONSHIP}: {sbom_doc.id} {sbom_data.RelationshipType.DESCRIBES} {sbom_doc.describes}'
+        yield ''
 
   @staticmethod
   def marshal_relationship(rel):
@@ -198,15 +213,12 @@ class TagValueWriter:
 
   @staticmethod
   def marshal_relationships(sbom_doc, marshaled_rels):
-    tagvalues = []
     sorted_rels = sorted(sbom_doc.relationships, key=lambda r: r.id2 + r.id1)
     for rel in sorted_rels:
-      if any(r.id1 == rel.id1 and r.id2 == rel.id2 and r.relationship == rel.relationship
-             for r in marshaled_rels):
+      if (rel.id1, rel.id2, rel.relationship) in marshaled_rels:
         continue
-      tagvalues.append(TagValueWriter.marshal_relationship(rel))
-    tagvalues.append('')
-    return tagvalues
+      yield TagValueWriter.marshal_relationship(rel)
+    yield ''
 
   @staticmethod
   def marshal_license(license):
@@ -218,23 +230,26 @@ class TagValueWriter:
 
   @staticmethod
   def marshal_licenses(sbom_doc):
-    tagvalues = []
     for license in sbom_doc.licenses:
-      tagvalues += TagValueWriter.marshal_license(license)
-      tagvalues.append('')
-    return tagvalues
+      yield from TagValueWriter.marshal_license(license)
+      yield ''
 
   @staticmethod
   def write(sbom_doc, file, fragment=False):
-    content = []
+    # Lines are written as they are marshaled, and separated by newlines.
+    # The relationships marshaled with packages are known once all packages are written.
+    marshaled_relationships = set()
+    sections = []
     if not fragment:
-      content += TagValueWriter.marshal_doc_headers(sbom_doc)
-    content += TagValueWriter.marshal_files(sbom_doc, fragment)
-    tagvalues, marshaled_relationships = TagValueWriter.marshal_packages(sbom_doc, fragment)
-    content += tagvalues
-    content += TagValueWriter.marshal_relationships(sbom_doc, marshaled_relationships)
-    content += TagValueWriter.marshal_licenses(sbom_doc)
-    file.write('\n'.join(content))
+      sections.append(TagValueWriter.marshal_doc_headers(sbom_doc))
+    sections.append(TagValueWriter.marshal_files(sbom_doc, fragment))
+    sections.append(TagValueWriter.marshal_packages(sbom_doc, fragment, marshaled_relationships))
+    sections.append(TagValueWriter.marshal_relationships(sbom_doc, marshaled_relationships))
+    sections.append(TagValueWriter.marshal_licenses(sbom_doc))
+    separator = ''
+    for line in itertools.chain.from_iterable(sections):
+      file.write(separator + line)
+      separator = '\n'
 
 
 class PropNames:
@@ -321,94 +336,117 @@ class JSONWriter:
     return headers
 
   @staticmethod
-  def marshal_packages(sbom_doc):
-    packages = []
-    for p in sbom_doc.packages:
-      package = {
-        PropNames.NAME: p.name,
-        PropNames.SPDXID: p.id,
-        PropNames.PACKAGE_DOWNLOAD_LOCATION: p.download_location if p.download_location else sbom_data.VALUE_NOASSERTION,
-        PropNames.FILES_ANALYZED: p.files_analyzed
+  def marshal_package(p):
+    package = {
+      PropNames.NAME: p.name,
+      PropNames.SPDXID: p.id,
+      PropNames.PACKAGE_DOWNLOAD_LOCATION: p.download_location if p.download_location else sbom_data.VALUE_NOASSERTION,
+      PropNames.FILES_ANALYZED: p.files_analyzed
+    }
+    if p.version:
+      package[PropNames.PACKAGE_VERSION] = p.version
+    if p.supplier:
+      package[PropNames.PACKAGE_SUPPLIER] = p.supplier
+    package[PropNames.PACKAGE_LICENSE_DECLARED] = sbom_data.VALUE_NOASSERTION
+    if p.declared_license_ids:
+      package[PropNames.PACKAGE_LICENSE_DECLARED] = ' OR '.join(p.declared_license_ids)
+    if p.verification_code:
+      package[PropNames.PACKAGE_VERIFICATION_CODE] = {
+        PropNames.PACKAGE_VERIFICATION_CODE_VALUE: p.verification_code
       }
-      if p.version:
-        package[PropNames.PACKAGE_VERSION] = p.version
-      if p.supplier:
-        package[PropNames.PACKAGE_SUPPLIER] = p.supplier
-      package[PropNames.PACKAGE_LICENSE_DECLARED] = sbom_data.VALUE_NOASSERTION
-      if p.declared_license_ids:
-        package[PropNames.PACKAGE_LICENSE_DECLARED] = ' OR '.join(p.declared_license_ids)
-      if p.verification_code:
-        package[PropNames.PACKAGE_VERIFICATION_CODE] = {
-          PropNames.PACKAGE_VERIFICATION_CODE_VALUE: p.verification_code
+    if p.external_refs:
+      package[PropNames.PACKAGE_EXTERNAL_REFS] = []
+      for ref in p.external_refs:
+        ext_ref = {
+          PropNames.PACKAGE_EXTERNAL_REF_CATEGORY: ref.category,
+          PropNames.PACKAGE_EXTERNAL_REF_TYPE: ref.type,
+          PropNames.PACKAGE_EXTERNAL_REF_LOCATOR: ref.locator,
         }
-      if p.external_refs:
-        package[PropNames.PACKAGE_EXTERNAL_REFS] = []
-        for ref in p.external_refs:
-          ext_ref = {
-            PropNames.PACKAGE_EXTERNAL_REF_CATEGORY: ref.category,
-            PropNames.PACKAGE_EXTERNAL_REF_TYPE: ref.type,
-            PropNames.PACKAGE_EXTERNAL_REF_LOCATOR: ref.locator,
-          }
-          package[PropNames.PACKAGE_EXTERNAL_REFS].append(ext_ref)
-      if p.file_ids:
-        package[PropNames.PACKAGE_HAS_FILES] = []
-        for file_id in p.file_ids:
-          package[PropNames.PACKAGE_HAS_FILES].append(file_id)
-
-      packages.append(package)
-
-    return {PropNames.PACKAGES: packages}
+        package[PropNames.PACKAGE_EXTERNAL_REFS].append(ext_ref)
+    if p.file_ids:
+      package[PropNames.PACKAGE_HAS_FILES] = []
+      for file_id in p.file_ids:
+        package[PropNames.PACKAGE_HAS_FILES].append(file_id)
+
+    return package
+
+  @staticmethod
+  def marshal_packages(sbom_doc):
+    for p in sbom_doc.packages:
+      yield JSONWriter.marshal_package(p)
+
+  @staticmethod
+  def marshal_file(f):
+    file = {
+      PropNames.FILE_NAME: f.name,
+      PropNames.SPDXID: f.id
+    }
+    checksum = f.checksum.split(': ')
+    file[PropNames.FILE_CHECKSUMS] = [{
+      PropNames.ALGORITHM: checksum[0],
+      PropNames.CHECKSUM_VALUE: checksum[1],
+    }]
+    file[PropNames.FILE_LICENSE_CONCLUDED] = sbom_data.VALUE_NOASSERTION
+    if f.concluded_license_ids:
+      file[PropNames.FILE_LICENSE_CONCLUDED] = ' OR '.join(f.concluded_license_ids)
+    return file
 
   @staticmethod
   def marshal_files(sbom_doc):
-    files = []
     for f in sbom_doc.files:
-      file = {
-        PropNames.FILE_NAME: f.name,
-        PropNames.SPDXID: f.id
-      }
-      checksum = f.checksum.split(': ')
-      file[PropNames.FILE_CHECKSUMS] = [{
-        PropNames.ALGORITHM: checksum[0],
-        PropNames.CHECKSUM_VALUE: checksum[1],
-      }]
-      file[PropNames.FILE_LICENSE_CONCLUDED] = sbom_data.VALUE_NOASSERTION
-      if f.concluded_license_ids:
-        file[PropNames.FILE_LICENSE_CONCLUDED] = ' OR '.join(f.concluded_license_ids)
-      files.append(file)
-    return {PropNames.FILES: files}
+      yield JSONWriter.marshal_file(f)
 
   @staticmethod
   def marshal_relationships(sbom_doc):
-    relationships = []
     sorted_rels = sorted(sbom_doc.relationships, key=lambda r: r.relationship + r.id2 + r.id1)
     for r in sorted_rels:
-      rel = {
+      yield {
         PropNames.REL_ELEMENT_ID: r.id1,
         PropNames.REL_RELATED_ELEMENT_ID: r.id2,
         PropNames.REL_TYPE: r.relationship,
       }
-      relationships.append(rel)
-
-    return {PropNames.RELATIONSHIPS: relationships}
 
   @staticmethod
   def marshal_licenses(sbom_doc):
-    licenses = []
     for l in sbom_doc.licenses:
-      licenses.append({
+      yield {
           PropNames.LICENSE_ID: l.id,
           PropNames.LICENSE_NAME: l.name,
           PropNames.LICENSE_EXTRACTED_TEXT: f'<text>{l.text}</text>'
-      })
-    return {PropNames.LICENSES: licenses}
+      }
+
+  @staticmethod
+  def dumps(value, level):
+    # json.dumps(value, indent=4) nested at the given indentation level. JSON strings have no raw newlines.
+    return JSON_ENCODER.encode(value).replace('\n', '\n' + ' ' * (JSON_INDENT * level))
+
+  @staticmethod
+  def write_array(file, values):
+    # Same as JSONWriter.dumps(list(values), 1), without all values in memory.
+    separator = '[\n'
+    for value in values:
+      file.write(separator + ' ' * (JSON_INDENT * 2) + JSONWriter.dumps(value, 2))
+      separator = ',\n'
+    if separator == '[\n':
+      file.write('[]')
+    else:
+      file.write('\n' + ' ' * JSON_INDENT + ']')
 
   @staticmethod
   def write(sbom_doc, file):
-    doc = {}
-    doc.update(JSONWriter.marshal_doc_headers(sbom_doc))
-    doc.update(JSONWriter.marshal_packages(sbom_doc))
-    doc.update(JSONWriter.marshal_files(sbom_doc))
-    doc.update(JSONWriter.marshal_relationships(sbom_doc))
-    doc.update(JSONWriter.marshal_licenses(sbom_doc))
-    file.write(json.dumps(doc, indent=4))
+    # The output is the same as json.dumps(doc, indent=4) of the whole document, but packages, files, relationships
+    # and licenses are written as they are marshaled.
+    props = list(JSONWriter.marshal_doc_headers(sbom_doc).items())
+    props.append((PropNames.PACKAGES, JSONWriter.marshal_packages(sbom_doc)))
+    props.append((PropNames.FILES, JSONWriter.marshal_files(sbom_doc)))
+    props.append((PropNames.RELATIONSHIPS, JSONWriter.marshal_relationships(sbom_doc)))
+    props.append((PropNames.LICENSES, JSONWriter.marshal_licenses(sbom_doc)))
+    separator = '{\n'
+    for name, value in props:
+      file.write(separator + ' ' * JSON_INDENT + json.dumps(name) + ': ')
+      if isinstance(value, types.GeneratorType):
+        JSONWriter.write_array(file, value)
+      else:
+        file.write(JSONWriter.dumps(value, 1))
+      separator = ',\n'
+    file.write('\n}')
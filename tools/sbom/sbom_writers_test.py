@@ -178,6 +178,24 @@ class SBOMWritersTest(unittest.TestCase):
       self.maxDiff = None
       self.assertEqual(expected_output, output.getvalue())
 
+  def test_tagvalue_writer_packages_with_same_id(self):
+    # Document.add_package merges packages with the same id, but packages may also be appended directly
+    doc = sbom_data.Document(name='test doc', namespace='http://www.google.com/sbom/spdx/android',
+                             creators=[SUPPLIER_GOOGLE], created='2023-03-31T22:17:58Z')
+    for name, file_id in (('Prebuilt package1', SPDXID_FILE1), ('Prebuilt package2', SPDXID_FILE2)):
+      doc.packages.append(sbom_data.Package(id=SPDXID_PREBUILT_PACKAGE1, name=name, files_analyzed=True,
+                                            file_ids=[file_id]))
+    doc.files.append(sbom_data.File(id=SPDXID_FILE1, name='/bin/file1', checksum='SHA1: 11111'))
+    doc.files.append(sbom_data.File(id=SPDXID_FILE2, name='/bin/file2', checksum='SHA1: 22222'))
+    with io.StringIO() as output:
+      sbom_writers.TagValueWriter.write(doc, output)
+      packages = output.getvalue().split('PackageName: ')[1:]
+    self.assertEqual(len(packages), 2)
+    self.assertIn('FileName: /bin/file1', packages[0])
+    self.assertNotIn('FileName: /bin/file2', packages[0])
+    self.assertIn('FileName: /bin/file2', packages[1])
+    self.assertNotIn('FileName: /bin/file1', packages[1])
+
   def test_json_writer(self):
     with io.StringIO() as output:
       sbom_writers.JSONWriter.write(self.sbom_doc, output)
@@ -0,0 +1,178 @@
+# python3
+# Copyright (C) 2026 The Android Open Source Project
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark of the warning classifier against trying all patterns in order.
+
+Classifies the unique warning lines of a recorded build.log, or lines made up
+from the warn patterns and project paths, with both methods and checks that
+they give the same results.
+
+Usage: python3 -m warn.classifier_benchmark [--log build.log]
+"""
+
+import argparse
+import io
+import random
+import re
+import string
+import time
+
+# pylint:disable=relative-beyond-top-level,no-name-in-module
+from . import warn_common as common
+
+try:
+  from re import _parser as sre_parse  # pylint:disable=ungrouped-imports
+  from re import _constants as sre_constants
+except ImportError:
+  import sre_parse  # pylint:disable=deprecated-module
+  import sre_constants  # pylint:disable=deprecated-module
+
+
+def linear_classify(line, project_patterns, warn_patterns):
+  """Classify line by trying all the patterns in order."""
+  for idx, pattern in enumerate(warn_patterns):
+    for cpat in pattern['compiled_patterns']:
+      if cpat.match(line):
+        return idx, common.find_project_index(line, project_patterns)
+  return -1, -1
+
+
+def random_text(rng, parsed, max_repeat=3):
+  """Return a random string matched by the parsed regex."""
+  # pylint:disable=too-many-branches
+  text = ''
+  for op, arg in parsed:
+    if op == sre_constants.LITERAL:
+      text += chr(arg)
+    elif op == sre_constants.NOT_LITERAL:
+      text += rng.choice([c for c in string.ascii_letters if ord(c) != arg])
+    elif op == sre_constants.ANY:
+      text += rng.choice(string.ascii_letters + ' ./:-[]')
+    elif op == sre_constants.IN:
+      text += random_char_in(rng, arg)
+    elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+      low, high, item = arg
+      high = min(high, low + max_repeat)
+      for _ in range(rng.randint(low, high)):
+        text += random_text(rng, item, max_repeat)
+    elif op == sre_constants.SUBPATTERN:
+      text += random_text(rng, arg[-1], max_repeat)
+    elif op == sre_constants.BRANCH:
+      text += random_text(rng, rng.choice(arg[1]), max_repeat)
+    elif op == sre_constants.CATEGORY:
+      text += random_category_char(rng, arg)
+  return text
+
+
+def random_category_char(rng, category):
+  if category == sre_constants.CATEGORY_DIGIT:
+    return rng.choice(string.digits)
+  if category == sre_constants.CATEGORY_SPACE:
+    return ' '
+  return rng.choice(string.ascii_letters)
+
+
+def random_char_in(rng, items):
+  """Return a random char of a character class."""
+  if items[0][0] == sre_constants.NEGATE:
+    excluded = set()
+    for op, arg in items[1:]:
+      if op == sre_constants.LITERAL:
+        excluded.add(chr(arg))
+      elif op == sre_constants.RANGE:
+        excluded.update(chr(c) for c in range(arg[0], arg[1] + 1))
+    return rng.choice([c for c in string.ascii_letters + ' ./:-'
+                       if c not in excluded] or ['?'])
+  op, arg = rng.choice(items)
+  if op == sre_constants.LITERAL:
+    return chr(arg)
+  if op == sre_constants.RANGE:
+    return chr(rng.randint(arg[0], arg[1]))
+  if op == sre_constants.CATEGORY:
+    return random_category_char(rng, arg)
+  return 'x'
+
+
+def synthesize_lines(num_lines, project_list, warn_patterns, seed):
+  """Make up warning lines from the warn patterns and the project paths."""
+  rng = random.Random(seed)
+  parsed = [sre_parse.parse(p) for w in warn_patterns for p in w['patterns']]
+  paths = [re.sub(r'[^A-Za-z0-9_/-]', '', p[1][len('(^|.*/)'):-len(
+      '/.*: warning:')]) for p in project_list]
+  lines = []
+  for _ in range(num_lines):
+    text = random_text(rng, rng.choice(parsed))
+    # Put most of the lines in a project.
+    if rng.random() < 0.8 and ': warning:' in text:
+      path = rng.choice(['', 'out/soong/.intermediates/']) + rng.choice(paths)
+      text = (path + '/' + text).replace('//', '/')
+    lines.append(text)
+  return lines
+
+
+def read_log_lines(log, flags):
+  with io.open(log, encoding='utf-8') as f:
+    warnings, _ = common.parse_input_file(f, flags)
+  return list(warnings)
+
+
+def timed(title, func):
+  start = time.perf_counter()
+  result = func()
+  print('%-40s %8.3fs' % (title, time.perf_counter() - start))
+  return result
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--log', help='recorded build.log to classify')
+  parser.add_argument('--platform', default='android',
+                      choices=['chrome', 'android'])
+  parser.add_argument('--lines', type=int, default=100000,
+                      help='number of made up lines without --log')
+  parser.add_argument('--seed', type=int, default=0)
+  flags = parser.parse_args()
+  flags.url = ''
+
+  warn_patterns = common.get_warn_patterns(flags.platform)
+  project_list = common.get_project_list(flags.platform)
+  project_patterns = [re.compile(p[1]) for p in project_list]
+  if flags.log:
+    lines = timed('parse %s' % flags.log,
+                  lambda: read_log_lines(flags.log, flags))
+  else:
+    lines = timed('synthesize %d lines' % flags.lines,
+                  lambda: synthesize_lines(flags.lines, project_list,
+                                           warn_patterns, flags.seed))
+
+  classifier = timed('index', lambda: common.WarningClassifier(
+      warn_patterns, project_patterns))
+  indexed = timed('classify %d lines' % len(lines),
+                  lambda: [classifier.classify(line) for line in lines])
+  linear = timed('classify %d lines linearly' % len(lines),
+                 lambda: [linear_classify(line, project_patterns,
+                                          warn_patterns) for line in lines])
+  mismatches = [(line, a, b) for line, a, b in zip(lines, indexed, linear)
+                if a != b]
+  for line, a, b in mismatches[:10]:
+    print('MISMATCH %r: %s != %s' % (line, a, b))
+  print('%d lines, %d classified, %d mismatches' % (
+      len(lines), sum(1 for idx, _ in linear if idx >= 0), len(mismatches)))
+  if mismatches:
+    raise SystemExit(1)
+
+
+if __name__ == '__main__':
+  main()
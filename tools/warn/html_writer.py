@@ -53,11 +53,24 @@
 # New dynamic HTML related function to emit data:
 #   escape_string, strip_escape_string, emit_warning_arrays
 #   emit_js_data():
+#
+# Paged HTML report, written by write_paged_html into a directory:
+#   index.html has the same sections but not the warning messages.
+#   NumWarnings:           number of warning messages
+#   WarningCounts:         [pattern, project, count] of all warnings
+#   ShardNames:            names of all shard files
+#   TopDirsRows, TopFilesRows: precomputed TopDirs and TopFiles
+#   shards/s<severity>_p<project>.json.gz has the [pattern, message(, link)]
+#   of a severity and project, loaded on demand by the page.
 
 from __future__ import print_function
+import collections
 import csv
 import datetime
+import gzip
 import html
+import json
+import os
 import sys
 
 # pylint:disable=relative-beyond-top-level
@@ -389,6 +402,26 @@ def dump_csv_with_description(csvwriter, warning_records, warning_messages,
     csvwriter.writerow(output)
 
 
+def dump_csv_diff(csvwriter, added, removed, warn_patterns, project_names):
+  """Outputs the warning messages added and removed since a baseline."""
+  csv_output = []
+  for change, warnings in (('added', added), ('removed', removed)):
+    for warning, pattern_idx, project_idx in warnings:
+      pattern = warn_patterns[pattern_idx]
+      csv_output.append([change, project_names[project_idx],
+                         pattern['severity'].header, pattern['category'],
+                         pattern['description'], warning])
+  for output in sorted(csv_output):
+    csvwriter.writerow(output)
+
+
+def write_diff_csv(path, added, removed, warn_patterns, project_names):
+  """Write csv file of the warnings added and removed since a baseline."""
+  with open(path, 'w') as outf:
+    dump_csv_diff(csv.writer(outf, lineterminator='\n'), added, removed,
+                  warn_patterns, project_names)
+
+
 # Return line with escaped backslash and quotation characters.
 def escape_string(line):
   return line.replace('\\', '\\\\').replace('"', '\\"')
@@ -568,6 +601,162 @@ SCRIPTS_FOR_WARNING_GROUPS = """
 """
 
 
+# Replaces functions of SCRIPTS_FOR_WARNING_GROUPS and DRAW_TABLE_JAVASCRIPT
+# in a paged HTML report, to load the warning messages from the shard files
+# only when a section is expanded or a directory/file is selected.
+PAGED_SCRIPTS_FOR_WARNING_GROUPS = """
+  var LoadedShards = {};
+  function loadShard(name) {
+    if (!(name in LoadedShards)) {
+      LoadedShards[name] = fetch(ShardDir + name + ".json.gz")
+        .then((response) => response.arrayBuffer())
+        .then((data) => {
+          var bytes = new Uint8Array(data);
+          if (bytes[0] != 0x1f || bytes[1] != 0x8b) {
+            // Already decompressed by the server.
+            return new Response(data).json();
+          }
+          return new Response(new Blob([data]).stream().pipeThrough(
+              new DecompressionStream("gzip"))).json();
+        });
+    }
+    return LoadedShards[name];
+  }
+  function loadWarnings(names) {
+    return Promise.all(names.map(loadShard)).then(
+        (shards) => [].concat(...shards));
+  }
+  function shardName(w, p) {
+    return "s" + WarnPatternsSeverity[w] + "_p" + p;
+  }
+  function warningLine(row) {
+    return (FlagPlatform == "chrome") ? addURLToLine(row[1], row[2])
+                                      : addURL(row[1]);
+  }
+  function groupWarningsBySeverity() {
+    // groups is an array of dictionaries,
+    // each dictionary maps from warning type to array of WarningCounts.
+    var groups = createArrayOfDictionaries(SeverityColors.length);
+    for (var i=0; i<WarningCounts.length; i++) {
+      var w = WarningCounts[i][0];
+      var s = WarnPatternsSeverity[w];
+      var k = w.toString();
+      if (!(k in groups[s]))
+        groups[s][k] = [];
+      groups[s][k].push(WarningCounts[i]);
+    }
+    return groups;
+  }
+  function groupWarningsByProject() {
+    var groups = createArrayOfDictionaries(ProjectNames.length);
+    for (var i=0; i<WarningCounts.length; i++) {
+      var w = WarningCounts[i][0];
+      var p = WarningCounts[i][1];
+      var k = w.toString();
+      if (!(k in groups[p]))
+        groups[p][k] = [];
+      groups[p][k].push(WarningCounts[i]);
+    }
+    return groups;
+  }
+  // Maps the anchor of a section not loaded yet to [warning type, projects].
+  var UnloadedSections = {};
+  function createWarningSection(header, color, group) {
+    var result = "";
+    var groupKeys = [];
+    var totalMessages = 0;
+    for (var k in group) {
+       var count = 0;
+       for (var i=0; i<group[k].length; i++)
+         count += group[k][i][2];
+       totalMessages += count;
+       groupKeys.push([k, WarnPatternsSeverity[parseInt(k)], count]);
+    }
+    groupKeys.sort(bySeverityMessageCount);
+    for (var idx=0; idx<groupKeys.length; idx++) {
+      var k = groupKeys[idx][0];
+      var w = parseInt(k);
+      var wcolor = SeverityColors[WarnPatternsSeverity[w]];
+      var description = WarnPatternsDescription[w];
+      if (description.length == 0)
+          description = "???";
+      GlobalAnchor += 1;
+      UnloadedSections[GlobalAnchor] = [w, group[k].map((x) => x[1])];
+      result += "<table class='t1'><tr bgcolor='" + wcolor + "'><td>" +
+                "<button class='bt' id='" + GlobalAnchor + "_mark" +
+                "' onclick='expandWarnings(\\"" + GlobalAnchor + "\\");'>" +
+                "&#x2295</button> " +
+                description + " (" + groupKeys[idx][2] + ")</td></tr></table>";
+      result += "<div id='" + GlobalAnchor +
+                "' style='display:none;'></div>";
+    }
+    if (result.length > 0) {
+      return "<br><span style='background-color:" + color + "'><b>" +
+             header + ": " + totalMessages +
+             "</b></span><blockquote><table class='t1'>" +
+             result + "</table></blockquote>";
+
+    }
+    return "";  // empty section
+  }
+  function loadSection(id) {
+    if (!(id in UnloadedSections)) return;
+    var [w, projects] = UnloadedSections[id];
+    delete UnloadedSections[id];
+    var e = document.getElementById(id);
+    e.innerHTML = "Loading...";
+    loadWarnings(projects.map((p) => shardName(w, p))).then((rows) => {
+      rows = rows.filter((row) => row[0] == w);
+      rows.sort((x1, x2) => (x1[1] <= x2[1]) ? -1 : 1);
+      var result = "<table class='t1'>";
+      var c = 0;
+      for (var i=0; i<rows.length; i++) {
+        result += "<tr><td class='c" + c + "'>" + warningLine(rows[i]) +
+                  "</td></tr>";
+        c = 1 - c;
+      }
+      e.innerHTML = result + "</table>";
+    }, (error) => {
+      UnloadedSections[id] = [w, projects];
+      e.innerHTML = "Cannot load warnings: " + error;
+    });
+  }
+  function expandWarnings(id) {
+    expand(id);
+    loadSection(id);
+  }
+  function expandCollapse(show) {
+    for (var id = 1; ; id++) {
+      var e = document.getElementById(id + "");
+      var f = document.getElementById(id + "_mark");
+      if (!e || !f) break;
+      e.style.display = (show ? 'block' : 'none');
+      f.innerHTML = (show ? '&#x2296' : '&#x2295');
+      if (show) loadSection(id);
+    }
+  }
+  function computeTopDirsFiles() {
+    TopDirs = TopDirsRows;
+    TopFiles = TopFilesRows;
+  }
+  function drawSelectedWarnings(div, title, prefix, type) {
+    div.innerHTML = "Loading...";
+    loadWarnings(ShardNames).then((rows) => {
+      var data = new google.visualization.DataTable();
+      data.addColumn('string', title);
+      for (var i = 0; i < rows.length; i++) {
+        if ((prefix.startsWith("*") || rows[i][1].startsWith(prefix)) &&
+            (type == "" || rows[i][1].endsWith(type))) {
+          data.addRow([warningLine(rows[i])]);
+        }
+      }
+      var table = new google.visualization.Table(div);
+      table.draw(data, {allowHtml: true, alternatingRowStyle: true});
+    });
+  }
+"""
+
+
 # Emit a JavaScript const number
 def emit_const_number(name, value, writer):
   writer('const ' + name + ' = ' + str(value) + ';')
@@ -613,6 +802,16 @@ def emit_const_object_array(name, array, writer):
 def emit_js_data(writer, flags, warning_messages, warning_links,
                  warning_records, warn_patterns, project_names):
   """Dump dynamic HTML page's static JavaScript data."""
+  emit_js_pattern_data(writer, flags, warn_patterns, project_names)
+  emit_const_number('NumWarnings', len(warning_messages), writer)
+  emit_const_html_string_array('WarningMessages', warning_messages, writer)
+  emit_const_object_array('Warnings', warning_records, writer)
+  if flags.platform == 'chrome':
+    emit_const_html_string_array('WarningLinks', warning_links, writer)
+
+
+def emit_js_pattern_data(writer, flags, warn_patterns, project_names):
+  """Dump the JavaScript data of flags, severities, projects and patterns."""
   emit_const_string('FlagPlatform', flags.platform, writer)
   emit_const_string('FlagURL', flags.url, writer)
   emit_const_string('FlagSeparator', flags.separator, writer)
@@ -632,10 +831,6 @@ def emit_js_data(writer, flags, warning_messages, warning_links,
   emit_const_html_string_array('WarnPatternsDescription',
                                [w['description'] for w in warn_patterns],
                                writer)
-  emit_const_html_string_array('WarningMessages', warning_messages, writer)
-  emit_const_object_array('Warnings', warning_records, writer)
-  if flags.platform == 'chrome':
-    emit_const_html_string_array('WarningLinks', warning_links, writer)
 
 
 DRAW_TABLE_JAVASCRIPT = """
@@ -757,8 +952,13 @@ function selectDirFile(idx, rows, dirFile) {
   var divName = "selected_" + dirFile + "_warnings";
   var numWarnings = rows[idx][1].v;
   var prefix = name.replace(/\\.\\.\\.$/, "");
+  drawSelectedWarnings(document.getElementById(divName),
+                       numWarnings + type + ' warnings in ' + name,
+                       prefix, type);
+}
+function drawSelectedWarnings(div, title, prefix, type) {
   var data = new google.visualization.DataTable();
-  data.addColumn('string', numWarnings + type + ' warnings in ' + name);
+  data.addColumn('string', title);
   var getWarningMessage = (FlagPlatform == "chrome")
         ? ((x) => addURLToLine(WarningMessages[Warnings[x][2]],
                                WarningLinks[Warnings[x][3]]))
@@ -769,8 +969,7 @@ function selectDirFile(idx, rows, dirFile) {
       data.addRow([getWarningMessage(i)]);
     }
   }
-  var table = new google.visualization.Table(
-      document.getElementById(divName));
+  var table = new google.visualization.Table(div);
   table.draw(data, {allowHtml: true, alternatingRowStyle: true});
 }
 function selectDir(idx) {
@@ -781,7 +980,7 @@ function selectFile(idx) {
 }
 function genTables() {
   genSelectedProjectsTable();
-  if (WarningMessages.length > 1) {
+  if (NumWarnings > 1) {
     genTopDirsFilesTables();
   }
 }
@@ -835,6 +1034,17 @@ def dump_dir_file_section(writer, dir_file, table_name, section_title):
 def dump_html(flags, output_stream, warning_messages, warning_links,
               warning_records, header_str, warn_patterns, project_names):
   """Dump the flags output to output_stream."""
+  def emit_data(writer):
+    emit_js_data(writer, flags, warning_messages, warning_links,
+                 warning_records, warn_patterns, project_names)
+    writer(SCRIPTS_FOR_WARNING_GROUPS)
+  dump_html_page(flags, output_stream, header_str, warn_patterns,
+                 project_names, emit_data)
+
+
+def dump_html_page(flags, output_stream, header_str, warn_patterns,
+                   project_names, emit_data):
+  """Dump the HTML page with the JavaScript data written by emit_data."""
   writer = make_writer(output_stream)
   dump_html_prologue('Warnings for ' + header_str, writer, warn_patterns,
                      project_names)
@@ -857,9 +1067,7 @@ def dump_html(flags, output_stream, warning_messages, warning_links,
         str(LIMIT_WARNINGS_PER_FILE) + ' cases')
   def section4():
     writer('<script>')
-    emit_js_data(writer, flags, warning_messages, warning_links,
-                 warning_records, warn_patterns, project_names)
-    writer(SCRIPTS_FOR_WARNING_GROUPS)
+    emit_data(writer)
     writer('</script>')
     dump_section_header(writer, 'all_warnings_section',
                         'All warnings grouped by severities or projects')
@@ -880,6 +1088,125 @@ def dump_html(flags, output_stream, warning_messages, warning_links,
   dump_html_epilogue(writer)
 
 
+# Files of a paged HTML report, in the directory given to write_paged_html.
+PAGED_HTML_INDEX = 'index.html'
+PAGED_HTML_SHARD_DIR = 'shards'
+
+
+def shard_name(severity, project_idx):
+  return 's{}_p{}'.format(severity.value, project_idx)
+
+
+def count_warning(counts, key, warning_type, unique):
+  counts[key] += 1
+  if warning_type:
+    counts[warning_type + ' ' + key] += 1
+    if unique:
+      counts[warning_type + ' *'] += 1
+
+
+class DirFileCounter:
+  """Counts warning messages per file and directory, like computeTopDirsFiles.
+
+  The messages are HTML-escaped, as in WarningMessages.
+  """
+
+  def __init__(self):
+    self.num_warnings = 0
+    self.warnings_of_files = collections.Counter()
+    self.warnings_of_dirs = collections.Counter()
+    self.sub_dirs = collections.defaultdict(set)
+
+  def add(self, message):
+    self.num_warnings += 1
+    file_name = message.split(':', 1)[0]
+    warning_type = ''
+    if message.endswith(']'):
+      warning_type = message[max(message.rfind('['), 0):]
+    count_warning(self.warnings_of_files, file_name, warning_type, True)
+    dirs = file_name.split('/')
+    dir_name = dirs[0]
+    count_warning(self.warnings_of_dirs, dir_name, warning_type, True)
+    for sub_dir in dirs[1:-1]:
+      sub_dir = dir_name + '/' + sub_dir
+      self.sub_dirs[dir_name].add(sub_dir)
+      dir_name = sub_dir
+      count_warning(self.warnings_of_dirs, dir_name, warning_type, False)
+
+  def count_rows(self, min_warnings, warnings_of, is_dir):
+    """Returns rows of [index, {v:<count>, f:<percent>}, file_or_dir_name]."""
+    rows = []
+    for name, count in warnings_of.items():
+      if is_dir and len(self.sub_dirs.get(name, ())) == 1:
+        continue  # skip a directory if it has only one subdir
+      if count >= min_warnings:
+        percent = 100 * count / self.num_warnings
+        rows.append([0, {'v': count, 'f': '%d (%.1f%%)' % (count, percent)},
+                     name + '/...' if is_dir else name])
+    rows.sort(key=lambda row: -row[1]['v'])
+    for i, row in enumerate(rows):
+      row[0] = i
+    return rows
+
+  def top_dirs_files(self):
+    min_dir_warnings = self.num_warnings * LIMIT_PERCENT_WARNINGS / 100
+    min_file_warnings = min(LIMIT_WARNINGS_PER_FILE, min_dir_warnings)
+    return (self.count_rows(min_dir_warnings, self.warnings_of_dirs, True),
+            self.count_rows(min_file_warnings, self.warnings_of_files, False))
+
+
+def write_paged_html(flags, html_dir, warning_messages, warning_links,
+                     warning_records, header_str, warn_patterns, project_names):
+  """Write a paged HTML report into html_dir.
+
+  The index page has the same sections as dump_html, with only the warning
+  counts. The warning messages are saved in gzip compressed JSON files, one
+  per severity and project, that the page loads when they are shown. The
+  files are written in one pass over warning_records.
+
+  Browsers do not load files from file:// URLs, html_dir must be served
+  over HTTP, e.g. with python3 -m http.server.
+  """
+  shard_dir = os.path.join(html_dir, PAGED_HTML_SHARD_DIR)
+  os.makedirs(shard_dir, exist_ok=True)
+  shards = collections.defaultdict(list)
+  warning_counts = collections.Counter()
+  dir_file_counter = DirFileCounter()
+  for pattern_idx, project_idx, message_idx, link_idx in warning_records:
+    message = warning_messages[message_idx]
+    message = html.escape(message[:-1] if message.endswith('\n') else message)
+    row = [pattern_idx, message]
+    if flags.platform == 'chrome':
+      row.append(html.escape(warning_links[link_idx]))
+    severity = warn_patterns[pattern_idx]['severity']
+    shards[shard_name(severity, project_idx)].append(row)
+    warning_counts[(pattern_idx, project_idx)] += 1
+    dir_file_counter.add(message)
+  for name, rows in shards.items():
+    with gzip.open(os.path.join(shard_dir, name + '.json.gz'), 'wt',
+                   encoding='utf-8') as outf:
+      json.dump(rows, outf, separators=(',', ':'))
+
+  top_dirs, top_files = dir_file_counter.top_dirs_files()
+  def emit_data(writer):
+    emit_js_pattern_data(writer, flags, warn_patterns, project_names)
+    emit_const_number('NumWarnings', len(warning_records), writer)
+    emit_const_string('ShardDir', PAGED_HTML_SHARD_DIR + '/', writer)
+    emit_const_string_array('ShardNames', sorted(shards), writer)
+    emit_const_object_array(
+        'WarningCounts',
+        [[pattern_idx, project_idx, count]
+         for (pattern_idx, project_idx), count in warning_counts.items()],
+        writer)
+    writer('const TopDirsRows = ' + json.dumps(top_dirs) + ';')
+    writer('const TopFilesRows = ' + json.dumps(top_files) + ';')
+    writer(SCRIPTS_FOR_WARNING_GROUPS)
+    writer(PAGED_SCRIPTS_FOR_WARNING_GROUPS)
+  with open(os.path.join(html_dir, PAGED_HTML_INDEX), 'w') as outf:
+    dump_html_page(flags, outf, header_str, warn_patterns, project_names,
+                   emit_data)
+
+
 def write_html(flags, project_names, warn_patterns, html_path, warning_messages,
                warning_links, warning_records, header_str):
   """Write warnings html file."""
@@ -902,8 +1229,12 @@ def write_out_csv(flags, warn_patterns, warning_messages, warning_links,
                                 warning_records, warning_messages,
                                 warn_patterns, project_names)
 
+  if flags.html_dir:
+    write_paged_html(flags, flags.html_dir, warning_messages, warning_links,
+                     warning_records, header_str, warn_patterns, project_names)
+
   if flags.gencsv:
     dump_csv(csv.writer(sys.stdout, lineterminator='\n'), warn_patterns)
-  else:
+  elif not flags.html_dir:
     dump_html(flags, sys.stdout, warning_messages, warning_links,
               warning_records, header_str, warn_patterns, project_names)
@@ -31,16 +31,17 @@ def classify_warnings(args):
   Args:
     args: dictionary {
         'group': list of (warning, link),
-        'project_patterns': re.compile(project_list[p][1]),
-        'warn_patterns': list of warn_pattern,
+        'platform': platform of the patterns, set up by
+                    common.init_classify_worker,
         'num_processes': number of processes being used for multiprocessing }
   Returns:
     results: a list of the classified warnings.
   """
   results = []
+  project_patterns, warn_patterns = common.get_classify_patterns(args)
   for line, link in args['group']:
-    common.classify_one_warning(line, link, results, args['project_patterns'],
-                                args['warn_patterns'])
+    common.classify_one_warning(line, link, results, project_patterns,
+                                warn_patterns)
 
   # After the main work, ignore all other signals to a child process,
   # to avoid bad warning/error messages from the exit clean-up process.
@@ -52,11 +53,13 @@ def classify_warnings(args):
 def create_and_launch_subprocesses(num_cpu, classify_warnings_fn, arg_groups,
                                    group_results):
   """Fork num_cpu processes to classify warnings."""
-  pool = multiprocessing.Pool(num_cpu)
-  for cpu in range(num_cpu):
-    proc_result = pool.map(classify_warnings_fn, arg_groups[cpu])
-    if proc_result is not None:
-      group_results.append(proc_result)
+  platform = arg_groups[0][0]['platform']
+  with multiprocessing.Pool(num_cpu, initializer=common.init_classify_worker,
+                            initargs=(platform,)) as pool:
+    proc_results = [pool.map_async(classify_warnings_fn, arg_groups[cpu])
+                    for cpu in range(num_cpu)]
+    for proc_result in proc_results:
+      group_results.append(proc_result.get())
   return group_results
 
 
@@ -17,6 +17,7 @@
 
 Default is to output warnings in HTML tables grouped by warning severity.
 Use option --byproject to output tables grouped by source file projects.
+Use option --html_dir to write a paged HTML report that loads warnings on demand.
 Use option --gencsv to output warning counts in CSV format.
 
 Default input file is build.log, which can be changed with the --log flag.
@@ -46,10 +47,15 @@ Default input file is build.log, which can be changed with the --log flag.
 #   parse_input_file
 #
 import argparse
+import collections
+import contextlib
+import gzip
 import io
 import multiprocessing
 import os
 import re
+import signal
+import subprocess
 import sys
 
 # pylint:disable=relative-beyond-top-level,no-name-in-module
@@ -62,6 +68,7 @@ from . import java_warn_patterns as java_patterns
 from . import make_warn_patterns as make_patterns
 from . import other_warn_patterns as other_patterns
 from . import tidy_warn_patterns as tidy_patterns
+from . import warning_db as warn_db
 
 
 # Location of this file is used to guess the root of Android source tree.
@@ -86,6 +93,11 @@ def parse_args(use_google3):
                             will contain all the warning descriptions""")
   parser.add_argument('--byproject', action='store_true',
                       help='Separate warnings in HTML output by project names')
+  parser.add_argument('--html_dir', default='',
+                      help='Write a paged HTML report to this directory '
+                      'instead of the HTML output, with the warnings in '
+                      'compressed files loaded on demand. The directory '
+                      'must be served over HTTP')
   parser.add_argument('--url', default='',
                       help='Root URL of an Android source code tree prefixed '
                       'before files in warnings')
@@ -94,18 +106,37 @@ def parse_args(use_google3):
                       'number argument. e.g. #')
   parser.add_argument('--processes', default=multiprocessing.cpu_count(),
                       type=int,
-                      help='Number of parallel processes to process warnings')
+                      help='Number of parallel processes to parse the log '
+                      'and process warnings')
   # Old Android build scripts call warn.py without --platform,
   # so the default platform is set to 'android'.
   parser.add_argument('--platform', default='android',
                       choices=['chrome', 'android'],
                       help='Platform of the build log')
   # Old Android build scripts call warn.py with only a build.log file path.
-  parser.add_argument('--log', help='Path to build log file')
+  parser.add_argument('--log', help='Path to build log file, that can be '
+                      'compressed with gzip or zstd')
   parser.add_argument(dest='buildlog', metavar='build.log',
                       default='build.log', nargs='?',
-                      help='Path to build.log file')
+                      help='Path to build.log file, that can be compressed '
+                      'with gzip or zstd')
+  parser.add_argument('--warning_db', default='',
+                      help='Path to a sqlite database of the warnings of '
+                      'previous builds, to only classify new warning lines')
+  parser.add_argument('--build_name', default='',
+                      help='Save the warnings of this build in --warning_db '
+                      'with this name')
+  parser.add_argument('--baseline_build', default='',
+                      help='Name of a build saved in --warning_db, to report '
+                      'the warnings added and removed since then')
+  parser.add_argument('--diffpath', default='',
+                      help='Save CSV file of the warnings added and removed '
+                      'since --baseline_build to the passed path')
   flags = parser.parse_args()
+  if (flags.build_name or flags.baseline_build) and not flags.warning_db:
+    parser.error('--build_name and --baseline_build need --warning_db')
+  if bool(flags.baseline_build) != bool(flags.diffpath):
+    parser.error('--baseline_build and --diffpath go together')
   if not flags.log:
     flags.log = flags.buildlog
   if not use_google3 and not os.path.exists(flags.log):
@@ -126,16 +157,244 @@ def find_project_index(line, project_patterns):
   return -1
 
 
+def _skip_character_class(regex, start):
+  """Return the index after the character class at start, or -1."""
+  i = start + 1
+  if i < len(regex) and regex[i] == '^':
+    i += 1
+  if i < len(regex) and regex[i] == ']':
+    i += 1
+  while i < len(regex) and regex[i] != ']':
+    i += 2 if regex[i] == '\\' else 1
+  return i + 1 if i < len(regex) else -1
+
+
+def required_literals(regex):
+  """Return substrings that every string matched by regex must contain.
+
+  This is a conservative scan of the regex syntax used in the warn pattern
+  tables. It gives up on alternations and extensions, and ignores group
+  contents, character classes, escapes like \\d and repeated characters.
+  """
+  # pylint:disable=too-many-branches
+  if '(?' in regex:
+    return []
+  literals = []
+  run = ''
+  i = 0
+  while i < len(regex):
+    char = regex[i]
+    atom = None
+    if char == '\\':
+      if i + 1 >= len(regex):
+        return []
+      if regex[i + 1].isdigit() or regex[i + 1] in 'xuUN':
+        return []  # octal, hex or named characters, or group references
+      if not regex[i + 1].isalnum() and regex[i + 1] != '_':
+        atom = regex[i + 1]
+      i += 2
+    elif char == '[':
+      i = _skip_character_class(regex, i)
+      if i < 0:
+        return []
+    elif char == '(':
+      # Skip the whole group, it may be optional or repeated.
+      depth = 0
+      while 0 <= i < len(regex):
+        if regex[i] == '\\':
+          i += 1
+        elif regex[i] == '[':
+          i = _skip_character_class(regex, i) - 1
+        elif regex[i] == '(':
+          depth += 1
+        elif regex[i] == ')':
+          depth -= 1
+          if not depth:
+            break
+        i += 1
+      if not 0 <= i < len(regex):
+        return []
+      i += 1
+    elif char in '.^$)':
+      i += 1
+    elif char in '|*+?{':
+      # Alternations, or quantifiers that are not after an atom.
+      return []
+    else:
+      atom = char
+      i += 1
+
+    quantifier = regex[i] if i < len(regex) else ''
+    if atom is not None and quantifier not in ('*', '?', '{'):
+      run += atom
+    if atom is None or quantifier in ('*', '+', '?', '{'):
+      if run:
+        literals.append(run)
+      run = ''
+    if quantifier == '{':
+      end = regex.find('}', i)
+      if end < 0:
+        return []
+      i = end + 1
+    elif quantifier in ('*', '+', '?'):
+      i += 1
+    if quantifier and i < len(regex) and regex[i] in '?+':
+      i += 1  # lazy or possessive quantifier
+  if run:
+    literals.append(run)
+  return literals
+
+
+class WarningClassifier:
+  """Index of warn_patterns and project_patterns to classify warning lines.
+
+  Gives the same results as trying all the patterns in order, but only runs
+  the regular expressions whose required literals are found in the line.
+  Patterns of checkers like '.*: warning: [Name] .*' are looked up by the
+  bracketed names in the line. Other patterns are looked up by a whole word of
+  their longest literal, and skipped if the literal is not in the line.
+
+  Projects defined by a plain path are looked up in a trie of path
+  components, the other project patterns are tried in order.
+  """
+
+  _BRACKETED = re.compile(r'\[[^\[\]]*\]')
+  _WORD = re.compile(r'\w+')
+  _PROJECT_PATH = re.compile(r'^\(\^\|\.\*/\)([A-Za-z0-9_/-]+)/\.\*: warning:$')
+
+  def __init__(self, warn_patterns, project_patterns):
+    # Every compiled pattern, and the index in warn_patterns of its entry.
+    self._patterns = []
+    # Order of the patterns with a bracketed literal, by the literal.
+    self._by_bracketed = {}
+    # Order of the patterns with another literal, by the literal.
+    by_literal = {}
+    # Order of the patterns without literals.
+    self._unindexed = []
+    for idx, pattern in enumerate(warn_patterns):
+      for cpat in pattern['compiled_patterns']:
+        order = len(self._patterns)
+        self._patterns.append((cpat, idx))
+        literals = required_literals(cpat.pattern)
+        bracketed = [b for literal in literals
+                     for b in self._BRACKETED.findall(literal)]
+        if bracketed:
+          self._by_bracketed.setdefault(max(bracketed, key=len),
+                                        []).append(order)
+        elif literals:
+          by_literal.setdefault(max(literals, key=len), []).append(order)
+        else:
+          self._unindexed.append(order)
+    # (literal, orders) of the literals, by their longest whole word.
+    self._by_word = {}
+    # (literal, orders) of the literals without whole words.
+    self._literals = []
+    for literal, orders in by_literal.items():
+      # A word between non-word chars of the literal is a whole word of the
+      # lines that contain the literal.
+      words = [w.group() for w in self._WORD.finditer(literal)
+               if w.start() > 0 and w.end() < len(literal)]
+      if words:
+        self._by_word.setdefault(max(words, key=len), []).append(
+            (literal, orders))
+      else:
+        self._literals.append((literal, orders))
+
+    self._project_patterns = project_patterns
+    # Trie of the project path components, with the project index at '/'.
+    self._project_trie = {}
+    # (index, regex) of the other projects.
+    self._other_projects = []
+    for idx, pattern in enumerate(project_patterns):
+      result = self._PROJECT_PATH.match(pattern.pattern)
+      if not result:
+        self._other_projects.append((idx, pattern))
+        continue
+      node = self._project_trie
+      for component in result.group(1).split('/'):
+        node = node.setdefault(component, {})
+      node.setdefault('/', idx)
+
+  def classify(self, line):
+    """Return the indices to warn_patterns and project_patterns of line.
+
+    The pattern index is -1 if no pattern matches the line.
+    """
+    if '\n' in line:
+      # '.' doesn't match it, leave that to the regular expressions.
+      return self._classify_slow(line)
+    orders = set(self._unindexed)
+    for bracketed in self._BRACKETED.findall(line):
+      orders.update(self._by_bracketed.get(bracketed, ()))
+    for word in set(self._WORD.findall(line)):
+      for literal, literal_orders in self._by_word.get(word, ()):
+        if literal in line:
+          orders.update(literal_orders)
+    for literal, literal_orders in self._literals:
+      if literal in line:
+        orders.update(literal_orders)
+    for order in sorted(orders):
+      cpat, idx = self._patterns[order]
+      if cpat.match(line):
+        return idx, self.find_project_index(line)
+    return -1, -1
+
+  def _classify_slow(self, line):
+    for cpat, idx in self._patterns:
+      if cpat.match(line):
+        return idx, find_project_index(line, self._project_patterns)
+    return -1, -1
+
+  def find_project_index(self, line):
+    """Return the same index to project_patterns as find_project_index."""
+    best = len(self._project_patterns)
+    warning_end = line.rfind(': warning:')
+    if warning_end >= 0:
+      parts = line.split('/')
+      start = 0
+      for i, part in enumerate(parts):
+        node = self._project_trie.get(part)
+        end = start + len(part)
+        # A project path matches at the beginning or after a '/', when it is
+        # followed by a '/' and a later ': warning:'.
+        for next_part in parts[i + 1:]:
+          if node is None:
+            break
+          end += 1
+          if '/' in node and node['/'] < best and end <= warning_end:
+            best = node['/']
+          node = node.get(next_part)
+          end += len(next_part)
+        start += len(part) + 1
+    for idx, pattern in self._other_projects:
+      if idx >= best:
+        break
+      if pattern.match(line):
+        return idx
+    return best if best < len(self._project_patterns) else -1
+
+
+_classifier_cache = []
+
+
+def get_classifier(warn_patterns, project_patterns):
+  """Return a WarningClassifier, reused for the same pattern lists."""
+  for patterns, projects, classifier in _classifier_cache:
+    if patterns is warn_patterns and projects is project_patterns:
+      return classifier
+  classifier = WarningClassifier(warn_patterns, project_patterns)
+  _classifier_cache[:] = [(warn_patterns, project_patterns, classifier)]
+  return classifier
+
+
 def classify_one_warning(warning, link, results, project_patterns,
                          warn_patterns):
   """Classify one warning line."""
-  for idx, pattern in enumerate(warn_patterns):
-    for cpat in pattern['compiled_patterns']:
-      if cpat.match(warning):
-        project_idx = find_project_index(warning, project_patterns)
-        results.append([warning, link, idx, project_idx])
-        return
-  # If we end up here, there was a problem parsing the log
+  classifier = get_classifier(warn_patterns, project_patterns)
+  idx, project_idx = classifier.classify(warning)
+  if idx >= 0:
+    results.append([warning, link, idx, project_idx])
+  # If idx < 0, there was a problem parsing the log
   # probably caused by 'make -j' mixing the output from
   # 2 or more concurrent compiles
 
@@ -367,15 +626,16 @@ def add_normalized_line_to_warnings(line, flags, android_root, unique_warnings):
   return unique_warnings
 
 
-def parse_input_file_android(infile, flags):
-  """Parse Android input file, collect parameters and warning lines."""
-  # pylint:disable=too-many-locals,too-many-branches
-  platform_version = 'unknown'
-  target_product = 'unknown'
-  target_variant = 'unknown'
-  build_id = 'unknown'
-  android_root, root_top_dirs = find_android_root(infile)
-  infile.seek(0)
+class AndroidLogParser:
+  """Parser of the lines of an Android build log.
+
+  A log can be parsed in chunks of lines, in any order and in parallel.
+  parse_lines() does the per line work of a chunk and returns the lines that
+  matter, which merge_chunks() combines into the warnings of the whole log.
+  That gives the same warnings as parsing the log line by line, including
+  rustc warnings split across two chunks and warning lines that are only
+  parsed the first time they appear in the log.
+  """
 
   # rustc warning messages have two lines that should be combined:
   #     warning: description
@@ -397,106 +657,396 @@ def parse_input_file_android(infile, flags):
   # /b/f/w/, we can remove all leading chars up to and including the "/b/f/w/".
   bfw_warning_pattern = re.compile('.*/b/f/w/([^ ]*: warning: .*)')
 
-  # When android_root is known and available, we find its top directories
-  # and remove all leading chars before a top directory name.
-  # We assume that the leading chars from stderr do not contain "/".
-  # For example,
-  #   10external/...
-  #   12 warningsexternal/...
-  #   413 warningexternal/...
-  #   5 warnings generatedexternal/...
-  #   Suppressed 1000 warnings (packages/modules/...
-  if root_top_dirs:
-    extra_warning_pattern = re.compile(
-        '^.[^/]*((' + '|'.join(root_top_dirs) +
-        ')/[^ ]*: warning: .*)')
-  else:
-    extra_warning_pattern = re.compile('^[^/]* ([^ /]*/[^ ]*: warning: .*)')
+  # Number of lines at the beginning of a log that can set build variables.
+  header_lines = 100
+
+  def __init__(self, flags, android_root, root_top_dirs):
+    self.flags = flags
+    self.android_root = android_root
+    # When android_root is known and available, we find its top directories
+    # and remove all leading chars before a top directory name.
+    # We assume that the leading chars from stderr do not contain "/".
+    # For example,
+    #   10external/...
+    #   12 warningsexternal/...
+    #   413 warningexternal/...
+    #   5 warnings generatedexternal/...
+    #   Suppressed 1000 warnings (packages/modules/...
+    if root_top_dirs:
+      self.extra_warning_pattern = re.compile(
+          '^.[^/]*((' + '|'.join(root_top_dirs) +
+          ')/[^ ]*: warning: .*)')
+    else:
+      self.extra_warning_pattern = re.compile(
+          '^[^/]* ([^ /]*/[^ ]*: warning: .*)')
+
+  def warning_entry(self, line, normalized_line=None):
+    """Return the warning line and its link, as they are reported.
+
+    This is a tuple of the normalized line, its link and, if android_root is
+    known, the line normalized again and the link of the normalized line.
+    """
+    if normalized_line is None:
+      normalized_line = normalize_warning_line(line, self.flags,
+                                               self.android_root)
+    link = generate_cs_link(line, self.flags, self.android_root)
+    if not self.android_root:
+      return normalized_line, link, None, None
+    return (normalized_line, link,
+            normalize_warning_line(normalized_line, self.flags,
+                                   self.android_root),
+            generate_android_cs_link(normalized_line, self.flags,
+                                     self.android_root))
+
+  def parse_lines(self, lines, header=False):
+    """Parse a chunk of log lines.
+
+    Args:
+      lines: iterable of the lines in the chunk.
+      header: whether the chunk is the beginning of the log. It must hold at
+          least the first header_lines lines then.
+
+    Returns:
+      A ParsedChunk of the warning and rustc file position lines.
+    """
+    # pylint:disable=too-many-locals,too-many-branches
+    build_vars = {}
+    lines_to_merge = []
+    checked_warning_lines = set()
+    # The normalized lines of the warnings in lines_to_merge.
+    added_warnings = set()
+    prev_warning_index = -2
+    line_counter = 0
+    for index, line in enumerate(lines):
+      line_counter += 1
+      position = None
+      # Only the first line of the chunk can be the file position of a rustc
+      # warning started in the previous chunk.
+      if ((index == 0 or prev_warning_index == index - 1) and
+          self.rustc_file_position.match(line)):
+        text = line.strip().replace('--> ', '')
+        combined = None
+        if index:
+          combined = self.warning_entry(text + ': ' + lines_to_merge[-1][2][1])
+        position = (text, combined)
+
+      # re.match is slow, with several warning line patterns and
+      # long input lines like "TIMEOUT: ...".
+      # We save significant time by skipping non-warning lines.
+      # But do not skip the first 100 lines, because we want to
+      # catch build variables.
+      if ((not header or line_counter > self.header_lines) and
+          line.find('warning: ') < 0):
+        if position:
+          lines_to_merge.append((index, None, None, position))
+        continue
 
-  # Collect all unique warning lines
-  unique_warnings = dict()
-  checked_warning_lines = dict()
-  line_counter = 0
-  prev_warning = ''
-  for line in infile:
-    line_counter += 1
-    if prev_warning:
-      if rustc_file_position.match(line):
-        # must be a rustc warning, combine 2 lines into one warning
-        line = line.strip().replace('--> ', '') + ': ' + prev_warning
-        unique_warnings = add_normalized_line_to_warnings(
-            line, flags, android_root, unique_warnings)
-        prev_warning = ''
+      # A large clean build output can contain up to 90% of duplicated
+      # "warning:" lines. If we can skip them quickly, we can
+      # speed up this for-loop 3X to 5X.
+      # Lines that may be a rustc file position are left to merge_chunks,
+      # which knows if they are part of a rustc warning.
+      if line in checked_warning_lines and not position:
         continue
-      # add prev_warning, and then process the current line
-      prev_warning = 'unknown_source_file: ' + prev_warning
-      unique_warnings = add_normalized_line_to_warnings(
-          prev_warning, flags, android_root, unique_warnings)
-      prev_warning = ''
-
-    # re.match is slow, with several warning line patterns and
-    # long input lines like "TIMEOUT: ...".
-    # We save significant time by skipping non-warning lines.
-    # But do not skip the first 100 lines, because we want to
-    # catch build variables.
-    if line_counter > 100 and line.find('warning: ') < 0:
-      continue
-
-    # A large clean build output can contain up to 90% of duplicated
-    # "warning:" lines. If we can skip them quickly, we can
-    # speed up this for-loop 3X to 5X.
-    if line in checked_warning_lines:
-      continue
-    checked_warning_lines[line] = True
-
-    # Clean up extra prefix that could be introduced when RBE was used.
-    if '/b/f/w/' in line:
-      result = bfw_warning_pattern.search(line)
-    else:
-      result = extra_warning_pattern.search(line)
-    if result is not None:
-      line = result.group(1)
+      raw_line = line
+      if not position:
+        checked_warning_lines.add(line)
 
-    if warning_pattern.match(line):
-      if line.startswith('warning: '):
-        # save this line and combine it with the next line
-        prev_warning = line
+      # Clean up extra prefix that could be introduced when RBE was used.
+      if '/b/f/w/' in line:
+        result = self.bfw_warning_pattern.search(line)
       else:
-        unique_warnings = add_normalized_line_to_warnings(
-            line, flags, android_root, unique_warnings)
-      continue
-
-    if line_counter < 100:
-      # save a little bit of time by only doing this for the first few lines
-      result = re.search('(?<=^PLATFORM_VERSION=).*', line)
-      if result is not None:
-        platform_version = result.group(0)
-        continue
-      result = re.search('(?<=^TARGET_PRODUCT=).*', line)
-      if result is not None:
-        target_product = result.group(0)
-        continue
-      result = re.search('(?<=^TARGET_BUILD_VARIANT=).*', line)
-      if result is not None:
-        target_variant = result.group(0)
-        continue
-      result = re.search('(?<=^BUILD_ID=).*', line)
+        result = self.extra_warning_pattern.search(line)
       if result is not None:
-        build_id = result.group(0)
+        line = result.group(1)
+
+      if self.warning_pattern.match(line):
+        if line.startswith('warning: '):
+          # combine this line with the next line
+          prev_warning_index = index
+          warning = ('rustc', line,
+                     self.warning_entry('unknown_source_file: ' + line))
+        else:
+          normalized_line = normalize_warning_line(line, self.flags,
+                                                   self.android_root)
+          if normalized_line in added_warnings and not position:
+            continue
+          added_warnings.add(normalized_line)
+          warning = ('warning', self.warning_entry(line, normalized_line))
+        lines_to_merge.append((index, raw_line, warning, position))
         continue
+      if position:
+        lines_to_merge.append((index, raw_line, None, position))
+
+      if header and line_counter < self.header_lines:
+        # save a little bit of time by only doing this for the first few lines
+        for name in ('PLATFORM_VERSION', 'TARGET_PRODUCT',
+                     'TARGET_BUILD_VARIANT', 'BUILD_ID'):
+          result = re.search('(?<=^%s=).*' % name, line)
+          if result is not None:
+            build_vars[name] = result.group(0)
+            break
+    return ParsedChunk(line_counter, lines_to_merge, build_vars)
+
+  def merge_chunks(self, chunks):
+    """Combine the ParsedChunks of a log, in order.
+
+    Returns:
+      A dict of the unique warning lines to their links, and the build
+      variables found in the log.
+    """
+    warning_entries = {}
+    build_vars = {}
+    checked_rustc_lines = set()
+
+    def add_warning(entry):
+      if entry[0] not in warning_entries:
+        warning_entries[entry[0]] = entry
+
+    # The pending first line of a rustc warning, and its line number.
+    prev_warning = None
+    prev_line_number = -2
+    first_line_number = 0
+    for chunk in chunks:
+      build_vars.update(chunk.build_vars)
+      for index, raw_line, warning, position in chunk.lines:
+        line_number = first_line_number + index
+        if prev_warning:
+          if position and prev_line_number == line_number - 1:
+            # must be a rustc warning, combine 2 lines into one warning
+            text, combined = position
+            if index == 0:
+              combined = self.warning_entry(text + ': ' + prev_warning[1])
+            add_warning(combined)
+            prev_warning = None
+            continue
+          # add prev_warning, and then process the current line
+          add_warning(prev_warning[2])
+          prev_warning = None
+        if not warning:
+          continue
+        if warning[0] == 'rustc':
+          # Only the first of identical lines is parsed.
+          if raw_line in checked_rustc_lines:
+            continue
+          checked_rustc_lines.add(raw_line)
+          prev_warning = warning
+          prev_line_number = line_number
+        else:
+          add_warning(warning[1])
+      first_line_number += chunk.num_lines
+    # The line after the first line of a rustc warning may not be in any
+    # chunk's lines, add the warning alone as that line did.
+    if prev_warning and prev_line_number < first_line_number - 1:
+      add_warning(prev_warning[2])
+
+    if self.android_root:
+      unique_warnings = dict()
+      for _, _, normalized_line, link in warning_entries.values():
+        unique_warnings[normalized_line] = link
+    else:
+      unique_warnings = {line: link
+                         for line, link, _, _ in warning_entries.values()}
+    return unique_warnings, build_vars
+
+
+# The lines of a log chunk that parse_lines() found to matter, and the
+# build variables set in the chunk. lines are (index in the chunk, line,
+# warning, rustc file position) tuples.
+ParsedChunk = collections.namedtuple('ParsedChunk',
+                                     ['num_lines', 'lines', 'build_vars'])
 
-  if android_root:
-    new_unique_warnings = dict()
-    for warning_line in unique_warnings:
-      normalized_line = normalize_warning_line(warning_line, flags,
-                                               android_root)
-      new_unique_warnings[normalized_line] = generate_android_cs_link(
-          warning_line, flags, android_root)
-    unique_warnings = new_unique_warnings
-
-  header_str = '%s - %s - %s (%s)' % (
-      platform_version, target_product, target_variant, build_id)
-  return unique_warnings, header_str
+
+def android_header_str(build_vars):
+  return '%s - %s - %s (%s)' % tuple(
+      build_vars.get(name, 'unknown')
+      for name in ('PLATFORM_VERSION', 'TARGET_PRODUCT',
+                   'TARGET_BUILD_VARIANT', 'BUILD_ID'))
+
+
+def parse_input_file_android(infile, flags):
+  """Parse Android input file, collect parameters and warning lines."""
+  android_root, root_top_dirs = find_android_root(infile)
+  infile.seek(0)
+  parser = AndroidLogParser(flags, android_root, root_top_dirs)
+  unique_warnings, build_vars = parser.merge_chunks(
+      [parser.parse_lines(infile, header=True)])
+  return unique_warnings, android_header_str(build_vars)
+
+
+# Magic numbers of the compressed build logs that can be read directly.
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+# Minimum amount of a build log parsed at once by a process.
+LOG_CHUNK_SIZE = 16 * 1024 * 1024
+
+
+def is_compressed_log(logfile):
+  """Return whether logfile is compressed with gzip or zstd."""
+  with open(logfile, 'rb') as log:
+    magic = log.read(len(ZSTD_MAGIC))
+  return magic.startswith(GZIP_MAGIC) or magic == ZSTD_MAGIC
+
+
+@contextlib.contextmanager
+def open_log(logfile):
+  """Open a build log, that can be compressed with gzip or zstd.
+
+  Yields:
+    The binary file of the uncompressed log.
+  """
+  with open(logfile, 'rb') as log:
+    magic = log.read(len(ZSTD_MAGIC))
+  if magic.startswith(GZIP_MAGIC):
+    with gzip.open(logfile, 'rb') as log:
+      yield log
+  elif magic == ZSTD_MAGIC:
+    with subprocess.Popen(['zstd', '-d', '-c', '-q', logfile],
+                          stdout=subprocess.PIPE) as proc:
+      try:
+        yield proc.stdout
+      finally:
+        proc.stdout.close()
+      # zstd is killed by SIGPIPE if the log is not read to the end.
+      if proc.wait() not in (0, -signal.SIGPIPE):
+        raise IOError('Failed to decompress %s' % logfile)
+  else:
+    with open(logfile, 'rb') as log:
+      yield log
+
+
+def read_log_chunks(log, chunk_size):
+  """Split a binary log file into chunks of whole lines.
+
+  The first chunk holds at least AndroidLogParser.header_lines lines.
+
+  Yields:
+    The data of the chunks.
+  """
+  data = log.read(chunk_size) + log.readline()
+  while data.count(b'\n') < AndroidLogParser.header_lines:
+    line = log.readline()
+    if not line:
+      break
+    data += line
+  while data:
+    yield data
+    data = log.read(chunk_size) + log.readline()
+
+
+def split_log(logfile, chunk_size):
+  """Split an uncompressed log file into byte ranges of whole lines.
+
+  The first range holds at least AndroidLogParser.header_lines lines.
+
+  Returns:
+    A list of (start, end) offsets.
+  """
+  size = os.path.getsize(logfile)
+  ranges = []
+  with open(logfile, 'rb') as log:
+    for _ in range(AndroidLogParser.header_lines):
+      if not log.readline():
+        break
+    start = 0
+    end = max(log.tell(), chunk_size)
+    while start < size:
+      if end < size:
+        log.seek(end)
+        log.readline()
+        end = log.tell()
+      end = min(end, size)
+      ranges.append((start, end))
+      start = end
+      end = start + chunk_size
+  return ranges
+
+
+# The parser and log file of a process of parse_log_file.
+_log_parser = None
+_log_file = None
+
+
+def _init_log_parser(flags, android_root, root_top_dirs, logfile):
+  global _log_parser, _log_file
+  _log_parser = AndroidLogParser(flags, android_root, root_top_dirs)
+  _log_file = logfile
+
+
+def _parse_log_chunk(chunk, header):
+  """Parse a chunk of a log, given as its data or as a byte range."""
+  if not isinstance(chunk, bytes):
+    start, end = chunk
+    with open(_log_file, 'rb') as log:
+      log.seek(start)
+      chunk = log.read(end - start)
+  lines = io.TextIOWrapper(io.BytesIO(chunk), encoding='utf-8')
+  return _log_parser.parse_lines(lines, header)
+
+
+def parse_log_file(logfile, flags):
+  """Parse a build log file, that can be compressed with gzip or zstd.
+
+  Android logs are parsed in chunks by flags.processes processes.
+  Uncompressed logs are split into byte ranges that each process reads,
+  compressed logs are uncompressed here and sent to the processes in chunks.
+
+  Returns:
+    The same as parse_input_file.
+  """
+  if flags.platform != 'android':
+    with open_log(logfile) as log:
+      return parse_input_file(io.TextIOWrapper(log, encoding='utf-8'), flags)
+
+  # Only the beginning of most logs is read to find the android root.
+  with open_log(logfile) as log:
+    android_root, root_top_dirs = find_android_root(
+        io.TextIOWrapper(log, encoding='utf-8'))
+  parser = AndroidLogParser(flags, android_root, root_top_dirs)
+  if flags.processes <= 1:
+    with open_log(logfile) as log:
+      parsed_chunks = [parser.parse_lines(
+          io.TextIOWrapper(log, encoding='utf-8'), header=True)]
+  else:
+    parsed_chunks = parallel_parse_log(logfile, flags, android_root,
+                                       root_top_dirs)
+  unique_warnings, build_vars = parser.merge_chunks(parsed_chunks)
+  return unique_warnings, android_header_str(build_vars)
+
+
+def parallel_parse_log(logfile, flags, android_root, root_top_dirs):
+  """Parse the chunks of an Android log with flags.processes processes.
+
+  Returns:
+    The ParsedChunks of the log, in order.
+  """
+  with contextlib.ExitStack() as stack:
+    if is_compressed_log(logfile):
+      chunks = read_log_chunks(stack.enter_context(open_log(logfile)),
+                               LOG_CHUNK_SIZE)
+    else:
+      # Each chunk has some work to redo, like parsing the lines that were
+      # already parsed in other chunks, so don't make more than needed.
+      chunk_size = max(LOG_CHUNK_SIZE,
+                       os.path.getsize(logfile) // (2 * flags.processes) + 1)
+      chunks = split_log(logfile, chunk_size)
+    pool = stack.enter_context(multiprocessing.Pool(
+        flags.processes, initializer=_init_log_parser,
+        initargs=(flags, android_root, root_top_dirs, logfile)))
+
+    # Bound the number of chunks waiting to be parsed, so that a compressed
+    # log is not held in memory.
+    parsed_chunks = []
+    pending = collections.deque()
+    for chunk in chunks:
+      header = not parsed_chunks and not pending
+      pending.append(pool.apply_async(_parse_log_chunk, (chunk, header)))
+      if len(pending) >= 2 * flags.processes:
+        parsed_chunks.append(pending.popleft().get())
+    while pending:
+      parsed_chunks.append(pending.popleft().get())
+  return parsed_chunks
 
 
 def parse_input_file(infile, flags):
@@ -538,6 +1088,11 @@ def get_warn_patterns(platform):
   return warn_patterns
 
 
+def get_project_patterns(platform):
+  """Return the compiled project patterns of the platform."""
+  return [re.compile(p[1]) for p in get_project_list(platform)]
+
+
 def get_project_list(platform):
   """Return project list for appropriate platform."""
   if platform == 'chrome':
@@ -547,16 +1102,51 @@ def get_project_list(platform):
   raise Exception('platform name %s is not valid' % platform)
 
 
+# The project_patterns and warn_patterns of a classify_warnings process.
+_worker_patterns = None
+
+
+def init_classify_worker(platform):
+  """Initialize a process of a pool that runs classify_warnings.
+
+  The patterns are set up once in each process, instead of being pickled
+  with every group of warnings.
+  """
+  global _worker_patterns
+  _worker_patterns = (get_project_patterns(platform),
+                      get_warn_patterns(platform))
+
+
+def get_classify_patterns(args):
+  """Return the project_patterns and warn_patterns to classify args['group'].
+  """
+  if 'warn_patterns' in args:
+    return args['project_patterns'], args['warn_patterns']
+  if _worker_patterns is None:
+    init_classify_worker(args['platform'])
+  return _worker_patterns
+
+
 def parallel_classify_warnings(warning_data, args, project_names,
                                project_patterns, warn_patterns,
                                use_google3, create_launch_subprocs_fn,
-                               classify_warnings_fn):
-  """Classify all warning lines with num_cpu parallel processes."""
-  # pylint:disable=too-many-arguments,too-many-locals
+                               classify_warnings_fn, warning_db=None):
+  """Classify all warning lines with num_cpu parallel processes.
+
+  With a warning_db, only the lines that are not in the database are
+  classified, and then added to it.
+  """
+  # pylint:disable=too-many-arguments,too-many-locals,too-many-branches
   num_cpu = args.processes
   group_results = []
 
-  if num_cpu > 1:
+  all_warning_data = warning_data
+  if warning_db:
+    known_warnings = warning_db.lookup(warning_data)
+    warning_data = {warning: link for warning, link in warning_data.items()
+                    if warning not in known_warnings}
+
+  if num_cpu > 1 and warning_data:
     # set up parallel processing for this...
     warning_groups = [[] for _ in range(num_cpu)]
     i = 0
@@ -567,10 +1157,12 @@ def parallel_classify_warnings(warning_data, args, project_names,
     for i, group in enumerate(warning_groups):
       arg_groups[i] = [{
           'group': group,
-          'project_patterns': project_patterns,
-          'warn_patterns': warn_patterns,
+          'platform': args.platform,
           'num_processes': num_cpu
       }]
+      if use_google3:
+        arg_groups[i][0]['project_patterns'] = project_patterns
+        arg_groups[i][0]['warn_patterns'] = warn_patterns
 
     group_results = create_launch_subprocs_fn(num_cpu,
                                               classify_warnings_fn,
@@ -581,33 +1173,84 @@ def parallel_classify_warnings(warning_data, args, project_names,
     for warning, link in warning_data.items():
       classify_one_warning(warning, link, group_results,
                            project_patterns, warn_patterns)
+    # The same nesting as the results of create_launch_subprocs_fn.
+    group_results = [[group_results]]
+
+  if use_google3 and num_cpu > 1 and warning_data:
     group_results = [group_results]
+  results = [result for group_result in group_results
+             for proc_result in group_result for result in proc_result]
+
+  if warning_db:
+    new_warnings = {warning: (-1, -1) for warning in warning_data}
+    for line, _, pattern_idx, project_idx in results:
+      new_warnings[line] = (pattern_idx, project_idx)
+    warning_db.add(new_warnings)
+    known_warnings.update(new_warnings)
+    # Keep the order of the results of classifying all the lines.
+    warnings = list(all_warning_data.items())
+    if num_cpu > 1:
+      warnings = [warning for i in range(num_cpu)
+                  for warning in warnings[i::num_cpu]]
+    results = [(line, link) + known_warnings[line] for line, link in warnings
+               if known_warnings[line][0] >= 0]
 
   warning_messages = []
   warning_links = []
   warning_records = []
-  if use_google3:
-    group_results = [group_results]
-  for group_result in group_results:
-    for result in group_result:
-      for line, link, pattern_idx, project_idx in result:
-        pattern = warn_patterns[pattern_idx]
-        pattern['members'].append(line)
-        message_idx = len(warning_messages)
-        warning_messages.append(line)
-        link_idx = len(warning_links)
-        warning_links.append(link)
-        warning_records.append([pattern_idx, project_idx, message_idx,
-                                link_idx])
-        pname = '???' if project_idx < 0 else project_names[project_idx]
-        # Count warnings by project.
-        if pname in pattern['projects']:
-          pattern['projects'][pname] += 1
-        else:
-          pattern['projects'][pname] = 1
+  for line, link, pattern_idx, project_idx in results:
+    pattern = warn_patterns[pattern_idx]
+    pattern['members'].append(line)
+    message_idx = len(warning_messages)
+    warning_messages.append(line)
+    link_idx = len(warning_links)
+    warning_links.append(link)
+    warning_records.append([pattern_idx, project_idx, message_idx,
+                            link_idx])
+    pname = '???' if project_idx < 0 else project_names[project_idx]
+    # Count warnings by project.
+    if pname in pattern['projects']:
+      pattern['projects'][pname] += 1
+    else:
+      pattern['projects'][pname] = 1
   return warning_messages, warning_links, warning_records
 
 
+def compare_to_baseline(warning_db, baseline_build, warning_messages,
+                        warning_records, project_patterns, warn_patterns):
+  """Compare the classified warnings to a build saved in warning_db.
+
+  Returns:
+    The lists of the (warning, pattern_idx, project_idx) added and removed
+    since the baseline build.
+  """
+  if not warning_db.has_build(baseline_build):
+    sys.exit('Cannot find build %s in %s' % (baseline_build,
+                                              warning_db.path))
+  warnings = {warning_messages[message_idx]: (pattern_idx, project_idx)
+              for pattern_idx, project_idx, message_idx, _ in warning_records}
+  baseline_warnings = warning_db.build_warnings(baseline_build)
+
+  # The lines of the baseline build may have been classified with other
+  # patterns.
+  classifier = get_classifier(warn_patterns, project_patterns)
+  new_warnings = {line: classifier.classify(line)
+                  for line, (_, pattern_idx, _) in baseline_warnings.items()
+                  if pattern_idx is None}
+  warning_db.add(new_warnings)
+  for line, (pattern_idx, project_idx) in new_warnings.items():
+    baseline_warnings[line] = (None, pattern_idx, project_idx)
+
+  added = [(line, pattern_idx, project_idx)
+           for line, (pattern_idx, project_idx) in warnings.items()
+           if line not in baseline_warnings]
+  removed = [(line, pattern_idx, project_idx)
+             for line, (_, pattern_idx, project_idx)
+             in baseline_warnings.items()
+             if line not in warnings and pattern_idx >= 0]
+  return added, removed
+
+
 def process_log(logfile, flags, project_names, project_patterns, warn_patterns,
                 html_path, use_google3, create_launch_subprocs_fn,
                 classify_warnings_fn, logfile_object):
@@ -624,15 +1267,32 @@ def process_log(logfile, flags, project_names, project_patterns, warn_patterns,
   be updated accordingly.
   """
   if logfile_object is None:
-    with io.open(logfile, encoding='utf-8') as log:
-      warning_lines_and_links, header_str = parse_input_file(log, flags)
+    warning_lines_and_links, header_str = parse_log_file(logfile, flags)
   else:
     warning_lines_and_links, header_str = parse_input_file(
         logfile_object, flags)
-  warning_messages, warning_links, warning_records = parallel_classify_warnings(
-      warning_lines_and_links, flags, project_names, project_patterns,
-      warn_patterns, use_google3, create_launch_subprocs_fn,
-      classify_warnings_fn)
+  warning_db = None
+  if flags.warning_db:
+    warning_db = warn_db.WarningDatabase(flags.warning_db, warn_patterns,
+                                         project_patterns)
+  try:
+    warning_messages, warning_links, warning_records = (
+        parallel_classify_warnings(
+            warning_lines_and_links, flags, project_names, project_patterns,
+            warn_patterns, use_google3, create_launch_subprocs_fn,
+            classify_warnings_fn, warning_db))
+    if warning_db and flags.baseline_build:
+      added, removed = compare_to_baseline(
+          warning_db, flags.baseline_build, warning_messages, warning_records,
+          project_patterns, warn_patterns)
+      html_writer.write_diff_csv(flags.diffpath, added, removed,
+                                 warn_patterns, project_names)
+    if warning_db and flags.build_name:
+      warning_db.record_build(flags.build_name,
+                              dict(zip(warning_messages, warning_links)))
+  finally:
+    if warning_db:
+      warning_db.close()
 
   html_writer.write_html(flags, project_names, warn_patterns, html_path,
                          warning_messages, warning_links, warning_records,
@@ -649,7 +1309,7 @@ def common_main(use_google3, create_launch_subprocs_fn, classify_warnings_fn,
   project_list = get_project_list(flags.platform)
 
   project_names = get_project_names(project_list)
-  project_patterns = [re.compile(p[1]) for p in project_list]
+  project_patterns = get_project_patterns(flags.platform)
 
   # html_path=None because we output html below if not outputting CSV
   warning_messages, warning_links, warning_records, header_str = process_log(
@@ -0,0 +1,100 @@
+# python3
+# Copyright (C) 2026 The Android Open Source Project
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests of the Android build log parser of warn_common.
+
+Run from the tools directory with: python3 -m unittest warn.warn_common_test
+"""
+
+import argparse
+import io
+import random
+import unittest
+
+from . import warn_common
+
+FLAGS = argparse.Namespace(platform='android', url='', separator='?l=')
+
+# Lines of the made up logs.
+LOG_LINES = [
+    'warning: unused import',
+    'warning: unused variable `x`',
+    '   --> external/foo/src/lib.rs:10:5',
+    '   --> external/bar/src/main.rs:1:2',
+    'external/foo/a.c:1:2: warning: bad thing [-Wfoo]',
+    'frameworks/base/core/A.java:3: warning: deprecated',
+    '12 warningsexternal/foo/b.c:3:4: warning: unused [-Wbar]',
+    'prefix /b/f/w/external/foo/c.c:1:1: warning: rbe [-Wrbe]',
+    'FAILED: out/foo.o',
+    'noise',
+    '',
+]
+
+
+def parse_log(lines):
+  """Parse a log line by line, as a single chunk."""
+  return warn_common.parse_input_file_android(
+      io.StringIO(''.join(line + '\n' for line in lines)), FLAGS)
+
+
+def parse_log_in_chunks(lines, rng):
+  """Parse a log in chunks of a few lines, after the header chunk."""
+  parser = warn_common.AndroidLogParser(FLAGS, '', None)
+  lines = [line + '\n' for line in lines]
+  chunks = []
+  start = 0
+  while start < len(lines) or not chunks:
+    if start == 0:
+      end = parser.header_lines
+    else:
+      end = start + rng.randint(1, 5)
+    chunks.append(parser.parse_lines(lines[start:end], header=start == 0))
+    start = end
+  unique_warnings, build_vars = parser.merge_chunks(chunks)
+  return unique_warnings, warn_common.android_header_str(build_vars)
+
+
+class AndroidLogParserTest(unittest.TestCase):
+
+  def test_rustc_warning(self):
+    warnings, _ = parse_log(['warning: unused import',
+                             '   --> external/foo/src/lib.rs:10:5'])
+    self.assertEqual(list(warnings),
+                     ['external/foo/src/lib.rs:10:5: warning: unused import'])
+
+  def test_rustc_warning_without_file_position(self):
+    warnings, _ = parse_log(['warning: unused import', 'noise'])
+    self.assertEqual(list(warnings),
+                     ['unknown_source_file: warning: unused import'])
+    warnings, _ = parse_log(['warning: unused import',
+                             'warning: unused import', 'noise'])
+    self.assertEqual(list(warnings),
+                     ['unknown_source_file: warning: unused import'])
+
+  def test_rustc_warning_at_end_of_log(self):
+    warnings, _ = parse_log(['noise', 'warning: unused import'])
+    self.assertEqual(warnings, {})
+
+  def test_chunks_same_as_line_by_line(self):
+    rng = random.Random(0)
+    for _ in range(300):
+      lines = ['noise'] * warn_common.AndroidLogParser.header_lines
+      lines += [rng.choice(LOG_LINES) for _ in range(rng.randint(0, 40))]
+      expected = parse_log(lines)
+      self.assertEqual(parse_log_in_chunks(lines, rng), expected, lines)
+
+
+if __name__ == '__main__':
+  unittest.main(verbosity=2)
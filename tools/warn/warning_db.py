@@ -0,0 +1,169 @@
+# python3
+# Copyright (C) 2026 The Android Open Source Project
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Persistent database of classified warning lines across builds.
+
+Most warnings of a build were already in the previous builds. The database
+keeps the classification of every normalized warning line seen so far, keyed
+by the hash of the line, so that only the new lines of a log are classified.
+
+It can also keep the warning lines of named builds, to report the warnings
+added and removed since a baseline build.
+"""
+
+import hashlib
+import json
+import sqlite3
+
+
+# Version of the database tables.
+SCHEMA_VERSION = 1
+
+
+def warning_hash(line):
+  """Return the key of a normalized warning line."""
+  return hashlib.sha1(line.encode('utf-8')).digest()
+
+
+def patterns_fingerprint(warn_patterns, project_patterns):
+  """Return a hash of the patterns that the classifications depend on."""
+  patterns = [[pattern['patterns'] for pattern in warn_patterns],
+              [pattern.pattern for pattern in project_patterns]]
+  return hashlib.sha1(json.dumps(patterns).encode('utf-8')).hexdigest()
+
+
+class WarningDatabase:
+  """sqlite database of warning lines, their classification and builds.
+
+  The classifications are indices to warn_patterns and project_patterns.
+  They are dropped when the patterns change.
+  """
+
+  # Number of variables in a query, below the default sqlite limit.
+  _BATCH_SIZE = 500
+
+  def __init__(self, path, warn_patterns, project_patterns):
+    self.path = path
+    self._conn = sqlite3.connect(path)
+    self._conn.executescript("""
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS warnings (
+            hash BLOB PRIMARY KEY,
+            line TEXT NOT NULL,
+            pattern_idx INTEGER,
+            project_idx INTEGER);
+        CREATE TABLE IF NOT EXISTS builds (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE);
+        CREATE TABLE IF NOT EXISTS build_warnings (
+            build_id INTEGER NOT NULL,
+            hash BLOB NOT NULL,
+            link TEXT NOT NULL,
+            PRIMARY KEY (build_id, hash));
+    """)
+    meta = dict(self._conn.execute('SELECT key, value FROM meta'))
+    fingerprint = patterns_fingerprint(warn_patterns, project_patterns)
+    with self._conn:
+      if meta.get('schema_version') != str(SCHEMA_VERSION):
+        self._conn.execute('DELETE FROM build_warnings')
+        self._conn.execute('DELETE FROM builds')
+        self._conn.execute('DELETE FROM warnings')
+      elif meta.get('patterns') != fingerprint:
+        # The lines of the builds are kept, but must be classified again.
+        self._conn.execute('UPDATE warnings SET pattern_idx = NULL, '
+                           'project_idx = NULL')
+      self._conn.executemany(
+          'INSERT OR REPLACE INTO meta VALUES (?, ?)',
+          [('schema_version', str(SCHEMA_VERSION)),
+           ('patterns', fingerprint)])
+
+  def close(self):
+    self._conn.close()
+
+  def _select_many(self, query, keys):
+    """Run query for batches of keys, its '%s' is replaced by placeholders."""
+    keys = list(keys)
+    for start in range(0, len(keys), self._BATCH_SIZE):
+      batch = keys[start:start + self._BATCH_SIZE]
+      yield from self._conn.execute(
+          query % ','.join('?' * len(batch)), batch)
+
+  def lookup(self, lines):
+    """Return the known classifications of lines.
+
+    Returns:
+      A dict of the lines found in the database to their (pattern_idx,
+      project_idx), -1 if they don't match any pattern.
+    """
+    lines_by_hash = {warning_hash(line): line for line in lines}
+    classified = {}
+    for key, pattern_idx, project_idx in self._select_many(
+        'SELECT hash, pattern_idx, project_idx FROM warnings '
+        'WHERE hash IN (%s) AND pattern_idx IS NOT NULL', lines_by_hash):
+      classified[lines_by_hash[key]] = (pattern_idx, project_idx)
+    return classified
+
+  def add(self, classified):
+    """Add the classifications of new lines.
+
+    Args:
+      classified: a dict of lines to their (pattern_idx, project_idx).
+    """
+    with self._conn:
+      self._conn.executemany(
+          'INSERT OR REPLACE INTO warnings VALUES (?, ?, ?, ?)',
+          ((warning_hash(line), line, pattern_idx, project_idx)
+           for line, (pattern_idx, project_idx) in classified.items()))
+
+  def record_build(self, name, warning_data):
+    """Save the warnings of a build, replacing a build of the same name.
+
+    Args:
+      name: the name of the build.
+      warning_data: a dict of the warning lines of the build to their links.
+          The lines must have been added before.
+    """
+    with self._conn:
+      self._conn.execute(
+          'DELETE FROM build_warnings WHERE build_id IN '
+          '(SELECT id FROM builds WHERE name = ?)', (name,))
+      self._conn.execute('INSERT OR IGNORE INTO builds (name) VALUES (?)',
+                         (name,))
+      (build_id,) = self._conn.execute(
+          'SELECT id FROM builds WHERE name = ?', (name,)).fetchone()
+      self._conn.executemany(
+          'INSERT OR REPLACE INTO build_warnings VALUES (?, ?, ?)',
+          ((build_id, warning_hash(line), link)
+           for line, link in warning_data.items()))
+
+  def has_build(self, name):
+    return self._conn.execute('SELECT 1 FROM builds WHERE name = ?',
+                              (name,)).fetchone() is not None
+
+  def build_warnings(self, name):
+    """Return the warnings of a recorded build.
+
+    Returns:
+      A dict of the warning lines to their (link, pattern_idx, project_idx).
+      The pattern_idx is None if the line was not classified with the
+      current patterns.
+    """
+    return {line: (link, pattern_idx, project_idx)
+            for line, link, pattern_idx, project_idx in self._conn.execute(
+                'SELECT line, link, pattern_idx, project_idx '
+                'FROM build_warnings JOIN builds ON builds.id = build_id '
+                'JOIN warnings USING (hash) WHERE builds.name = ?', (name,))}